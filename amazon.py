@@ -7,30 +7,98 @@ log every attempt, and render per-book dashboards plus a top-level index.
 from __future__ import annotations
 
 import argparse
+import gzip
+import hashlib
+import heapq
+import html
 import json
 import logging
+import multiprocessing
 import os
 import re
+import statistics
 import sys
 import tempfile
+import threading
 import time
-from datetime import datetime
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import groupby
 from logging.handlers import RotatingFileHandler
+from operator import itemgetter
 from pathlib import Path
+from typing import NamedTuple
+from urllib.parse import urlsplit
 
 import requests
 from bs4 import BeautifulSoup
+from bs4.filter import ElementFilter
+from requests.adapters import HTTPAdapter
+
+from history_sqlite import SqliteHistory
+
+try:
+    import lxml  # noqa: F401  (optional: faster C parser for BeautifulSoup)
+    HAVE_LXML = True
+except ImportError:
+    HAVE_LXML = False
+
+try:
+    import brotli  # optional: .br siblings for chunked dashboard data
+    HAVE_BROTLI = True
+except ImportError:
+    HAVE_BROTLI = False
+
+try:
+    import zstandard  # optional: --cold-compression zstd
+    HAVE_ZSTD = True
+except ImportError:
+    HAVE_ZSTD = False
 
 ROOT = Path(__file__).resolve().parent
 BOOKS_FILE = ROOT / "books.json"
 DATA_DIR = ROOT / "data"
 LOG_FILE = DATA_DIR / "scrape_log.jsonl"
 TEMPLATE_FILE = ROOT / "dashboard_template.html"
+HTTP_CACHE_DIR = DATA_DIR / "http_cache"
+SQLITE_FILE = "history.sqlite3"
+ARCHIVE_DIR = DATA_DIR / "archive"
+METRICS_FILE = DATA_DIR / "metrics.prom"
 
 SLUG_RE = re.compile(r"^[a-z0-9-]+$")
 INTER_BOOK_DELAY = 2.0       # seconds between books to avoid bot-detection bursts
 FETCH_ATTEMPTS = 2
 FETCH_BACKOFF = 2.0          # base for exponential backoff: 2s, 4s
+HOST_RATE = 0.5              # requests/second per host in concurrent mode
+HOST_BURST = 1               # token-bucket capacity per host
+IN_FLIGHT_REPORT_INTERVAL = 5.0
+BREAKER_THRESHOLD = 3        # consecutive blocked responses that open a host's circuit
+BREAKER_COOLDOWN = 15 * 60   # seconds requests to a tripped host are skipped
+HTTP_POOL_SIZE = 1           # keep-alive connections per host; main() raises it to --workers
+HTTP_CACHE_TTL = 7 * 24 * 3600   # seconds a cached validator may be revalidated
+HTTP_CACHE_MAX_ENTRIES = 500
+EXTRACT_CACHE_VERSION = 1    # bump when extractors change, to invalidate cached parses
+PARSER_BACKEND = "html.parser"   # see PARSER_BACKENDS; set by --parser
+STORAGE_BACKEND = "files"    # "files" (JSON state + JSONL log) or "sqlite"; set by --storage
+LOG_ENCODING = "plain"       # "plain" entries or "delta" keyframes + deltas; set by --log-encoding
+KEYFRAME_INTERVAL = 64       # max lines in a delta segment (bounds a tail read's decode work)
+HOT_DAYS = 30                # --seal moves older entries into cold segments; --hot-days
+DOWNSAMPLE_RULES = ((90, 3600),)   # (age days, seconds): cold entries kept per bucket; --downsample
+COLD_COMPRESSION = "gzip"    # or "zstd" (needs zstandard); --cold-compression
+RENDER_MODE = "inline"       # "inline" payload, or "chunked" per-month data files; --render-mode
+CHUNK_INITIAL_MONTHS = 3     # range a chunked dashboard loads first
+BUNDLE_ASSETS = False        # move the template's CSS/JS into shared hashed files; --bundle-assets
+EXTRACT_MODE = "fast"        # "fast": byte scan first, DOM only on failed validation; "dom"
+REEXTRACT_WINDOW = 8         # archived scrapes queued per parse worker during --reextract
+DEFAULT_INTERVAL_MINUTES = 360   # --daemon scrape interval for books without interval_minutes
+DAEMON_POLL_SECONDS = 5.0    # while idle, how often --daemon checks books.json for changes
+ADAPTIVE_MIN_MINUTES = 30    # --adaptive interval bounds; per book: min/max_interval_minutes
+ADAPTIVE_MAX_MINUTES = 24 * 60
+ADAPTIVE_SPEEDUP = 0.5       # interval multiplier after a scrape that appended an entry
+ADAPTIVE_BACKOFF = 1.5       # ... and after one that found nothing new
+ADAPTIVE_SEED_ENTRIES = 20   # recent entries whose spacing seeds the starting interval
 
 HEADERS = {
     "User-Agent": (
@@ -84,8 +152,13 @@ def get_logger() -> logging.Logger:
 def load_books() -> list[dict]:
     if not BOOKS_FILE.exists():
         raise SystemExit(f"error: {BOOKS_FILE} not found")
-    config = json.loads(BOOKS_FILE.read_text())
-    books = config.get("books", [])
+    try:
+        config = json.loads(BOOKS_FILE.read_text())
+    except (OSError, ValueError) as e:  # unreadable, half-saved or not UTF-8
+        raise SystemExit(f"error: cannot read {BOOKS_FILE}: {e}")
+    books = config.get("books", []) if isinstance(config, dict) else None
+    if not isinstance(books, list):
+        raise SystemExit(f"error: {BOOKS_FILE} must hold an object with a \"books\" list")
     if not books:
         raise SystemExit(f"error: {BOOKS_FILE} has no books")
     seen_slugs = set()
@@ -100,50 +173,722 @@ def load_books() -> list[dict]:
             raise SystemExit(f"error: book {slug!r} missing amazon_url")
         if not b.get("display_name"):
             raise SystemExit(f"error: book {slug!r} missing display_name")
+        for key in ("interval_minutes", "min_interval_minutes", "max_interval_minutes"):
+            value = b.get(key, 1)
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+                raise SystemExit(f"error: book {slug!r} {key} must be a positive number")
+        if b.get("min_interval_minutes", 0) > b.get("max_interval_minutes", float("inf")):
+            raise SystemExit(f"error: book {slug!r} min_interval_minutes > max_interval_minutes")
     return books
 
 
 # ---------- HTTP ----------
 
-def fetch_with_retry(url: str):
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until a token is available."""
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class InFlightTracker:
+    """Registry of requests currently on the wire, for --show-inflight."""
+
+    def __init__(self) -> None:
+        self._requests: dict[int, tuple[str, float]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def start(self, url: str) -> int:
+        with self._lock:
+            self._next_id += 1
+            self._requests[self._next_id] = (url, time.monotonic())
+            return self._next_id
+
+    def finish(self, token: int) -> None:
+        with self._lock:
+            self._requests.pop(token, None)
+
+    def snapshot(self) -> list[tuple[str, float]]:
+        """(url, seconds in flight), oldest first."""
+        now = time.monotonic()
+        with self._lock:
+            items = sorted(self._requests.values(), key=lambda item: item[1])
+        return [(url, now - started) for url, started in items]
+
+
+IN_FLIGHT = InFlightTracker()
+_host_buckets: dict[str, TokenBucket] = {}
+_host_buckets_lock = threading.Lock()
+
+
+def host_bucket(url: str) -> TokenBucket:
+    # One bucket per hostname, so amazon.com and goodreads.com each keep their
+    # own polite rate while requests to the two hosts overlap.
+    host = urlsplit(url).hostname or ""
+    with _host_buckets_lock:
+        bucket = _host_buckets.get(host)
+        if bucket is None:
+            bucket = _host_buckets[host] = TokenBucket(HOST_RATE, HOST_BURST)
+        return bucket
+
+
+# Robot-check / CAPTCHA interstitials are small pages; their markers sit near the top.
+# Amazon serves them with 200 or 503; a 503 without markers is an ordinary
+# server error and goes through the retry loop.
+BLOCK_STATUSES = frozenset({429})
+BLOCK_MARKERS = (b"validateCaptcha", b"Robot Check", b"Type the characters you see in this image")
+BLOCK_SCAN_BYTES = 32 * 1024
+
+
+def is_blocked(response) -> bool:
+    """Cheap pre-parse check for throttling and bot-detection responses."""
+    if response.status_code in BLOCK_STATUSES:
+        return True
+    head = response.content[:BLOCK_SCAN_BYTES]
+    return any(marker in head for marker in BLOCK_MARKERS)
+
+
+class CircuitBreaker:
+    """Per-host breaker: `threshold` consecutive blocked responses open it for
+    `cooldown` seconds, during which allow() is False. After the cool-down a
+    single further block re-opens it; any good response closes it."""
+
+    def __init__(self, host: str, threshold: int, cooldown: float) -> None:
+        self.host = host
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._blocks = 0
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            return time.monotonic() >= self._open_until
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._blocks = 0
+
+    def record_block(self) -> bool:
+        """Count a blocked response; True if it tripped the breaker."""
+        with self._lock:
+            self._blocks += 1
+            if self._blocks < self.threshold or time.monotonic() < self._open_until:
+                return False
+            self._open_until = time.monotonic() + self.cooldown
+            self._blocks = self.threshold - 1
+        HTTP_STATS.add(breaker_trips=1)
+        logging.getLogger("scrape").warning("breaker", extra={"extra_fields": {
+            "host": self.host, "threshold": self.threshold, "cooldown_s": self.cooldown,
+        }})
+        print(f"[{self.host}] blocked {self.threshold}x: skipping requests for "
+              f"{self.cooldown:g}s", file=sys.stderr)
+        return True
+
+
+_host_breakers: dict[str, CircuitBreaker] = {}
+_host_breakers_lock = threading.Lock()
+
+
+def host_breaker(url: str) -> CircuitBreaker:
+    host = urlsplit(url).hostname or ""
+    with _host_breakers_lock:
+        breaker = _host_breakers.get(host)
+        if breaker is None:
+            breaker = _host_breakers[host] = CircuitBreaker(
+                host, BREAKER_THRESHOLD, BREAKER_COOLDOWN)
+        return breaker
+
+
+class Counters:
+    """Thread-safe run-level counters, reported to the scrape log by log_run_stats()."""
+
+    def __init__(self) -> None:
+        self._counts: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, **counts: int) -> None:
+        with self._lock:
+            for key, n in counts.items():
+                self._counts[key] = self._counts.get(key, 0) + n
+
+    def snapshot(self, reset: bool = False) -> dict[str, int]:
+        with self._lock:
+            counts = dict(self._counts)
+            if reset:
+                self._counts.clear()
+            return counts
+
+
+class PhaseTimer:
+    """Wall-clock seconds per phase and response bytes per page for one scrape.
+
+    Shared by a book's Amazon and Goodreads fetch threads; the totals end up
+    in that book's scrape_log.jsonl record and in RUN_METRICS.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.seconds: dict[str, float] = {}
+        self.bytes: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.seconds[name] = self.seconds.get(name, 0.0) + elapsed
+
+    def add_bytes(self, kind: str, n: int) -> None:
+        with self._lock:
+            self.bytes[kind] = self.bytes.get(kind, 0) + n
+
+    def fields(self) -> dict:
+        with self._lock:
+            timings = {k: round(v * 1000, 1) for k, v in self.seconds.items()}
+            return {"total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+                    "timings_ms": timings, "bytes": dict(self.bytes)}
+
+
+class RunMetrics:
+    """Thread-safe run-level histograms, counters and gauges, exported in the
+    Prometheus text format by write_prometheus() (node_exporter's textfile
+    collector picks the file up). Values are cumulative for the process, so a
+    --daemon keeps adding to them across cycles."""
+
+    SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    BYTES_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6)
+    METRICS = {
+        # name: (type, help, histogram buckets)
+        "amazon_scrape_phase_seconds": (
+            "histogram", "Time spent per book in each scrape phase.", SECONDS_BUCKETS),
+        "amazon_scrape_response_bytes": (
+            "histogram", "Response body size per fetched page.", BYTES_BUCKETS),
+        "amazon_scrape_books_total": ("counter", "Scrape attempts by outcome.", None),
+        "amazon_scrape_http_events_total": ("counter", "HTTP run counters.", None),
+        "amazon_scrape_http_bytes_total": (
+            "counter", "Response bytes downloaded, or saved by cache revalidation.", None),
+        "amazon_scrape_run_seconds": ("gauge", "Wall clock of the last run or daemon cycle.", None),
+        "amazon_scrape_last_run_timestamp_seconds": ("gauge", "Unix time the last run finished.", None),
+    }
+
+    def __init__(self) -> None:
+        self._values: dict[str, dict[tuple, object]] = {name: {} for name in self.METRICS}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(labels: dict) -> tuple:
+        return tuple(sorted(labels.items()))
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        buckets = self.METRICS[name][2]
+        with self._lock:
+            series = self._values[name].setdefault(
+                self._key(labels), {"buckets": [0] * len(buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def inc(self, name: str, n: float = 1, **labels: str) -> None:
+        with self._lock:
+            values = self._values[name]
+            key = self._key(labels)
+            values[key] = values.get(key, 0) + n
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[name][self._key(labels)] = value
+
+    def observe_scrape(self, timer: PhaseTimer, status: str) -> None:
+        for phase, seconds in timer.seconds.items():
+            self.observe("amazon_scrape_phase_seconds", seconds, phase=phase)
+        self.observe("amazon_scrape_phase_seconds", time.perf_counter() - timer.started,
+                     phase="total")
+        for kind, n in timer.bytes.items():
+            self.observe("amazon_scrape_response_bytes", n, kind=kind)
+        self.inc("amazon_scrape_books_total", status=status)
+
+    @staticmethod
+    def _number(value: float) -> str:
+        # Exact: %g would round a Unix timestamp or a byte total to 6 digits.
+        if isinstance(value, int) or (isinstance(value, float) and value.is_integer()
+                                      and abs(value) < 2 ** 53):
+            return str(int(value))
+        return repr(float(value))
+
+    def render(self) -> str:
+        def fmt(labels: tuple, **extra) -> str:
+            pairs = [*labels, *extra.items()]
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, buckets) in self.METRICS.items():
+                if not self._values[name]:
+                    continue
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                for labels, value in sorted(self._values[name].items()):
+                    if kind != "histogram":
+                        lines.append(f"{name}{fmt(labels)} {self._number(value)}")
+                        continue
+                    for bound, n in zip(buckets, value["buckets"]):
+                        lines.append(f"{name}_bucket{fmt(labels, le=f'{bound:g}')} {n}")
+                    lines.append(f"{name}_bucket{fmt(labels, le='+Inf')} {value['count']}")
+                    lines.append(f"{name}_sum{fmt(labels)} {value['sum']:.6f}")
+                    lines.append(f"{name}_count{fmt(labels)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: Path) -> None:
+        # The textfile collector reads *.prom; the atomic rename keeps it from
+        # ever seeing a half-written file.
+        with open_atomic(path) as f:
+            f.write(self.render().encode("utf-8"))
+
+
+class HttpCache:
+    """Small on-disk response cache keyed by URL.
+
+    Only responses carrying an ETag or Last-Modified validator are stored; they
+    are revalidated with a conditional GET, so an unchanged page costs a 304.
+    Entries older than `ttl` are ignored, and the oldest entries are evicted
+    once more than `max_entries` are stored.
+    """
+
+    def __init__(self, directory: Path, ttl: float, max_entries: int) -> None:
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def _paths(self, url: str) -> tuple[Path, Path]:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.directory / f"{key}.json", self.directory / f"{key}.body"
+
+    def lookup(self, url: str) -> dict | None:
+        meta_path, body_path = self._paths(url)
+        try:
+            meta = json.loads(meta_path.read_text())
+        except (OSError, json.JSONDecodeError):
+            return None
+        if time.time() - meta.get("stored_at", 0) > self.ttl or not body_path.exists():
+            return None
+        return meta
+
+    def conditional_headers(self, meta: dict | None) -> dict:
+        headers = {}
+        if meta and meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta and meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def store(self, url: str, response: requests.Response) -> None:
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not (etag or last_modified):
+            return
+        meta_path, body_path = self._paths(url)
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp = body_path.with_name(f".{body_path.name}.tmp")
+            tmp.write_bytes(response.content)
+            os.replace(tmp, body_path)
+            write_atomic(meta_path, {
+                "url": url, "etag": etag, "last_modified": last_modified,
+                "stored_at": time.time(), "size": len(response.content),
+                "encoding": response.encoding,
+            })
+            self._evict()
+
+    def revalidated(self, url: str, meta: dict) -> requests.Response:
+        """Rebuild a 200 response from the cache after a 304, refreshing its TTL."""
+        meta_path, body_path = self._paths(url)
+        with self._lock:
+            meta = dict(meta, stored_at=time.time())
+            write_atomic(meta_path, meta)
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.encoding = meta.get("encoding")
+        response._content = body_path.read_bytes()
+        response.from_cache = True
+        return response
+
+    def extracted(self, url: str) -> dict | None:
+        meta = self.lookup(url)
+        if meta and meta.get("extract_version") == EXTRACT_CACHE_VERSION:
+            return meta.get("extracted")
+        return None
+
+    def store_extracted(self, url: str, data: dict) -> None:
+        meta_path, _ = self._paths(url)
+        with self._lock:
+            meta = self.lookup(url)
+            if meta is None:
+                return
+            meta.update(extracted=data, extract_version=EXTRACT_CACHE_VERSION)
+            write_atomic(meta_path, meta)
+
+    def _evict(self) -> None:
+        metas = sorted(self.directory.glob("*.json"), key=lambda p: p.stat().st_mtime)
+        for meta_path in metas[:max(0, len(metas) - self.max_entries)]:
+            meta_path.unlink(missing_ok=True)
+            meta_path.with_suffix(".body").unlink(missing_ok=True)
+
+
+class PageArchive:
+    """Content-addressed archive of raw fetched pages, for offline re-extraction.
+
+    objects/<sha[:2]>/<sha256>.gz holds each distinct page body once, gzipped;
+    index.jsonl records every archived fetch as {slug, timestamp, kind, url,
+    sha256} in fetch order. Enabled with --archive; replayed by --reextract.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self.index_path = directory / "index.jsonl"
+        self._lock = threading.Lock()
+
+    def object_path(self, sha256: str) -> Path:
+        return self.directory / "objects" / sha256[:2] / f"{sha256}.gz"
+
+    def put(self, slug: str, timestamp: str, kind: str, url: str, content: bytes) -> str:
+        sha256 = hashlib.sha256(content).hexdigest()
+        path = self.object_path(sha256)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open_atomic(path) as f:
+                f.write(gzip.compress(content, 6))
+        record = json.dumps({"slug": slug, "timestamp": timestamp, "kind": kind,
+                             "url": url, "sha256": sha256}, ensure_ascii=False)
+        with self._lock, self.index_path.open("a", encoding="utf-8") as f:
+            f.write(record + "\n")
+        return sha256
+
+    def read(self, sha256: str) -> bytes:
+        return gzip.decompress(self.object_path(sha256).read_bytes())
+
+    def iter_index(self):
+        try:
+            f = self.index_path.open(encoding="utf-8")
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn final line from an interrupted run
+
+
+HTTP_STATS = Counters()
+EXTRACT_STATS = Counters()
+RUN_METRICS = RunMetrics()
+HTTP_CACHE: HttpCache | None = HttpCache(HTTP_CACHE_DIR, HTTP_CACHE_TTL, HTTP_CACHE_MAX_ENTRIES)
+ARCHIVE: PageArchive | None = None   # set by --archive
+_sessions: dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def host_session(url: str) -> requests.Session:
+    # One pooled keep-alive session per host, reused across every book in the run.
+    host = urlsplit(url).hostname or ""
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[host] = session
+        return session
+
+
+def connection_stats() -> dict[str, int]:
+    """New connections opened vs requests sent, summed over every host pool."""
+    connections = sent = 0
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+    for session in sessions:
+        for adapter in session.adapters.values():
+            for key in list(adapter.poolmanager.pools.keys()):
+                pool = adapter.poolmanager.pools.get(key)
+                if pool is not None:
+                    connections += pool.num_connections
+                    sent += pool.num_requests
+    return {"connections": connections, "requests_sent": sent,
+            "handshakes_saved": max(0, sent - connections)}
+
+
+def log_run_stats(log: logging.Logger, reset: bool = False) -> None:
+    # reset: report per-cycle counts (daemon mode) rather than process totals.
+    http_stats = HTTP_STATS.snapshot(reset)
+    for event, n in http_stats.items():
+        if event.startswith("bytes_"):
+            RUN_METRICS.inc("amazon_scrape_http_bytes_total", n, kind=event[len("bytes_"):])
+        else:
+            RUN_METRICS.inc("amazon_scrape_http_events_total", n, event=event)
+    log.info("http", extra={"extra_fields": {**http_stats, **connection_stats()}})
+    log.info("extract", extra={"extra_fields": EXTRACT_STATS.snapshot(reset)})
+
+
+def write_run_metrics(path: Path | None, run_seconds: float) -> None:
+    if path is None:
+        return
+    RUN_METRICS.set("amazon_scrape_run_seconds", run_seconds)
+    RUN_METRICS.set("amazon_scrape_last_run_timestamp_seconds", time.time())
+    RUN_METRICS.write_prometheus(path)
+
+
+def fetch_with_retry(url: str, timer: PhaseTimer | None = None, kind: str = "page"):
+    """GET `url` with retries. Time spent waiting for the host's token bucket,
+    on the wire and in backoff sleeps is added to `timer` as <kind>_wait,
+    <kind>_fetch and <kind>_retry_sleep."""
+    timer = timer or PhaseTimer()
+    cached = HTTP_CACHE.lookup(url) if HTTP_CACHE is not None else None
+    conditional = HTTP_CACHE.conditional_headers(cached) if cached else {}
+    session = host_session(url)
+    breaker = host_breaker(url)
     for i in range(FETCH_ATTEMPTS):
+        if not breaker.allow():
+            HTTP_STATS.add(breaker_skipped=1)
+            return None
+        with timer.phase(f"{kind}_wait"):
+            host_bucket(url).acquire()
+        token = IN_FLIGHT.start(url)
         try:
-            r = requests.get(url, headers=HEADERS, timeout=30)
+            with timer.phase(f"{kind}_fetch"):
+                r = session.get(url, headers=conditional, timeout=30)
+            if r.status_code == 304 and cached is not None:
+                HTTP_STATS.add(not_modified=1, bytes_saved=cached.get("size", 0))
+                breaker.record_success()
+                return HTTP_CACHE.revalidated(url, cached)
+            timer.add_bytes(kind, len(r.content))
             if r.status_code == 404:
                 return None  # permanent
+            if is_blocked(r):
+                # Retrying into a robot check only earns another one; let the
+                # breaker decide when this host is worth asking again.
+                HTTP_STATS.add(blocked=1)
+                breaker.record_block()
+                return None
             r.raise_for_status()
+            breaker.record_success()
+            HTTP_STATS.add(downloaded=1, bytes_downloaded=len(r.content))
+            if HTTP_CACHE is not None:
+                HTTP_CACHE.store(url, r)
             return r
         except requests.RequestException:
             if i == FETCH_ATTEMPTS - 1:
                 return None
+        finally:
+            IN_FLIGHT.finish(token)
+        with timer.phase(f"{kind}_retry_sleep"):
             time.sleep(FETCH_BACKOFF * (2 ** i))
     return None
 
 
+def report_in_flight(stop: threading.Event, interval: float = IN_FLIGHT_REPORT_INTERVAL) -> None:
+    while not stop.wait(interval):
+        snapshot = IN_FLIGHT.snapshot()
+        print(f"in-flight: {len(snapshot)}", file=sys.stderr)
+        for url, age in snapshot:
+            print(f"  {age:5.1f}s  {url}", file=sys.stderr)
+
+
+# ---------- HTML parsing ----------
+
+class _ExtractionRegions(ElementFilter):
+    """Parse filter that only builds the subtrees the extractors read.
+
+    Everything outside the detail-bullets block (Best Sellers Rank), the two
+    review-count elements and the Goodreads count spans is discarded while
+    parsing, so most of a multi-hundred-KB product page never becomes a Tag.
+    """
+
+    IDS = frozenset({
+        "detailBulletsWrapper_feature_div", "detailBullets_feature_div",
+        "productDetails_detailBullets_sections1", "productDetails_db_sections",
+        "prodDetails", "SalesRank", "acrCustomerReviewText",
+    })
+    DATA_HOOKS = frozenset({"total-review-count"})
+    DATA_TESTIDS = frozenset({"ratingsCount", "reviewsCount"})
+
+    def allow_tag_creation(self, nsprefix, name, attrs) -> bool:
+        attrs = attrs or {}
+        return (attrs.get("id") in self.IDS
+                or attrs.get("data-hook") in self.DATA_HOOKS
+                or attrs.get("data-testid") in self.DATA_TESTIDS)
+
+    def allow_string_creation(self, string: str) -> bool:
+        return False
+
+
+def _fast_features() -> str:
+    return "lxml" if HAVE_LXML else "html.parser"
+
+
+# name -> (available, soup factory). Every factory returns a BeautifulSoup, so
+# the get_* extractors below work unchanged against any backend.
+PARSER_BACKENDS = {
+    "html.parser": (True, lambda markup: BeautifulSoup(markup, "html.parser")),
+    "lxml": (HAVE_LXML, lambda markup: BeautifulSoup(markup, "lxml")),
+    "partial": (True, lambda markup: BeautifulSoup(
+        markup, _fast_features(), parse_only=_ExtractionRegions())),
+}
+
+
+def available_parsers() -> list[str]:
+    return [name for name, (available, _) in PARSER_BACKENDS.items() if available]
+
+
+def make_soup(markup, backend: str | None = None) -> BeautifulSoup:
+    name = backend or PARSER_BACKEND
+    available, factory = PARSER_BACKENDS[name]
+    if not available:
+        raise RuntimeError(f"parser backend {name!r} is not installed")
+    return factory(markup)
+
+
 # ---------- Page scraping ----------
 
-def get_amazon_data(url: str) -> dict | None:
-    response = fetch_with_retry(url)
+def get_amazon_data(url: str, record: tuple[str, str] | None = None,
+                    timer: PhaseTimer | None = None) -> dict | None:
+    """`record`: (slug, timestamp) under which to archive the page, if archiving.
+    `timer` collects the amazon_* fetch and parse timings."""
+    timer = timer or PhaseTimer()
+    response = fetch_with_retry(url, timer, "amazon")
     if response is None:
         return None
-    soup = BeautifulSoup(response.content, "html.parser")
-    return {
+    if ARCHIVE is not None and record:
+        ARCHIVE.put(*record, "amazon", url, response.content)
+    with timer.phase("amazon_parse"):
+        return run_extractor(extract_amazon, response.content)
+
+
+def extract_amazon(content: bytes, mode: str | None = None) -> dict:
+    if (mode or EXTRACT_MODE) == "fast":
+        started = time.thread_time()
+        data = fast_extract_amazon(content)
+        cpu_us = int((time.thread_time() - started) * 1e6)
+        if data is not None:
+            EXTRACT_STATS.add(fast_wins=1, fast_cpu_us=cpu_us)
+            return data
+        EXTRACT_STATS.add(fast_fallbacks=1, fast_cpu_us=cpu_us)
+
+    started = time.thread_time()
+    soup = make_soup(content)
+    data = {
         "amazon_review_count": get_amazon_review_count(soup),
         "rankings": get_all_rankings(soup),
     }
+    EXTRACT_STATS.add(dom_pages=1, dom_cpu_us=int((time.thread_time() - started) * 1e6))
+    return data
 
 
-def get_goodreads_data(url: str) -> dict | None:
-    response = fetch_with_retry(url)
+def get_goodreads_data(url: str, record: tuple[str, str] | None = None,
+                       timer: PhaseTimer | None = None) -> dict | None:
+    timer = timer or PhaseTimer()
+    response = fetch_with_retry(url, timer, "goodreads")
     if response is None:
         return None
-    soup = BeautifulSoup(response.content, "html.parser")
+    if ARCHIVE is not None and record:
+        ARCHIVE.put(*record, "goodreads", url, response.content)
+    # A 304-revalidated page is byte-identical to the one parsed last time.
+    if getattr(response, "from_cache", False) and HTTP_CACHE is not None:
+        cached = HTTP_CACHE.extracted(url)
+        if cached is not None:
+            return cached
+    with timer.phase("goodreads_parse"):
+        data = run_extractor(extract_goodreads, response.content)
+    if HTTP_CACHE is not None:
+        HTTP_CACHE.store_extracted(url, data)
+    return data
+
+
+def extract_goodreads(content: bytes) -> dict:
+    soup = make_soup(content)
     return {
         "goodreads_ratings_count": get_goodreads_ratings_count(soup),
         "goodreads_reviews_count": get_goodreads_reviews_count(soup),
     }
 
 
+# ---------- Parse pool ----------
+
+# Extraction is CPU-bound and holds the GIL, so with concurrent fetching it
+# serializes on one core. With a pool, fetch threads hand the raw bytes to
+# worker processes and block (GIL released) until the small result dict
+# comes back; persistence stays in the parent.
+PARSE_POOL: ProcessPoolExecutor | None = None
+
+
+def _init_parse_worker(parser_backend: str, extract_mode: str) -> None:
+    global PARSER_BACKEND, EXTRACT_MODE, HTTP_CACHE
+    PARSER_BACKEND = parser_backend
+    EXTRACT_MODE = extract_mode
+    HTTP_CACHE = None
+
+
+def _extract_job(extractor, content: bytes) -> tuple[dict, dict[str, int]]:
+    data = extractor(content)
+    # Counters live per process: ship this job's to the parent.
+    return data, EXTRACT_STATS.snapshot(reset=True)
+
+
+def run_extractor(extractor, content: bytes) -> dict:
+    if PARSE_POOL is None:
+        return extractor(content)
+    data, stats = PARSE_POOL.submit(_extract_job, extractor, content).result()
+    EXTRACT_STATS.add(**stats)
+    return data
+
+
+@contextmanager
+def parse_pool(workers: int):
+    """Route extraction through `workers` processes while the block runs;
+    0 keeps it in-process."""
+    global PARSE_POOL
+    if workers < 1:
+        yield
+        return
+    # spawn, not fork: the parent already runs fetch and reporter threads.
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_parse_worker,
+                             initargs=(PARSER_BACKEND, EXTRACT_MODE)) as pool:
+        PARSE_POOL = pool
+        try:
+            yield
+        finally:
+            PARSE_POOL = None
+
+
 def get_amazon_review_count(soup):
     # Amazon exposes the canonical count in two dedicated elements. The
     # older approach (fuzzy regex against the whole `reviews-medley-widget`
@@ -209,25 +954,83 @@ def get_all_rankings(soup):
         if rank_container is None:
             return rankings
 
-        rank_text = rank_container.get_text()
-        rank_pattern = r'#([\d,]+)\s+in\s+([^#\n]+?)(?=\s*(?:#|\s*$))'
-
-        for rank_num, category in re.findall(rank_pattern, rank_text, re.MULTILINE | re.IGNORECASE):
-            cleaned_category = re.sub(r'\s*\([^)]*\)\s*$', '', category.strip()).strip()
-            if cleaned_category and rank_num and len(cleaned_category) < 100:
-                rankings.append({
-                    'rank': rank_num.replace(',', ''),
-                    'category': cleaned_category
-                })
-
-        # Dedupe by category while preserving order
-        seen = set()
-        return [r for r in rankings if not (r['category'] in seen or seen.add(r['category']))]
+        return parse_rank_text(rank_container.get_text())
     except Exception as e:
         print(f"Error extracting rankings: {e}", file=sys.stderr)
         return rankings
 
 
+RANK_RE = re.compile(r'#([\d,]+)\s+in\s+([^#\n]+?)(?=\s*(?:#|\s*$))', re.MULTILINE | re.IGNORECASE)
+
+
+def parse_rank_text(rank_text: str) -> list[dict]:
+    rankings = []
+    for rank_num, category in RANK_RE.findall(rank_text):
+        cleaned_category = re.sub(r'\s*\([^)]*\)\s*$', '', category.strip()).strip()
+        if cleaned_category and rank_num and len(cleaned_category) < 100:
+            rankings.append({
+                'rank': rank_num.replace(',', ''),
+                'category': cleaned_category
+            })
+
+    # Dedupe by category while preserving order
+    seen = set()
+    return [r for r in rankings if not (r['category'] in seen or seen.add(r['category']))]
+
+
+# ---------- Byte-level fast path ----------
+#
+# Scans the raw response for the three regions the extractors need, without
+# building a DOM. The text between the "Best Sellers Rank" label and the end
+# of its list/cell is tag-stripped and unescaped, which reproduces what
+# get_text() yields on the DOM container, then goes through parse_rank_text().
+# Any result that fails validation returns None and the caller parses the DOM.
+
+FAST_RANK_LABEL = b"Best Sellers Rank"
+FAST_RANK_END_RE = re.compile(rb"</ul>|</td>", re.IGNORECASE)
+FAST_RANK_WINDOW = 8192
+FAST_TAG_RE = re.compile(rb"<!--.*?-->|<[^>]*>", re.DOTALL)
+FAST_REVIEW_HOOK_RE = re.compile(rb'<[^>]*\bdata-hook="total-review-count"[^>]*>(.*?)</', re.DOTALL)
+FAST_ACR_RE = re.compile(rb'<[^>]*\bid="acrCustomerReviewText"[^>]*>(.*?)</', re.DOTALL)
+COUNT_RE = re.compile(r'(\d{1,3}(?:,\d{3})*)')
+
+
+def _fast_text(fragment: bytes) -> str:
+    return html.unescape(FAST_TAG_RE.sub(b"", fragment).decode("utf-8", "replace"))
+
+
+def _fast_review_count(content: bytes) -> tuple[bool, str | None]:
+    """(valid, count). Invalid when a review element is present but unparsable."""
+    for pattern, marker in ((FAST_REVIEW_HOOK_RE, b"total-review-count"),
+                            (FAST_ACR_RE, b"acrCustomerReviewText")):
+        m = pattern.search(content)
+        if m:
+            count = COUNT_RE.search(_fast_text(m.group(1)))
+            if count:
+                return True, count.group(1).replace(',', '')
+        elif marker in content:
+            return False, None
+    return True, None
+
+
+def fast_extract_amazon(content: bytes) -> dict | None:
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    start = content.find(FAST_RANK_LABEL)
+    if start < 0:
+        return None
+    window = content[start:start + FAST_RANK_WINDOW]
+    end = FAST_RANK_END_RE.search(window)
+    rankings = parse_rank_text(_fast_text(window[:end.start()] if end else window))
+    if not rankings or any(set(r["category"]) & set("<>{}=\"") for r in rankings):
+        return None
+
+    valid, count = _fast_review_count(content)
+    if not valid:
+        return None
+    return {"amazon_review_count": count, "rankings": rankings}
+
+
 # ---------- Signatures & persistence ----------
 
 def _norm_count(v):
@@ -252,71 +1055,792 @@ def entry_signature(entry: dict, has_goodreads: bool) -> tuple:
     return base
 
 
-def load_envelope(slug: str, display_name: str) -> dict:
-    path = DATA_DIR / f"{slug}.json"
+# History for a book lives in two files:
+#   data/<slug>.json   small state file: the envelope fields minus `entries`
+#   data/<slug>.jsonl  append-only entries log, one JSON object per line
+# A scrape appends at most one line and rewrites only the state file. A legacy
+# single-file envelope (with `entries`, as written by migrate_history.py) found
+# at data/<slug>.json is split into the two files the first time it is read.
+
+#
+# With --storage sqlite the same functions delegate to history_sqlite.SqliteHistory
+# (data/history.sqlite3); the signature sidecar is unnecessary there because
+# the last snapshot is an indexed lookup.
+
+STATE_FIELDS = ("last_successful_scrape", "last_error",
+                "last_attempt_timestamp", "last_attempt_status")
+_sqlite_histories: dict[Path, SqliteHistory] = {}
+_sqlite_histories_lock = threading.Lock()
+
+
+def sqlite_history() -> SqliteHistory | None:
+    """The SQLite backend when --storage sqlite is active, else None."""
+    if STORAGE_BACKEND != "sqlite":
+        return None
+    return _sqlite_at(DATA_DIR / SQLITE_FILE)
+
+
+def _sqlite_at(path: Path) -> SqliteHistory:
+    with _sqlite_histories_lock:
+        if path not in _sqlite_histories:
+            _sqlite_histories[path] = SqliteHistory(path)
+        return _sqlite_histories[path]
+
+
+def state_path(slug: str) -> Path:
+    return DATA_DIR / f"{slug}.json"
+
+
+def entries_path(slug: str) -> Path:
+    return DATA_DIR / f"{slug}.jsonl"
+
+
+def signature_path(slug: str) -> Path:
+    return DATA_DIR / f"{slug}.sig.json"
+
+
+def _dump_entry(entry: dict) -> str:
+    return json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+
+
+# ---------- Delta log encoding ----------
+#
+# With --log-encoding delta, the entries log is a series of segments of at
+# most KEYFRAME_INTERVAL lines. A segment opens with a keyframe that carries
+# the book's category table and a full entry whose rankings are
+# [category id, rank] pairs:
+#   {"~":"k","c":["Books","Memoirs"],"timestamp":...,"rankings":[[0,17031],[1,4]],...}
+# Each following line is a delta against the entry before it: the timestamp,
+# only the fields whose values changed, removed field names under "-", the
+# changed ranks as [position in rankings, rank] pairs under "p" (or the whole
+# list under "R" when the set or order of categories changed) and newly seen
+# categories under "+c":
+#   {"~":"d","timestamp":...,"p":[[1,5]]}
+# Positions keep a ranking list that names a category twice exact. Logs from
+# before that change carry [category id, rank] pairs under "r"; those still
+# decode.
+# Plain entry lines may appear anywhere and end the current segment, so
+# plain, delta and mixed logs all decode the same way. Entries the encoding
+# could not reproduce exactly (non-canonical ranks, unusual key order) are
+# written as plain lines.
+
+DELTA_PREFIX = b'{"~":"d"'
+_DELTA_RESERVED = frozenset({"~", "c", "+c", "-", "p", "r", "R"})
+
+
+def _packable_rank(rank) -> bool:
+    return isinstance(rank, str) and rank.isdigit() and str(int(rank)) == rank
+
+
+class LogCodec:
+    """Encoder/decoder state for one sequential pass over an entries log."""
+
+    def __init__(self) -> None:
+        self.prev: dict | None = None       # last entry encoded or decoded
+        self.table: list[str] | None = None  # category names; None outside a segment
+        self.index: dict[str, int] = {}
+        self.segment_lines = 0
+
+    def _start_segment(self, table: list[str]) -> None:
+        self.table = table
+        self.index = {name: i for i, name in enumerate(table)}
+        self.segment_lines = 1
+
+    def _intern(self, name: str, added: list[str]) -> int:
+        if name not in self.index:
+            self.index[name] = len(self.table)
+            self.table.append(name)
+            added.append(name)
+        return self.index[name]
+
+    def _unpack(self, pairs: list) -> list[dict]:
+        return [{"rank": str(rank), "category": self.table[cid]} for cid, rank in pairs]
+
+    # ----- decoding -----
+
+    def decode(self, record: dict) -> dict:
+        kind = record.pop("~", None)
+        if kind is None:
+            self.table = None
+            self.prev = record
+            return record
+        if kind == "k":
+            self._start_segment(record.pop("c"))
+            entry = {k: self._unpack(v) if k == "rankings" else v for k, v in record.items()}
+        elif kind == "d" and self.table is not None and self.prev is not None:
+            for name in record.pop("+c", ()):
+                self.index[name] = len(self.table)
+                self.table.append(name)
+            entry = dict(self.prev)
+            for key in record.pop("-", ()):
+                entry.pop(key, None)
+            if "R" in record:
+                entry["rankings"] = self._unpack(record.pop("R"))
+            elif "p" in record:
+                rankings = list(entry["rankings"])
+                for pos, rank in record.pop("p"):
+                    rankings[pos] = {"rank": str(rank), "category": rankings[pos]["category"]}
+                entry["rankings"] = rankings
+            elif "r" in record:  # pre-"p" logs: keyed by category id
+                changed = dict(record.pop("r"))
+                entry["rankings"] = [
+                    {"rank": str(changed.get(self.index[r["category"]], r["rank"])),
+                     "category": r["category"]} for r in entry["rankings"]]
+            entry.update(record)
+            self.segment_lines += 1
+        else:
+            raise ValueError(f"unexpected log record kind {kind!r} outside a keyframe segment")
+        self.prev = entry
+        return entry
+
+    # ----- encoding -----
+
+    def _encodable(self, entry: dict) -> bool:
+        rankings = entry.get("rankings")
+        return (isinstance(rankings, list) and "timestamp" in entry
+                and not _DELTA_RESERVED & entry.keys()
+                and all(isinstance(r, dict) and list(r) == ["rank", "category"]
+                        and _packable_rank(r["rank"]) and isinstance(r["category"], str)
+                        for r in rankings))
+
+    def encode(self, entry: dict) -> dict:
+        """The record to write for `entry`: a keyframe, a delta or the plain entry."""
+        if not self._encodable(entry):
+            self.table = None
+            self.prev = entry
+            return entry
+        prev = self.prev
+        delta_ok = (self.table is not None and prev is not None
+                    and self.segment_lines < KEYFRAME_INTERVAL
+                    and list(entry) == [k for k in prev if k in entry]
+                    + [k for k in entry if k not in prev])
+        if delta_ok:
+            record = self._delta(prev, entry)
+            self.segment_lines += 1
+        else:
+            self._start_segment([])
+            added: list[str] = []
+            pairs = [[self._intern(r["category"], added), int(r["rank"])]
+                     for r in entry["rankings"]]
+            record = {"~": "k", "c": list(self.table),
+                      **{k: pairs if k == "rankings" else v for k, v in entry.items()}}
+        self.prev = entry
+        return record
+
+    def _delta(self, prev: dict, entry: dict) -> dict:
+        record: dict = {"~": "d"}
+        added: list[str] = []
+        removed = [k for k in prev if k not in entry]
+        for key, value in entry.items():
+            if key == "rankings":
+                continue
+            if key == "timestamp" or key not in prev or prev[key] != value:
+                record[key] = value
+        if removed:
+            record["-"] = removed
+        old, new = prev["rankings"], entry["rankings"]
+        if [r["category"] for r in old] == [r["category"] for r in new]:
+            changed = [[pos, int(b["rank"])]
+                       for pos, (a, b) in enumerate(zip(old, new)) if a["rank"] != b["rank"]]
+            if changed:
+                record["p"] = changed
+        else:
+            record["R"] = [[self._intern(r["category"], added), int(r["rank"])] for r in new]
+        if added:
+            record["+c"] = added
+        return record
+
+
+def _segment_start(f, end: int) -> int:
+    """Offset of the self-contained line (keyframe or plain entry) that the
+    line ending at `end` can be decoded from."""
+    while end > 0:
+        start = _last_newline_end(f, end - 1)
+        f.seek(start)
+        head = f.read(len(DELTA_PREFIX))
+        if head != DELTA_PREFIX and head[:1] != b"\n":
+            return start
+        end = start
+    return 0
+
+
+def _decode_lines(f, start: int, codec: LogCodec | None = None):
+    """(offset just past the line, entry) for each complete line from `start`."""
+    codec = codec or LogCodec()
+    f.seek(start)
+    position = start
+    for line in f:
+        if not line.endswith(b"\n"):
+            return  # torn final line from an interrupted append
+        position += len(line)
+        if line.strip():
+            yield position, codec.decode(json.loads(line))
+
+
+def load_state(slug: str, display_name: str) -> dict:
+    if (db := sqlite_history()) is not None:
+        return db.load_state(slug, display_name)
+    return _load_file_state(slug, display_name)
+
+
+def _load_file_state(slug: str, display_name: str) -> dict:
+    state = {"slug": slug, "display_name": display_name, **dict.fromkeys(STATE_FIELDS)}
+    path = state_path(slug)
     if path.exists():
         try:
             data = json.loads(path.read_text())
-            if isinstance(data, dict) and "entries" in data:
-                data["slug"] = slug
-                data["display_name"] = display_name  # books.json is source of truth
-                data.setdefault("last_successful_scrape", None)
-                data.setdefault("last_error", None)
-                data.setdefault("last_attempt_timestamp", None)
-                data.setdefault("last_attempt_status", None)
-                return data
         except json.JSONDecodeError:
+            data = None
+        if isinstance(data, dict):
+            if "entries" in data:
+                _split_legacy_envelope(slug, data)
+            state.update((k, data.get(k)) for k in STATE_FIELDS)
+    state["display_name"] = display_name  # books.json is source of truth
+    return state
+
+
+def save_state(slug: str, state: dict) -> None:
+    if (db := sqlite_history()) is not None:
+        return db.save_state(slug, state)
+    _save_file_state(slug, state)
+
+
+def _save_file_state(slug: str, state: dict) -> None:
+    write_atomic(state_path(slug), {k: v for k, v in state.items() if k != "entries"})
+
+
+def _split_legacy_envelope(slug: str, envelope: dict) -> None:
+    # Log first, then state: a crash in between leaves the envelope in place
+    # and the split is simply redone on the next read.
+    _rewrite_file_entries(slug, envelope.get("entries", []))
+    _save_file_state(slug, envelope)
+
+
+def append_entry(slug: str, entry: dict) -> None:
+    if (db := sqlite_history()) is not None:
+        return db.append_entry(slug, entry)
+    path = entries_path(slug)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "ab+") as f:
+        # A crash mid-append leaves a torn last line without its newline;
+        # drop it so the log stays one complete JSON object per line.
+        size = f.seek(0, os.SEEK_END)
+        if size:
+            f.seek(size - 1)
+            if f.read(1) != b"\n":
+                size = _last_newline_end(f, size)
+                f.truncate(size)
+        record = entry
+        if LOG_ENCODING == "delta":
+            # Replay the tail segment to pick up the encoder's state.
+            codec = LogCodec()
+            for _ in _decode_lines(f, _segment_start(f, size), codec):
+                pass
+            record = codec.encode(entry)
+        f.seek(0, os.SEEK_END)
+        f.write((_dump_entry(record) + "\n").encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _last_newline_end(f, size: int, block: int = 1 << 16) -> int:
+    """Offset just past the last newline before `size` (0 if there is none)."""
+    end = size
+    while end > 0:
+        start = max(0, end - block)
+        f.seek(start)
+        idx = f.read(end - start).rfind(b"\n")
+        if idx >= 0:
+            return start + idx + 1
+        end = start
+    return 0
+
+
+def iter_entries(slug: str, since: str | None = None, cold: bool = True):
+    """Every entry in time order, or only those at or after `since`; cold
+    segments that end before `since` (or all of them, with cold=False) are
+    never opened."""
+    if (db := sqlite_history()) is not None:
+        yield from db.iter_entries(slug, since=since)
+        return
+    yield from _iter_file_entries(slug, since, cold)
+
+
+def _iter_file_entries(slug: str, since: str | None = None, cold: bool = True):
+    if cold:
+        yield from iter_cold_entries(slug, since)
+    yield from _iter_hot(slug, since)
+
+
+def _iter_hot(slug: str, since: str | None = None):
+    path = entries_path(slug)
+    if not path.exists():
+        return
+    sealed = load_cold_index(slug)["sealed_through"]
+    with open(path, "rb") as f:
+        for _, entry in _decode_lines(f, 0):
+            if sealed is not None and entry["timestamp"] <= sealed:
+                continue  # already in a cold segment (interrupted seal)
+            if since is None or entry["timestamp"] >= since:
+                yield entry
+
+
+def read_last_entry(slug: str) -> dict | None:
+    """Last complete entry, read from the end of the log without scanning it."""
+    if (db := sqlite_history()) is not None:
+        return db.read_last_entry(slug)
+    path = entries_path(slug)
+    last = None
+    if path.exists():
+        with open(path, "rb") as f:
+            end = _last_newline_end(f, f.seek(0, os.SEEK_END))
+            for _, last in _decode_lines(f, _segment_start(f, end)):
+                pass
+    sealed = load_cold_index(slug)["sealed_through"]
+    if sealed is not None and (last is None or last["timestamp"] <= sealed):
+        # Sealing keeps the newest entry hot; this only runs after an
+        # interrupted seal or when the hot log was removed by hand.
+        for last in iter_cold_entries(slug, since=sealed):
             pass
-    return {
-        "slug": slug,
-        "display_name": display_name,
-        "last_successful_scrape": None,
-        "last_error": None,
-        "last_attempt_timestamp": None,
-        "last_attempt_status": None,
-        "entries": [],
-    }
+    return last
+
+
+def read_tail_entries(slug: str, n: int) -> list[dict]:
+    """Up to the last `n` hot entries, read from the end of the log."""
+    if (db := sqlite_history()) is not None:
+        return db.read_tail_entries(slug, n)
+    path = entries_path(slug)
+    if n <= 0 or not path.exists():
+        return []
+    sealed = load_cold_index(slug)["sealed_through"]
+    with open(path, "rb") as f:
+        end = _last_newline_end(f, f.seek(0, os.SEEK_END))
+        for _ in range(n - 1):
+            if end == 0:
+                break
+            end = _last_newline_end(f, end - 1)
+        tail = deque((e for _, e in _decode_lines(f, _segment_start(f, end))
+                      if sealed is None or e["timestamp"] > sealed), maxlen=n)
+    return list(tail)
 
 
-def write_atomic(path: Path, data) -> None:
+def rewrite_entries(slug: str, entries) -> int:
+    """Atomically replace the entries log with `entries`; returns the count."""
+    if (db := sqlite_history()) is not None:
+        return db.rewrite_entries(slug, entries)
+    return _rewrite_file_entries(slug, entries)
+
+
+def _rewrite_file_entries(slug: str, entries) -> int:
+    path = entries_path(slug)
     path.parent.mkdir(parents=True, exist_ok=True)
     tmp = tempfile.NamedTemporaryFile(
         mode="w", dir=path.parent, prefix=f".{path.name}.", suffix=".tmp",
         delete=False, encoding="utf-8",
     )
+    n = 0
+    codec = LogCodec() if LOG_ENCODING == "delta" else None
     try:
-        json.dump(data, tmp, indent=2, ensure_ascii=False)
+        for entry in entries:
+            tmp.write(_dump_entry(codec.encode(entry) if codec else entry) + "\n")
+            n += 1
         tmp.flush()
         os.fsync(tmp.fileno())
     finally:
         tmp.close()
     os.replace(tmp.name, path)
+    return n
 
 
-# ---------- Per-book scrape ----------
+# The last entry's signature is cached in data/<slug>.sig.json together with
+# the has_goodreads mode it was computed under and the log's (size, mtime) at
+# the time. A no-change scrape compares against it with a single stat() and
+# never opens the log; any mismatch rebuilds the sidecar from the log's tail.
+
+def _signature_key(sig: tuple) -> str:
+    return json.dumps(sig, ensure_ascii=False)
+
+
+def _log_stamp(slug: str) -> list[int] | None:
+    try:
+        st = entries_path(slug).stat()
+    except FileNotFoundError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def save_last_signature(slug: str, sig: tuple, has_goodreads: bool) -> None:
+    if sqlite_history() is not None:
+        return
+    write_atomic(signature_path(slug), {
+        "signature": _signature_key(sig), "has_goodreads": has_goodreads,
+        "log": _log_stamp(slug),
+    })
+
+
+def last_signature(slug: str, has_goodreads: bool) -> str | None:
+    """Signature key of the last logged entry, or None for an empty history."""
+    if sqlite_history() is not None:
+        last_entry = read_last_entry(slug)
+        return None if last_entry is None else _signature_key(entry_signature(last_entry, has_goodreads))
+    stamp = _log_stamp(slug)
+    try:
+        sidecar = json.loads(signature_path(slug).read_text())
+        if sidecar.get("has_goodreads") == has_goodreads and sidecar.get("log") == stamp:
+            return sidecar["signature"]
+    except (OSError, json.JSONDecodeError, KeyError):
+        pass
+    # Missing or stale sidecar: rebuild from the tail of the log.
+    last_entry = read_last_entry(slug)
+    if last_entry is None:
+        return None
+    sig = entry_signature(last_entry, has_goodreads)
+    save_last_signature(slug, sig, has_goodreads)
+    return _signature_key(sig)
 
-def scrape_book(book: dict, log: logging.Logger) -> None:
+
+def history_fingerprint(slug: str) -> str:
+    """Cheap digest that changes whenever a book's state or entries change.
+
+    Hashes the small state record plus the log's (size, mtime) -- or the last
+    snapshot id under SQLite -- so it never reads the history itself.
+    """
+    h = hashlib.sha256()
+    if (db := sqlite_history()) is not None:
+        h.update(json.dumps([db.load_state(slug, ""), db.last_snapshot_id(slug)]).encode())
+    else:
+        try:
+            h.update(state_path(slug).read_bytes())
+        except FileNotFoundError:
+            pass
+        h.update(json.dumps([_log_stamp(slug), _cold_stamp(slug)]).encode())
+    h.update(json.dumps(_patch_stamp(slug)).encode())
+    return h.hexdigest()
+
+
+def has_history(slug: str) -> bool:
+    if (db := sqlite_history()) is not None:
+        return db.has_history(slug)
+    return state_path(slug).exists()
+
+
+def load_envelope(slug: str, display_name: str) -> dict:
+    """Full envelope (state + every entry), in the shape the dashboard embeds."""
+    envelope = load_state(slug, display_name)
+    patches = load_patches(slug)
+    envelope["entries"] = [apply_patches(e, patches) for e in iter_entries(slug)]
+    return envelope
+
+
+def compact_history(book: dict) -> tuple[int, int]:
+    """Rewrite a book's log without torn lines or consecutive duplicates.
+
+    Returns (entries before, entries after).
+    """
     slug = book["slug"]
-    display_name = book["display_name"]
     has_goodreads = bool(book.get("goodreads_url"))
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    load_state(slug, book["display_name"])  # splits a legacy envelope if present
+    before = 0
+    prev_sig = None
+
+    def deduped():
+        nonlocal before, prev_sig
+        for entry in iter_entries(slug, cold=False):
+            before += 1
+            sig = entry_signature(entry, has_goodreads)
+            if sig != prev_sig:
+                prev_sig = sig
+                yield entry
+
+    if sqlite_history() is None and not entries_path(slug).exists():
+        return 0, 0
+    after = rewrite_entries(slug, deduped())
+    return before, after
+
+
+def import_into_sqlite(book: dict) -> int:
+    """Copy a book's file-backed history (or legacy envelope) into SQLite."""
+    slug = book["slug"]
+    if not state_path(slug).exists():
+        return 0
+    state = _load_file_state(slug, book["display_name"])
+    db = _sqlite_at(DATA_DIR / SQLITE_FILE)
+    n = db.rewrite_entries(slug, _iter_file_entries(slug))
+    db.save_state(slug, state)
+    return n
+
+
+# ---------- Tiered retention ----------
+#
+# --seal moves entries older than HOT_DAYS out of the hot log into immutable
+# compressed segments under data/<slug>.cold/, one per calendar month sealed
+# (a later seal of the same month adds another segment). The newest entry
+# always stays hot, so scrapes and tail reads never touch cold data.
+#
+# DOWNSAMPLE_RULES thin data as it ages: with (90, 3600), an entry 90+ days
+# old survives only if it is the last one in its hour. A segment whose newest
+# entry crosses a rule's age is rewritten at the coarser resolution.
+#
+# index.json lists every segment with its time range, so range reads pick
+# segments without opening them. It also records `sealed_through`: hot lines
+# at or before it were sealed by a seal that was interrupted before the hot
+# log was rewritten, and readers skip them.
+
+COLD_INDEX_VERSION = 1
+COLD_SUFFIXES = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+_EPOCH = datetime(1970, 1, 1)
+
+
+def cold_dir(slug: str) -> Path:
+    return DATA_DIR / f"{slug}.cold"
+
+
+def load_cold_index(slug: str) -> dict:
+    try:
+        index = json.loads((cold_dir(slug) / "index.json").read_text())
+    except (OSError, json.JSONDecodeError):
+        index = None
+    if not isinstance(index, dict):
+        return {"version": COLD_INDEX_VERSION, "segments": [], "sealed_through": None}
+    return index
 
-    envelope = load_envelope(slug, display_name)
-    envelope["last_attempt_timestamp"] = now
 
-    data_path = DATA_DIR / f"{slug}.json"
+def _cold_stamp(slug: str) -> list[int] | None:
+    try:
+        st = (cold_dir(slug) / "index.json").stat()
+    except FileNotFoundError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _read_segment(path: Path):
+    raw = path.read_bytes()
+    if path.name.endswith(COLD_SUFFIXES["zstd"]):
+        if not HAVE_ZSTD:
+            raise RuntimeError(f"{path} needs the zstandard package")
+        data = zstandard.ZstdDecompressor().decompress(raw)
+    else:
+        data = gzip.decompress(raw)
+    codec = LogCodec()
+    for line in data.splitlines():
+        if line.strip():
+            yield codec.decode(json.loads(line))
+
+
+def iter_cold_entries(slug: str, since: str | None = None):
+    for segment in load_cold_index(slug)["segments"]:
+        if since is not None and segment["last"] < since:
+            continue
+        for entry in _read_segment(cold_dir(slug) / segment["file"]):
+            if since is None or entry["timestamp"] >= since:
+                yield entry
+
+
+def _write_segment(slug: str, entries: list[dict], bucket: int) -> dict:
+    # Cold data is always delta-encoded; it is written once and read rarely.
+    codec = LogCodec()
+    data = "".join(_dump_entry(codec.encode(e)) + "\n" for e in entries).encode("utf-8")
+    if COLD_COMPRESSION == "zstd":
+        data = zstandard.ZstdCompressor(level=19).compress(data)
+    else:
+        data = gzip.compress(data, 9, mtime=0)
+    first, last = entries[0]["timestamp"], entries[-1]["timestamp"]
+    stamp = lambda ts: re.sub(r"[^0-9]", "", ts)
+    name = f"{stamp(first)}-{stamp(last)}.{bucket}s{COLD_SUFFIXES[COLD_COMPRESSION]}"
+    with open_atomic(cold_dir(slug) / name) as f:
+        f.write(data)
+    return {"file": name, "first": first, "last": last, "count": len(entries), "bucket": bucket}
+
+
+def _bucket_seconds(timestamp: str, now: datetime) -> int:
+    age_days = (now - datetime.fromisoformat(timestamp)).total_seconds() / 86400
+    return max((seconds for days, seconds in DOWNSAMPLE_RULES if age_days >= days), default=0)
+
+
+def downsample(entries: list[dict], now: datetime) -> list[dict]:
+    """Keep the last entry of each DOWNSAMPLE_RULES bucket its age falls under."""
+    kept: list[dict] = []
+    prev_key = None
+    for entry in entries:
+        bucket = _bucket_seconds(entry["timestamp"], now)
+        key = None
+        if bucket:
+            offset = (datetime.fromisoformat(entry["timestamp"]) - _EPOCH).total_seconds()
+            key = (bucket, int(offset // bucket))
+        if key is not None and key == prev_key:
+            kept[-1] = entry
+        else:
+            kept.append(entry)
+        prev_key = key
+    return kept
 
-    amazon_data = get_amazon_data(book["amazon_url"])
-    if amazon_data is None or not amazon_data.get("rankings"):
-        envelope["last_attempt_status"] = "failed"
-        envelope["last_error"] = "Amazon fetch failed or returned no rankings"
-        write_atomic(data_path, envelope)
-        log.info("scrape", extra={"extra_fields": {
-            "slug": slug, "status": "failed", "reason": "amazon-fetch",
-        }})
-        print(f"[{slug}] failed: Amazon fetch")
-        return
 
+def seal_history(book: dict, now: datetime | None = None) -> dict | None:
+    """Move a book's entries older than HOT_DAYS into cold segments and
+    re-thin segments that aged past a downsampling rule.
+
+    Returns counts (sealed, dropped by downsampling, segments written), or
+    None with the SQLite backend, which keeps everything in one indexed table.
+    """
+    if sqlite_history() is not None:
+        return None
+    slug = book["slug"]
+    load_state(slug, book["display_name"])  # splits a legacy envelope if present
+    now = now or datetime.now()
+    cutoff = (now - timedelta(days=HOT_DAYS)).strftime(TIMESTAMP_FORMAT)
+    index = load_cold_index(slug)
+    stats = {"sealed": 0, "dropped": 0, "segments": 0}
+    segments = []
+
+    for segment in index["segments"]:
+        bucket = _bucket_seconds(segment["last"], now)
+        if bucket <= segment.get("bucket", 0):
+            segments.append(segment)
+            continue
+        entries = downsample(list(_read_segment(cold_dir(slug) / segment["file"])), now)
+        segments.append(_write_segment(slug, entries, bucket))
+        stats["dropped"] += segment["count"] - len(entries)
+        stats["segments"] += 1
+
+    def seal(month: list[dict]) -> None:
+        if month:
+            kept = downsample(month, now)
+            segments.append(_write_segment(slug, kept, _bucket_seconds(kept[-1]["timestamp"], now)))
+            stats["dropped"] += len(month) - len(kept)
+            stats["segments"] += 1
+
+    sealed_through = index["sealed_through"]
+    hot = _iter_hot(slug)
+    month: list[dict] = []
+    try:
+        pending = next(hot, None)
+        for entry in hot:  # one entry behind, so the newest is never sealed
+            if pending["timestamp"] >= cutoff:
+                break
+            if month and month[-1]["timestamp"][:7] != pending["timestamp"][:7]:
+                seal(month)
+                month = []
+            month.append(pending)
+            sealed_through = pending["timestamp"]
+            stats["sealed"] += 1
+            pending = entry
+    finally:
+        hot.close()
+    seal(month)
+
+    if not stats["segments"]:
+        return stats
+    # Index first: from here on readers skip the sealed prefix of the hot log,
+    # so a crash before the rewrite below shows no duplicates.
+    write_atomic(cold_dir(slug) / "index.json", {
+        "version": COLD_INDEX_VERSION, "segments": segments, "sealed_through": sealed_through,
+    })
+    listed = {segment["file"] for segment in segments} | {"index.json"}
+    for path in cold_dir(slug).iterdir():
+        if path.name not in listed and not path.name.startswith("."):
+            path.unlink()  # replaced by re-thinning, or orphaned by a crash
+    if stats["sealed"]:
+        rewrite_entries(slug, _iter_hot(slug))
+    return stats
+
+
+def drop_cold(slug: str) -> None:
+    """Forget a book's cold segments (after their entries were rewritten hot)."""
+    directory = cold_dir(slug)
+    (directory / "index.json").unlink(missing_ok=True)
+    if directory.exists():
+        for path in directory.iterdir():
+            path.unlink()
+        directory.rmdir()
+
+
+def write_atomic(path: Path, data) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = tempfile.NamedTemporaryFile(
+        mode="w", dir=path.parent, prefix=f".{path.name}.", suffix=".tmp",
+        delete=False, encoding="utf-8",
+    )
+    try:
+        json.dump(data, tmp, indent=2, ensure_ascii=False)
+        tmp.flush()
+        os.fsync(tmp.fileno())
+    finally:
+        tmp.close()
+    os.replace(tmp.name, path)
+
+
+# ---------- Corrections ----------
+#
+# clean_goodreads_data.py never rewrites a history. It appends corrections to
+# data/<slug>.patches.jsonl, one record per flagged entry:
+#   {"timestamp": ..., "rule": ..., "unset": [field, ...], "drop_rankings": [category, ...]}
+# Dashboards apply them on read; scraping and deduplication see the raw log.
+
+_PATCH_CACHE: dict[str, tuple[list[int] | None, dict[str, list[dict]]]] = {}
+
+
+def patches_path(slug: str) -> Path:
+    return DATA_DIR / f"{slug}.patches.jsonl"
+
+
+def _patch_stamp(slug: str) -> list[int] | None:
+    try:
+        st = patches_path(slug).stat()
+    except FileNotFoundError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def load_patches(slug: str) -> dict[str, list[dict]]:
+    """Patch records keyed by the timestamp of the entry they correct."""
+    stamp = _patch_stamp(slug)
+    cached = _PATCH_CACHE.get(slug)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    patches: dict[str, list[dict]] = {}
+    if stamp is not None:
+        with open(patches_path(slug), encoding="utf-8") as f:
+            for line in f:
+                try:
+                    patch = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn last line
+                patches.setdefault(patch["timestamp"], []).append(patch)
+    _PATCH_CACHE[slug] = (stamp, patches)
+    return patches
+
+
+def append_patches(slug: str, patches: list[dict]) -> None:
+    path = patches_path(slug)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        for patch in patches:
+            f.write(_dump_entry(patch) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def apply_patches(entry: dict, patches: dict[str, list[dict]]) -> dict:
+    """`entry` with its corrections applied (a copy; `entry` itself if none)."""
+    found = patches.get(entry["timestamp"])
+    if not found:
+        return entry
+    entry = dict(entry)
+    for patch in found:
+        for field in patch.get("unset", ()):
+            entry.pop(field, None)
+        if patch.get("drop_rankings"):
+            drop = set(patch["drop_rankings"])
+            entry["rankings"] = [r for r in entry.get("rankings") or [] if r["category"] not in drop]
+    return entry
+
+
+# ---------- Per-book scrape ----------
+
+def make_entry(timestamp: str, amazon_data: dict, gr_data: dict | None) -> dict:
+    """History entry from extracted Amazon data (rankings present) and
+    optional Goodreads data."""
     arc = amazon_data.get("amazon_review_count")
     # Absent review widget on a valid product page (rankings parsed) = 0 reviews,
     # not a scrape failure. New releases have no review element at all.
@@ -326,63 +1850,628 @@ def scrape_book(book: dict, log: logging.Logger) -> None:
         # Normalize int 0 to "0" so signature/serialization stays string-typed.
         arc = "0"
 
-    new_entry = {
-        "timestamp": now,
+    entry = {
+        "timestamp": timestamp,
         "amazon_review_count": arc,
         "rankings": amazon_data.get("rankings"),
     }
+    if gr_data:
+        # Only include fields if both are present; None-mixed entries pollute signatures.
+        ratings = gr_data.get("goodreads_ratings_count")
+        reviews = gr_data.get("goodreads_reviews_count")
+        if ratings is not None:
+            entry["goodreads_ratings_count"] = ratings
+        if reviews is not None:
+            entry["goodreads_reviews_count"] = reviews
+    # Goodreads fetch failure is not a scrape-level failure — omit and move on.
+    return entry
+
+
+def scrape_book(book: dict, log: logging.Logger,
+                side_pool: ThreadPoolExecutor | None = None) -> None:
+    """Scrape one book and persist the result.
+
+    With `side_pool`, the Goodreads fetch is started up front so it overlaps
+    the Amazon fetch and parse instead of waiting for them. The log record
+    carries per-phase timings (load, <kind>_wait/_fetch/_retry_sleep/_parse,
+    signature, persist) and response sizes; they also feed RUN_METRICS.
+    """
+    slug = book["slug"]
+    display_name = book["display_name"]
+    has_goodreads = bool(book.get("goodreads_url"))
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    timer = PhaseTimer()
+
+    def report(status: str, reason: str, **fields) -> None:
+        RUN_METRICS.observe_scrape(timer, reason)
+        log.info("scrape", extra={"extra_fields": {
+            "slug": slug, "status": status, **fields, "reason": reason, **timer.fields(),
+        }})
+
+    with timer.phase("load"):
+        state = load_state(slug, display_name)
+    state["last_attempt_timestamp"] = now
+
+    if not host_breaker(book["amazon_url"]).allow():
+        state["last_attempt_status"] = "failed"
+        state["last_error"] = "Skipped: Amazon circuit breaker open after blocked responses"
+        save_state(slug, state)
+        report("failed", "circuit-open")
+        print(f"[{slug}] skipped: Amazon circuit open")
+        return
+
+    gr_future = None
+    if has_goodreads and side_pool is not None:
+        gr_future = side_pool.submit(get_goodreads_data, book["goodreads_url"], (slug, now), timer)
+
+    amazon_data = get_amazon_data(book["amazon_url"], (slug, now), timer)
+    if amazon_data is None or not amazon_data.get("rankings"):
+        if gr_future is not None:
+            gr_future.cancel()
+        state["last_attempt_status"] = "failed"
+        state["last_error"] = "Amazon fetch failed or returned no rankings"
+        with timer.phase("persist"):
+            save_state(slug, state)
+        report("failed", "amazon-fetch")
+        print(f"[{slug}] failed: Amazon fetch")
+        return
 
+    gr_data = None
     if has_goodreads:
-        gr_data = get_goodreads_data(book["goodreads_url"])
-        if gr_data:
-            # Only include fields if both are present; None-mixed entries pollute signatures.
-            ratings = gr_data.get("goodreads_ratings_count")
-            reviews = gr_data.get("goodreads_reviews_count")
-            if ratings is not None:
-                new_entry["goodreads_ratings_count"] = ratings
-            if reviews is not None:
-                new_entry["goodreads_reviews_count"] = reviews
-        # Goodreads fetch failure is not a scrape-level failure — omit and move on.
-
-    entries = envelope["entries"]
-    new_sig = entry_signature(new_entry, has_goodreads)
-    wrote_entry = False
-    if not entries or entry_signature(entries[-1], has_goodreads) != new_sig:
-        entries.append(new_entry)
-        wrote_entry = True
-
-    envelope["last_successful_scrape"] = now
-    envelope["last_error"] = None
-    envelope["last_attempt_status"] = "appended" if wrote_entry else "no-change"
-    envelope["entries"] = entries
-
-    write_atomic(data_path, envelope)
-
-    log.info("scrape", extra={"extra_fields": {
-        "slug": slug, "status": "success", "wrote_entry": wrote_entry,
-        "reason": "appended" if wrote_entry else "no-change",
-    }})
+        if gr_future is not None:
+            gr_data = gr_future.result()
+        else:
+            gr_data = get_goodreads_data(book["goodreads_url"], (slug, now), timer)
+    new_entry = make_entry(now, amazon_data, gr_data)
+
+    with timer.phase("signature"):
+        new_sig = entry_signature(new_entry, has_goodreads)
+        wrote_entry = last_signature(slug, has_goodreads) != _signature_key(new_sig)
+
+    with timer.phase("persist"):
+        if wrote_entry:
+            append_entry(slug, new_entry)
+            save_last_signature(slug, new_sig, has_goodreads)
+        state["last_successful_scrape"] = now
+        state["last_error"] = None
+        state["last_attempt_status"] = "appended" if wrote_entry else "no-change"
+        save_state(slug, state)
+
+    report("success", "appended" if wrote_entry else "no-change", wrote_entry=wrote_entry)
 
     gr_status = "no"
     if has_goodreads and "goodreads_ratings_count" in new_entry:
         gr_status = "yes"
     print(f"[{slug}] {'appended' if wrote_entry else 'no-change'}: "
-          f"reviews={arc} rankings={len(new_entry['rankings'])} goodreads={gr_status}")
+          f"reviews={new_entry['amazon_review_count']} rankings={len(new_entry['rankings'])} goodreads={gr_status}")
+
+
+def scrape_book_isolated(book: dict, log: logging.Logger,
+                         side_pool: ThreadPoolExecutor | None = None) -> None:
+    # Per-book failure isolation: one crashing book can't kill the run.
+    try:
+        scrape_book(book, log, side_pool)
+    except Exception as e:
+        log.exception("scrape crash", extra={"extra_fields": {"slug": book["slug"]}})
+        print(f"[{book['slug']}] crash: {e}", file=sys.stderr)
+
+
+def scrape_all(books: list[dict], log: logging.Logger, workers: int) -> None:
+    if workers <= 1:
+        for i, book in enumerate(books):
+            scrape_book_isolated(book, log)
+            # No pacing needed ahead of a book whose host is short-circuited.
+            if i < len(books) - 1 and host_breaker(books[i + 1]["amazon_url"]).allow():
+                time.sleep(INTER_BOOK_DELAY)
+        return
+
+    # Concurrent mode: pacing comes from the per-host token buckets instead of
+    # INTER_BOOK_DELAY. Side fetches (Goodreads) get their own pool so a book
+    # waiting on its Goodreads future never starves the pool it runs in.
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="book") as book_pool, \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="side") as side_pool:
+        futures = [book_pool.submit(scrape_book_isolated, b, log, side_pool) for b in books]
+        for fut in as_completed(futures):
+            fut.result()
+
+
+# ---------- Archive replay ----------
+
+def archived_scrapes(archive: PageArchive) -> dict[str, list[tuple[str, dict]]]:
+    """{slug: [(timestamp, {kind: sha256}), ...]} for every archived scrape,
+    in fetch order, from one pass over the shared index.
+
+    A book is scraped by one thread at a time, so its pages for one scrape
+    are adjacent once other books' records are filtered out.
+    """
+    by_slug: dict[str, list[dict]] = {}
+    for record in archive.iter_index():
+        if "slug" in record:
+            by_slug.setdefault(record["slug"], []).append(record)
+    return {
+        slug: [(timestamp, {r["kind"]: r["sha256"] for r in group})
+               for timestamp, group in groupby(records, key=itemgetter("timestamp"))]
+        for slug, records in by_slug.items()
+    }
+
+
+def _replay_job(archive_dir: str, amazon_sha: str | None,
+                goodreads_sha: str | None) -> tuple[dict | None, dict | None]:
+    archive = PageArchive(Path(archive_dir))
+    amazon_data = extract_amazon(archive.read(amazon_sha)) if amazon_sha else None
+    gr_data = extract_goodreads(archive.read(goodreads_sha)) if goodreads_sha else None
+    return amazon_data, gr_data
+
+
+def _bounded_map(pool: ProcessPoolExecutor | None, fn, jobs, window: int):
+    """Ordered (key, fn(*args)) for (key, args) in `jobs`, at most `window` queued."""
+    if pool is None:
+        for key, args in jobs:
+            yield key, fn(*args)
+        return
+    pending: deque = deque()
+    for key, args in jobs:
+        pending.append((key, pool.submit(fn, *args)))
+        if len(pending) >= window:
+            key, fut = pending.popleft()
+            yield key, fut.result()
+    while pending:
+        key, fut = pending.popleft()
+        yield key, fut.result()
+
+
+def reextract_book(book: dict, archive: PageArchive,
+                   pool: ProcessPoolExecutor | None = None, window: int = 1,
+                   scrapes: list[tuple[str, dict]] | None = None) -> tuple[int, int]:
+    """Rebuild a book's log by running the current extractors over its archived
+    pages. `scrapes` is the book's entry from archived_scrapes() (read from
+    the archive when omitted).
+
+    Replayed scrapes are merged into the existing log by timestamp: an entry
+    whose scrape was archived is replaced by the re-extracted one, and every
+    entry without archived pages -- or whose pages no longer yield rankings --
+    is kept as it is. At most `window` pages are parsing at once and
+    rewrite_entries() consumes entries as they are made.
+    Returns (archived scrapes replayed, entries written).
+    """
+    slug = book["slug"]
+    has_goodreads = bool(book.get("goodreads_url"))
+    if scrapes is None:
+        scrapes = archived_scrapes(archive).get(slug, [])
+    if not scrapes:
+        return 0, 0
+    replayed = 0
+    prev_sig = None
+    merged_all = False
+
+    def replays():
+        nonlocal replayed
+        jobs = ((ts, (str(archive.directory), pages.get("amazon"), pages.get("goodreads")))
+                for ts, pages in scrapes)
+        for ts, (amazon_data, gr_data) in _bounded_map(pool, _replay_job, jobs, window):
+            replayed += 1
+            entry = None
+            if amazon_data and amazon_data.get("rankings"):
+                entry = make_entry(ts, amazon_data, gr_data if has_goodreads else None)
+            yield ts, 0, entry
+
+    def rebuilt():
+        nonlocal prev_sig, merged_all
+        existing = ((e["timestamp"], 1, e) for e in iter_entries(slug))
+        merged = heapq.merge(replays(), existing, key=itemgetter(0, 1))
+        for _, group in groupby(merged, key=itemgetter(0)):
+            # Replays sort first within a timestamp; one that yielded an entry
+            # supersedes what was logged then, otherwise the old entries stay.
+            items = list(group)
+            fresh = [e for _, source, e in items if source == 0 and e is not None]
+            for entry in fresh or [e for _, source, e in items if source == 1]:
+                sig = entry_signature(entry, has_goodreads)
+                if sig != prev_sig:
+                    prev_sig = sig
+                    yield entry
+        merged_all = True
+
+    load_state(slug, book["display_name"])  # splits a legacy envelope if present
+    written = rewrite_entries(slug, rebuilt())
+    # Cold entries are hot now too; until the index is gone readers still skip
+    # the rewritten copies of sealed entries. Only drop the segments once
+    # every entry they held has gone through the rewrite.
+    if merged_all and sqlite_history() is None:
+        drop_cold(slug)
+    if prev_sig is not None:
+        save_last_signature(slug, prev_sig, has_goodreads)
+    rollup_path(slug).unlink(missing_ok=True)
+    return replayed, written
+
+
+# ---------- Dashboard rollups ----------
+#
+# Dashboards embed a compact, pre-aggregated payload instead of the raw
+# history: one representative entry per day (the day's highest review count,
+# ties to the later entry), per-category daily rank series with their 7-day
+# moving averages, best-ever ranks and the latest snapshot. The per-day fold
+# is cached in data/<slug>.rollup.json together with the log position it has
+# consumed, so each render folds in only the entries appended since.
+
+ROLLUP_VERSION = 1
+MA_WINDOW_DAYS = 7
+MA_MIN_POINTS = 3            # fewer non-null points than this: no MA line
+
+
+def rollup_path(slug: str) -> Path:
+    return DATA_DIR / f"{slug}.rollup.json"
+
+
+def _js_int(v) -> int | None:
+    # parseInt() semantics for the count/rank strings: leading integer or None.
+    m = re.match(r"\s*(-?\d+)", str(v)) if v is not None else None
+    return int(m.group(1)) if m else None
+
+
+def _entry_digest(entry: dict) -> str:
+    return hashlib.sha256(_dump_entry(entry).encode("utf-8")).hexdigest()
+
+
+def _entries_since(slug: str, position: int):
+    """(position after entry, entry) for every entry past `position`.
+
+    Positions are byte offsets into the JSONL log, or snapshot ids in SQLite.
+    """
+    if (db := sqlite_history()) is not None:
+        yield from db.iter_rows(slug, position)
+        return
+    path = entries_path(slug)
+    if not path.exists():
+        return
+    sealed = load_cold_index(slug)["sealed_through"]
+    with open(path, "rb") as f:
+        # Deltas past `position` decode against the segment it falls in.
+        for end, entry in _decode_lines(f, _segment_start(f, position)):
+            if end > position and (sealed is None or entry["timestamp"] > sealed):
+                yield end, entry
+
+
+def _entry_before(slug: str, position: int) -> dict | None:
+    """The entry that ends exactly at `position` (see _entries_since)."""
+    if (db := sqlite_history()) is not None:
+        return db.entry_at(slug, position)
+    path = entries_path(slug)
+    try:
+        with open(path, "rb") as f:
+            if position > f.seek(0, os.SEEK_END):
+                return None
+            for end, entry in _decode_lines(f, _segment_start(f, position)):
+                if end == position:
+                    return entry
+                if end > position:
+                    break
+    except (OSError, ValueError, KeyError, IndexError):
+        return None
+    return None
+
+
+def _fold_entry(rollup: dict, entry: dict) -> None:
+    if entry.get("amazon_review_count") in (None, ""):
+        return
+    day = entry["timestamp"][:10]
+    winner = rollup["days"].get(day)
+    if winner is None:
+        rollup["days"][day] = entry
+    else:
+        count = _js_int(entry["amazon_review_count"]) or 0
+        best = _js_int(winner["amazon_review_count"]) or 0
+        if count > best or (count == best and entry["timestamp"] > winner["timestamp"]):
+            rollup["days"][day] = entry
+    for r in entry.get("rankings") or []:
+        rank = _js_int(r["rank"])
+        if rank is None:
+            continue
+        best = rollup["best"].get(r["category"])
+        if best is None or rank < best[0]:
+            rollup["best"][r["category"]] = [rank, entry["timestamp"]]
+
+
+def update_rollup(slug: str) -> dict:
+    """Fold entries appended since the cached rollup, rebuilding it if the
+    log was rewritten underneath (compaction, import, legacy split) or new
+    corrections were logged."""
+    try:
+        rollup = json.loads(rollup_path(slug).read_text())
+    except (OSError, json.JSONDecodeError):
+        rollup = None
+    if rollup is not None:
+        position, digest = rollup.get("position", 0), rollup.get("digest")
+        ok = (rollup.get("version") == ROLLUP_VERSION and rollup.get("backend") == STORAGE_BACKEND
+              and rollup.get("cold") == _cold_stamp(slug)
+              and rollup.get("patches") == _patch_stamp(slug))
+        if ok and position:
+            tail = _entry_before(slug, position)
+            ok = tail is not None and _entry_digest(tail) == digest
+        if not ok:
+            rollup = None
+    changed = False
+    patches = load_patches(slug)
+    if rollup is None:
+        rollup = {"version": ROLLUP_VERSION, "backend": STORAGE_BACKEND, "cold": _cold_stamp(slug),
+                  "patches": _patch_stamp(slug), "position": 0, "digest": None, "days": {}, "best": {}}
+        if sqlite_history() is None:
+            # Cold segments only change by sealing, which rewrites the hot log
+            # and so forces this rebuild; incremental folds stay hot-only.
+            for entry in iter_cold_entries(slug):
+                _fold_entry(rollup, apply_patches(entry, patches))
+                changed = True
+
+    for position, entry in _entries_since(slug, rollup["position"]):
+        _fold_entry(rollup, apply_patches(entry, patches))
+        rollup["position"], rollup["digest"] = position, _entry_digest(entry)
+        changed = True
+    if changed:
+        write_atomic(rollup_path(slug), rollup)
+    return rollup
+
+
+def moving_average(values: list, timestamps: list[datetime],
+                   window_days: int = MA_WINDOW_DAYS) -> list:
+    """Time-windowed trailing mean that skips None values in the window."""
+    window = window_days * 86400
+    out = []
+    for i, now in enumerate(timestamps):
+        total = n = 0
+        j = i
+        while j >= 0 and (now - timestamps[j]).total_seconds() <= window:
+            if values[j] is not None:
+                total += values[j]
+                n += 1
+            j -= 1
+        out.append(round(total / n, 2) if n else None)
+    return out
+
+
+def build_dashboard_payload(state: dict, rollup: dict) -> dict:
+    days = [rollup["days"][d] for d in sorted(rollup["days"])]
+    times = [datetime.fromisoformat(e["timestamp"]) for e in days]
+
+    categories: dict[str, None] = {}  # first-seen order, like the old JS Set
+    for e in days:
+        for r in e.get("rankings") or []:
+            categories.setdefault(r["category"])
+    series = []
+    for category in categories:
+        ranks = []
+        for e in days:
+            rank = next((r["rank"] for r in e.get("rankings") or []
+                         if r["category"] == category), None)
+            ranks.append(_js_int(rank) if rank is not None else None)
+        visible = sum(v is not None for v in ranks) >= MA_MIN_POINTS
+        series.append({
+            "category": category,
+            "ranks": ranks,
+            "ma": moving_average(ranks, times) if visible else None,
+        })
+
+    best = sorted(rollup["best"].items(), key=lambda kv: kv[1][0])
+    return {
+        **{k: state.get(k) for k in ("slug", "display_name", *STATE_FIELDS)},
+        "timestamps": [e["timestamp"] for e in days],
+        "amazon_review_count": [_js_int(e.get("amazon_review_count")) or 0 for e in days],
+        "goodreads_ratings_count": [_js_int(e.get("goodreads_ratings_count")) or 0 for e in days],
+        "goodreads_reviews_count": [_js_int(e.get("goodreads_reviews_count")) or 0 for e in days],
+        "series": series,
+        "best_ranks": [{"category": c, "rank": rank, "timestamp": ts}
+                       for c, (rank, ts) in best],
+        "latest": days[-1] if days else None,
+    }
+
+
+# ---------- Chunked dashboard data ----------
+#
+# In chunked mode the page embeds only a manifest: the payload's summary
+# fields plus a list of per-month data files written to <slug>/data/. The
+# page fetches the chunks covering the selected range. Every chunk also gets
+# precompressed .gz (and .br, when brotli is installed) siblings so a static
+# server can serve them without compressing on the fly; chunks whose bytes
+# did not change are left untouched.
+
+CHUNK_DIR = "data"
+DAILY_FIELDS = ("timestamps", "amazon_review_count",
+                "goodreads_ratings_count", "goodreads_reviews_count")
+
+
+def split_payload_by_month(payload: dict) -> tuple[dict, dict[str, dict]]:
+    """(manifest, {"YYYY-MM": chunk}) from a full dashboard payload."""
+    months: dict[str, list[int]] = {}
+    for i, ts in enumerate(payload["timestamps"]):
+        months.setdefault(ts[:7], []).append(i)
+
+    chunks = {}
+    for month, idx in months.items():
+        lo, hi = idx[0], idx[-1] + 1
+        chunk = {k: payload[k][lo:hi] for k in DAILY_FIELDS}
+        chunk["ranks"] = [s["ranks"][lo:hi] for s in payload["series"]]
+        chunk["ma"] = [s["ma"][lo:hi] if s["ma"] is not None else None for s in payload["series"]]
+        chunks[month] = chunk
+
+    manifest = {k: v for k, v in payload.items() if k not in DAILY_FIELDS and k != "series"}
+    manifest["categories"] = [s["category"] for s in payload["series"]]
+    manifest["initial_months"] = CHUNK_INITIAL_MONTHS
+    manifest["chunks"] = [
+        {"month": month, "file": f"{CHUNK_DIR}/{month}.json",
+         "first": chunk["timestamps"][0], "last": chunk["timestamps"][-1]}
+        for month, chunk in sorted(chunks.items())
+    ]
+    return manifest, chunks
+
+
+def _write_if_changed(path: Path, data: bytes) -> bool:
+    try:
+        if path.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        pass
+    with open_atomic(path) as f:
+        f.write(data)
+    return True
+
+
+def write_precompressed(path: Path, data: bytes) -> None:
+    """Write `data` plus .gz/.br siblings, skipping all three if unchanged."""
+    if not _write_if_changed(path, data) and path.with_name(path.name + ".gz").exists():
+        return
+    _write_if_changed(path.with_name(path.name + ".gz"), gzip.compress(data, 9, mtime=0))
+    if HAVE_BROTLI:
+        _write_if_changed(path.with_name(path.name + ".br"), brotli.compress(data))
+
+
+def write_chunks(book_dir: Path, payload: dict) -> dict:
+    """Write a book's chunk files and manifest; returns the manifest."""
+    manifest, chunks = split_payload_by_month(payload)
+    chunk_dir = book_dir / CHUNK_DIR
+    for month, chunk in chunks.items():
+        write_precompressed(chunk_dir / f"{month}.json", _compact_json(chunk))
+    write_precompressed(chunk_dir / "manifest.json", _compact_json(manifest))
+
+    # Months that vanished (history rewritten) must not linger.
+    keep = {f"{m}.json" for m in chunks} | {"manifest.json"}
+    for path in chunk_dir.glob("*.json*"):
+        if path.name.split(".json")[0] + ".json" not in keep:
+            path.unlink()
+    return manifest
+
+
+def _compact_json(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
 
 
 # ---------- Dashboard generation ----------
 
-def generate_book_dashboard(book: dict, output_dir: Path) -> bool:
+DATA_PLACEHOLDER = "{{DATA_PLACEHOLDER}}"
+ASSETS_DIR = "assets"
+BUNDLE_RE = re.compile(rb"<(style|script) data-bundle>(.*?)</\1>", re.DOTALL)
+
+
+class Template(NamedTuple):
+    prefix: bytes
+    suffix: bytes
+    sha256: str
+    assets: dict[str, bytes]     # shared file name -> contents (bundled mode only)
+
+
+_template_cache: dict[tuple, Template] = {}
+
+
+def load_template() -> Template:
+    """The template split at DATA_PLACEHOLDER, read once per revision.
+
+    Pages are written as prefix + data + suffix. With BUNDLE_ASSETS, every
+    `data-bundle` <style>/<script> block is swapped for a reference to
+    assets/dashboard.<content hash>.css|js, shared (and cacheable) across
+    books; the per-book page is left with little more than its data.
+    """
+    key = (TEMPLATE_FILE, TEMPLATE_FILE.stat().st_mtime_ns, BUNDLE_ASSETS)
+    if key not in _template_cache:
+        raw = TEMPLATE_FILE.read_bytes()
+        sha = hashlib.sha256(raw).hexdigest()
+        assets: dict[str, bytes] = {}
+
+        def externalize(m: re.Match) -> bytes:
+            kind, body = m.group(1), m.group(2)
+            ext = "css" if kind == b"style" else "js"
+            name = f"dashboard.{hashlib.sha256(body).hexdigest()[:16]}.{ext}"
+            assets[name] = body
+            href = f"../{ASSETS_DIR}/{name}".encode()
+            if kind == b"style":
+                return b'<link rel="stylesheet" href="' + href + b'">'
+            return b'<script src="' + href + b'"></script>'
+
+        if BUNDLE_ASSETS:
+            raw = BUNDLE_RE.sub(externalize, raw)
+        prefix, sep, suffix = raw.partition(DATA_PLACEHOLDER.encode())
+        if not sep:
+            raise SystemExit(f"error: {TEMPLATE_FILE} has no {DATA_PLACEHOLDER}")
+        _template_cache.clear()
+        _template_cache[key] = Template(prefix, suffix, sha, assets)
+    return _template_cache[key]
+
+
+def write_assets(output_dir: Path, assets: dict[str, bytes]) -> None:
+    # Names are content hashes, so an existing file already has these bytes.
+    for name, body in assets.items():
+        path = output_dir / ASSETS_DIR / name
+        if not path.exists():
+            write_precompressed(path, body)
+
+
+def render_fingerprint(book: dict) -> str:
+    return hashlib.sha256("\0".join((
+        load_template().sha256, RENDER_MODE, str(BUNDLE_ASSETS),
+        book["display_name"], history_fingerprint(book["slug"]),
+    )).encode("utf-8")).hexdigest()
+
+
+def write_text_atomic(path: Path, text: str) -> None:
+    with open_atomic(path) as f:
+        f.write(text.encode("utf-8"))
+
+
+@contextmanager
+def open_atomic(path: Path):
+    """Binary file at a temp name, moved over `path` only if the block succeeds."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = tempfile.NamedTemporaryFile(
+        dir=path.parent, prefix=f".{path.name}.", suffix=".tmp", delete=False,
+    )
+    try:
+        yield tmp
+    except BaseException:
+        tmp.close()
+        os.unlink(tmp.name)
+        raise
+    tmp.close()
+    os.replace(tmp.name, path)
+
+
+def generate_book_dashboard(book: dict, output_dir: Path, force: bool = False) -> str | None:
+    """Render <slug>/index.html if its inputs changed.
+
+    Returns "rendered", "unchanged", or None when the book has no history yet.
+    The inputs' fingerprint (template + history) is kept next to the page in
+    .index.html.inputs; a matching fingerprint skips the render entirely.
+    """
     slug = book["slug"]
-    data_path = DATA_DIR / f"{slug}.json"
-    if not data_path.exists():
-        return False
-    template = TEMPLATE_FILE.read_text()
-    html = template.replace("{{DATA_PLACEHOLDER}}", data_path.read_text())
+    if not has_history(slug):
+        return None
     dest = output_dir / slug / "index.html"
-    dest.parent.mkdir(parents=True, exist_ok=True)
-    dest.write_text(html)
-    return True
+    marker = dest.with_name(".index.html.inputs")
+    fingerprint = render_fingerprint(book)
+    if not force and dest.exists() and marker.exists() and marker.read_text() == fingerprint:
+        return "unchanged"
+
+    payload = build_dashboard_payload(load_state(slug, book["display_name"]), update_rollup(slug))
+    if RENDER_MODE == "chunked":
+        payload = write_chunks(dest.parent, payload)
+    template = load_template()
+    write_assets(output_dir, template.assets)
+    with open_atomic(dest) as out:
+        out.write(template.prefix)
+        out.write(_compact_json(payload))
+        out.write(template.suffix)
+    write_text_atomic(marker, fingerprint)
+    return "rendered"
+
+
+def render_book(book: dict, output_dir: Path, log: logging.Logger,
+                force: bool = False) -> str | None:
+    """generate_book_dashboard(), timed into the scrape log and RUN_METRICS."""
+    started = time.perf_counter()
+    status = generate_book_dashboard(book, output_dir, force=force)
+    if status is not None:
+        elapsed = time.perf_counter() - started
+        RUN_METRICS.observe("amazon_scrape_phase_seconds", elapsed,
+                            phase="render" if status == "rendered" else "render_skip")
+        log.info("render", extra={"extra_fields": {
+            "slug": book["slug"], "status": status, "total_ms": round(elapsed * 1000, 1),
+        }})
+    return status
 
 
 def generate_top_index(books: list[dict], output_dir: Path) -> None:
@@ -390,7 +2479,7 @@ def generate_top_index(books: list[dict], output_dir: Path) -> None:
     for b in books:
         slug = b["slug"]
         name = b["display_name"]
-        if (DATA_DIR / f"{slug}.json").exists():
+        if has_history(slug):
             rows.append(f'      <li><a href="{slug}/">{name}</a></li>')
         else:
             rows.append(f'      <li>{name} <em>(pending first scrape)</em></li>')
@@ -423,36 +2512,382 @@ def generate_top_index(books: list[dict], output_dir: Path) -> None:
     (output_dir / "index.html").write_text(html)
 
 
+# ---------- Daemon ----------
+
+def book_interval(book: dict) -> float:
+    """Seconds between scrapes of `book` in daemon mode."""
+    return book.get("interval_minutes", DEFAULT_INTERVAL_MINUTES) * 60.0
+
+
+def _interval_config(book: dict) -> tuple:
+    return tuple(book.get(k) for k in
+                 ("interval_minutes", "min_interval_minutes", "max_interval_minutes"))
+
+
+class AdaptiveInterval:
+    """Volatility-driven scrape interval, clamped to a book's min/max.
+
+    The starting interval is the median spacing of the book's recent entries
+    (entries are only appended when something changed). After that, a scrape
+    that appended shortens the interval and a "no-change" one lengthens it;
+    failed attempts leave it alone.
+    """
+
+    def __init__(self, min_minutes: float = ADAPTIVE_MIN_MINUTES,
+                 max_minutes: float = ADAPTIVE_MAX_MINUTES) -> None:
+        self.min_minutes = min_minutes
+        self.max_minutes = max_minutes
+
+    def bounds(self, book: dict) -> tuple[float, float]:
+        lo = book.get("min_interval_minutes", self.min_minutes) * 60.0
+        hi = book.get("max_interval_minutes", self.max_minutes) * 60.0
+        return lo, max(lo, hi)
+
+    def clamp(self, book: dict, seconds: float) -> float:
+        lo, hi = self.bounds(book)
+        return min(max(seconds, lo), hi)
+
+    def seed(self, book: dict) -> float:
+        recent = read_tail_entries(book["slug"], ADAPTIVE_SEED_ENTRIES)
+        times = [datetime.fromisoformat(e["timestamp"]) for e in recent]
+        gaps = [(b - a).total_seconds() for a, b in zip(times, times[1:])]
+        return self.clamp(book, statistics.median(gaps) if gaps else book_interval(book))
+
+    def adjust(self, book: dict, seconds: float, status: str | None) -> float:
+        if status == "appended":
+            seconds *= ADAPTIVE_SPEEDUP
+        elif status == "no-change":
+            seconds *= ADAPTIVE_BACKOFF
+        return self.clamp(book, seconds)
+
+
+class BookScheduler:
+    """Min-heap of per-book due times (time.monotonic() seconds).
+
+    Rescheduling pushes a new heap item instead of removing the old one;
+    stale items are recognised by not matching `_due` and dropped when popped.
+    With a `policy`, each book's interval adapts to its scrape outcomes;
+    otherwise it is the book's fixed interval_minutes.
+    """
+
+    def __init__(self, policy: AdaptiveInterval | None = None) -> None:
+        self.policy = policy
+        self._heap: list[tuple[float, str]] = []
+        self._due: dict[str, float] = {}
+        self._last_run: dict[str, float] = {}
+        self._interval: dict[str, float] = {}
+        self.books: dict[str, dict] = {}
+
+    def interval(self, book: dict) -> float:
+        if self.policy is None:
+            return book_interval(book)
+        slug = book["slug"]
+        if slug not in self._interval:
+            self._interval[slug] = self.policy.seed(book)
+        return self._interval[slug]
+
+    def _push(self, slug: str, due: float) -> None:
+        self._due[slug] = due
+        heapq.heappush(self._heap, (due, slug))
+
+    def sync(self, books: list[dict], now: float) -> None:
+        """Adopt a (re)loaded config: new books are due now, removed ones are
+        dropped, and books whose interval changed are re-timed from their last run."""
+        previous = self.books
+        self.books = {b["slug"]: b for b in books}
+        for slug in previous.keys() - self.books.keys():
+            self._due.pop(slug, None)
+            self._last_run.pop(slug, None)
+            self._interval.pop(slug, None)
+        for slug, book in self.books.items():
+            if slug not in previous:
+                self._push(slug, now)
+            elif _interval_config(book) != _interval_config(previous[slug]) \
+                    and slug in self._last_run:
+                self._interval.pop(slug, None)
+                self._push(slug, self._last_run[slug] + self.interval(book))
+
+    def pop_due(self, now: float) -> list[dict]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            when, slug = heapq.heappop(self._heap)
+            if self._due.get(slug) == when:
+                del self._due[slug]
+                due.append(self.books[slug])
+        return due
+
+    def done(self, book: dict, now: float, status: str | None = None) -> float | None:
+        """Schedule `book`'s next run after an attempt that ended with `status`
+        (the state's last_attempt_status); returns the interval used."""
+        slug = book["slug"]
+        if slug not in self.books:
+            return None
+        book = self.books[slug]
+        interval = self.interval(book)
+        if self.policy is not None:
+            interval = self._interval[slug] = self.policy.adjust(book, interval, status)
+        self._last_run[slug] = now
+        self._push(slug, now + interval)
+        return interval
+
+    def seconds_until_next(self, now: float) -> float | None:
+        return max(0.0, min(self._due.values()) - now) if self._due else None
+
+
+def run_daemon(output_dir: Path, log: logging.Logger, workers: int,
+               stop: threading.Event | None = None,
+               policy: AdaptiveInterval | None = None,
+               metrics_file: Path | None = None) -> None:
+    """Scrape each book on its own interval until `stop` is set (or Ctrl-C).
+
+    Sessions, the HTTP cache and the parsed template stay warm across cycles.
+    books.json is re-read whenever its mtime changes; an invalid edit is
+    reported and the previous config kept. After each batch only the scraped
+    books' dashboards and the top index are re-rendered.
+    """
+    stop = stop or threading.Event()
+    scheduler = BookScheduler(policy)
+    config_mtime = None
+    while not stop.is_set():
+        try:
+            mtime = BOOKS_FILE.stat().st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != config_mtime:
+            config_mtime = mtime
+            try:
+                books = load_books()
+            except (SystemExit, ValueError, OSError) as e:
+                # Keep scheduling the books from the last good config.
+                log.error("config", extra={"extra_fields": {"error": str(e)}})
+                print(f"books.json not reloaded: {e}", file=sys.stderr)
+            else:
+                scheduler.sync(books, time.monotonic())
+                generate_top_index(books, output_dir)
+                print(f"Loaded {len(books)} book(s) from {BOOKS_FILE}")
+
+        due = scheduler.pop_due(time.monotonic())
+        if not due:
+            wait = scheduler.seconds_until_next(time.monotonic())
+            stop.wait(DAEMON_POLL_SECONDS if wait is None else min(wait, DAEMON_POLL_SECONDS))
+            continue
+
+        cycle_started = time.perf_counter()
+        scrape_all(due, log, workers)
+        log_run_stats(log, reset=True)
+        for book in due:
+            status = load_state(book["slug"], book["display_name"])["last_attempt_status"]
+            interval = scheduler.done(book, time.monotonic(), status)
+            if policy is not None and interval is not None:
+                log.info("schedule", extra={"extra_fields": {
+                    "slug": book["slug"], "status": status,
+                    "interval_minutes": round(interval / 60, 1),
+                }})
+            try:
+                status = render_book(book, output_dir, log)
+            except Exception:
+                log.exception("render crash", extra={"extra_fields": {"slug": book["slug"]}})
+                continue
+            if status:
+                print(f"[{book['slug']}] dashboard {status}")
+        generate_top_index(list(scheduler.books.values()), output_dir)
+        write_run_metrics(metrics_file, time.perf_counter() - cycle_started)
+
+
 # ---------- Main ----------
 
 def main() -> int:
+    global HTTP_POOL_SIZE, HTTP_CACHE, PARSER_BACKEND, EXTRACT_MODE, STORAGE_BACKEND, RENDER_MODE
+    global BUNDLE_ASSETS, ARCHIVE, LOG_ENCODING, HOT_DAYS, DOWNSAMPLE_RULES, COLD_COMPRESSION
     parser = argparse.ArgumentParser(description="Amazon Book Ranking Tracker")
     parser.add_argument("--output-dir", "-o", default=".",
                         help="Output directory for dashboards (default: current directory)")
     parser.add_argument("--skip-scrape", action="store_true",
                         help="Skip scraping; regenerate dashboards from existing data only")
+    parser.add_argument("--render-mode", choices=("inline", "chunked"), default=RENDER_MODE,
+                        help="inline: embed the whole payload in each page; chunked: write "
+                             "per-month data files (+ .gz/.br) fetched on demand (needs HTTP)")
+    parser.add_argument("--bundle-assets", action="store_true",
+                        help=f"Serve the dashboard CSS/JS from shared content-hashed files in "
+                             f"<output-dir>/{ASSETS_DIR}/ instead of inlining them in every page")
+    parser.add_argument("--force-render", action="store_true",
+                        help="Re-render every dashboard even if its inputs are unchanged")
+    parser.add_argument("--compact", action="store_true",
+                        help="Compact every book's entries log (drop torn lines and "
+                             "consecutive duplicates), then exit")
+    parser.add_argument("--storage", choices=("files", "sqlite"), default=STORAGE_BACKEND,
+                        help="History backend: files (data/<slug>.json + .jsonl) or "
+                             f"sqlite (data/{SQLITE_FILE})")
+    parser.add_argument("--log-encoding", choices=("plain", "delta"), default=LOG_ENCODING,
+                        help="How new entries are written to data/<slug>.jsonl: plain JSON "
+                             "objects, or delta (keyframes every "
+                             f"{KEYFRAME_INTERVAL} lines + per-entry changes). Both are "
+                             "always readable; --compact rewrites a log in this encoding")
+    parser.add_argument("--seal", action="store_true",
+                        help="Move entries older than --hot-days into compressed cold segments "
+                             "(data/<slug>.cold/), thinning old data per --downsample, then exit")
+    parser.add_argument("--hot-days", type=float, default=HOT_DAYS, metavar="DAYS",
+                        help=f"Age at which --seal moves entries out of the hot log "
+                             f"(default {HOT_DAYS})")
+    parser.add_argument("--downsample", action="append", metavar="DAYS:SECONDS",
+                        help="With --seal: keep one entry per SECONDS once entries are DAYS old; "
+                             "repeatable (default "
+                             f"{','.join(f'{d}:{sec}' for d, sec in DOWNSAMPLE_RULES)}; "
+                             "'none' keeps everything)")
+    parser.add_argument("--cold-compression", default=COLD_COMPRESSION,
+                        choices=("gzip", "zstd") if HAVE_ZSTD else ("gzip",),
+                        help="Compression for new cold segments (zstd needs zstandard)")
+    parser.add_argument("--import-json", action="store_true",
+                        help="Import every book's file-backed history into the SQLite "
+                             "database, then exit")
+    parser.add_argument("--archive", action="store_true",
+                        help=f"Keep every fetched page in a deduplicated gzip archive "
+                             f"({ARCHIVE_DIR.relative_to(ROOT)}/) for --reextract")
+    parser.add_argument("--reextract", action="store_true",
+                        help="Rebuild every book's history from the page archive with the "
+                             "current extractors (in --parse-workers processes), then exit")
+    parser.add_argument("--workers", "-w", type=int, default=1,
+                        help="Books scraped concurrently (default: 1, serial with a fixed "
+                             "delay between books)")
+    parser.add_argument("--parse-workers", type=int, default=None, metavar="N",
+                        help="Processes that parse fetched pages (default: one per CPU when "
+                             "--workers > 1, otherwise 0 = parse in-process)")
+    parser.add_argument("--no-http-cache", action="store_true",
+                        help="Disable the on-disk conditional-request cache")
+    parser.add_argument("--parser", choices=available_parsers(), default=PARSER_BACKEND,
+                        help="HTML parser backend: html.parser (pure Python), lxml, or "
+                             "partial (builds only the regions the extractors read)")
+    parser.add_argument("--extract", choices=("fast", "dom"), default=EXTRACT_MODE,
+                        help="Amazon extraction: fast (byte scan, DOM only as fallback) or dom")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Keep running: scrape each book every interval_minutes "
+                             f"(books.json; default {DEFAULT_INTERVAL_MINUTES}), re-render "
+                             "its dashboard, and pick up books.json edits without a restart")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="With --daemon: scrape often while a book's data keeps changing "
+                             "and back off while it doesn't, between --min-interval and "
+                             "--max-interval")
+    parser.add_argument("--min-interval", type=float, default=ADAPTIVE_MIN_MINUTES,
+                        metavar="MINUTES", help="Shortest adaptive interval "
+                                                "(per book: min_interval_minutes)")
+    parser.add_argument("--max-interval", type=float, default=ADAPTIVE_MAX_MINUTES,
+                        metavar="MINUTES", help="Longest adaptive interval "
+                                                "(per book: max_interval_minutes)")
+    parser.add_argument("--metrics-file", type=Path, default=METRICS_FILE, metavar="PATH",
+                        help="Prometheus text file for run-level phase-timing histograms, "
+                             "e.g. in node_exporter's textfile directory (default: "
+                             f"{METRICS_FILE.relative_to(ROOT)}; '' disables)")
+    parser.add_argument("--show-inflight", action="store_true",
+                        help=f"Print in-flight requests to stderr every "
+                             f"{IN_FLIGHT_REPORT_INTERVAL:g}s while scraping")
     args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be >= 1")
+    if args.parse_workers is None:
+        args.parse_workers = (os.cpu_count() or 1) if args.workers > 1 or args.reextract else 0
+    if args.parse_workers < 0:
+        parser.error("--parse-workers must be >= 0")
+    if not 0 < args.min_interval <= args.max_interval:
+        parser.error("need 0 < --min-interval <= --max-interval")
+    metrics_file = args.metrics_file if str(args.metrics_file) not in ("", ".") else None
+    if args.hot_days < 0:
+        parser.error("--hot-days must be >= 0")
+    if args.downsample:
+        try:
+            DOWNSAMPLE_RULES = tuple(
+                (float(days), int(seconds))
+                for days, seconds in (rule.split(":") for rule in args.downsample if rule != "none"))
+        except ValueError:
+            parser.error("--downsample takes DAYS:SECONDS (or 'none')")
+        if any(days < 0 or seconds <= 0 for days, seconds in DOWNSAMPLE_RULES):
+            parser.error("--downsample needs DAYS >= 0 and SECONDS > 0")
+
+    HTTP_POOL_SIZE = args.workers
+    PARSER_BACKEND = args.parser
+    EXTRACT_MODE = args.extract
+    STORAGE_BACKEND = args.storage
+    LOG_ENCODING = args.log_encoding
+    HOT_DAYS = args.hot_days
+    COLD_COMPRESSION = args.cold_compression
+    RENDER_MODE = args.render_mode
+    BUNDLE_ASSETS = args.bundle_assets
+    if args.no_http_cache:
+        HTTP_CACHE = None
+    if args.archive:
+        ARCHIVE = PageArchive(ARCHIVE_DIR)
 
     log = get_logger()
     books = load_books()
     output_dir = Path(args.output_dir).resolve()
 
+    if args.import_json:
+        for book in books:
+            print(f"[{book['slug']}] imported {import_into_sqlite(book)} entries "
+                  f"into {DATA_DIR / SQLITE_FILE}")
+        return 0
+
+    if args.reextract:
+        archive = PageArchive(ARCHIVE_DIR)
+        scrapes = archived_scrapes(archive)
+        with parse_pool(args.parse_workers):
+            for book in books:
+                replayed, written = reextract_book(
+                    book, archive, PARSE_POOL, REEXTRACT_WINDOW * max(args.parse_workers, 1),
+                    scrapes.get(book["slug"], []))
+                print(f"[{book['slug']}] re-extracted {replayed} archived scrapes "
+                      f"-> {written} entries")
+        return 0
+
+    if args.seal:
+        for book in books:
+            stats = seal_history(book)
+            if stats is None:
+                print(f"[{book['slug']}] not sealed: the sqlite backend keeps one table")
+                continue
+            print(f"[{book['slug']}] sealed {stats['sealed']} entries, dropped "
+                  f"{stats['dropped']} by downsampling, wrote {stats['segments']} segments")
+        return 0
+
+    if args.compact:
+        for book in books:
+            before, after = compact_history(book)
+            print(f"[{book['slug']}] compacted: {before} -> {after} entries")
+        return 0
+
+    if args.daemon:
+        if args.show_inflight:
+            threading.Thread(target=report_in_flight, args=(threading.Event(),),
+                             daemon=True).start()
+        try:
+            policy = (AdaptiveInterval(args.min_interval, args.max_interval)
+                      if args.adaptive else None)
+            with parse_pool(args.parse_workers):
+                run_daemon(output_dir, log, args.workers, policy=policy,
+                           metrics_file=metrics_file)
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    run_started = time.perf_counter()
     if not args.skip_scrape:
-        for i, book in enumerate(books):
-            try:
-                scrape_book(book, log)
-            except Exception as e:
-                log.exception("scrape crash", extra={"extra_fields": {"slug": book["slug"]}})
-                print(f"[{book['slug']}] crash: {e}", file=sys.stderr)
-            if i < len(books) - 1:
-                time.sleep(INTER_BOOK_DELAY)
+        stop_reporter = threading.Event()
+        if args.show_inflight:
+            threading.Thread(target=report_in_flight, args=(stop_reporter,), daemon=True).start()
+        try:
+            with parse_pool(args.parse_workers):
+                scrape_all(books, log, args.workers)
+        finally:
+            stop_reporter.set()
+        log_run_stats(log)
 
     for book in books:
-        if generate_book_dashboard(book, output_dir):
-            print(f"[{book['slug']}] dashboard: {output_dir}/{book['slug']}/index.html")
+        status = render_book(book, output_dir, log, force=args.force_render)
+        if status:
+            print(f"[{book['slug']}] dashboard {status}: {output_dir}/{book['slug']}/index.html")
 
     generate_top_index(books, output_dir)
     print(f"Top-level index: {output_dir}/index.html")
+    write_run_metrics(metrics_file, time.perf_counter() - run_started)
     return 0
 
 
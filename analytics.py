@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+analytics.py — cross-book queries over every history in books.json.
+
+Each book's history is loaded once into column arrays: entry times (epoch
+seconds), the three counts, and the rankings in long form (entry row,
+category id, rank). Category names are interned to small integers shared by
+every book. Loaded books are cached in-process, keyed by the (size, mtime) of
+their history files, so a repeated query only reloads books that changed.
+Corrections from clean_goodreads_data.py are applied, as on the dashboards.
+
+Queries put the books on one time grid and work on whole columns: numpy when
+it is installed, the stdlib `array` columns and plain loops otherwise.
+
+    import analytics
+    books = analytics.load_all()
+    reviews = analytics.resample(books, "amazon_review_count", step=86400)
+    analytics.velocity(reviews)                 # reviews/day, per book and day
+    analytics.percentiles(reviews, [50, 90])    # across books, per day
+    analytics.correlation(analytics.resample(books, "rank:Books"))
+
+Usage:
+  python analytics.py                                  # last 30 days of review counts
+  python analytics.py --field rank:Books --days 90 --step-hours 6
+"""
+from __future__ import annotations
+
+import argparse
+import bisect
+import math
+import sys
+import warnings
+from array import array
+from datetime import datetime
+from typing import NamedTuple
+
+import amazon
+
+try:
+    import numpy as np  # optional: vectorized queries
+    HAVE_NUMPY = True
+except ImportError:
+    HAVE_NUMPY = False
+
+COUNT_FIELDS = ("amazon_review_count", "goodreads_ratings_count", "goodreads_reviews_count")
+RANK_PREFIX = "rank:"        # field names "rank:<category>" select one category's ranks
+DEFAULT_STEP = 86400         # resampling bin width, seconds
+NAN = float("nan")
+
+
+def _epoch(timestamp: str) -> float:
+    return (datetime.fromisoformat(timestamp) - amazon._EPOCH).total_seconds()
+
+
+def _view(column: array, dtype):
+    """Zero-copy numpy view of an `array` column."""
+    return np.frombuffer(column, dtype=dtype) if len(column) else np.empty(0, dtype=dtype)
+
+
+# ---------- Columns ----------
+
+class CategoryIndex:
+    """Interns category names as dense integer ids shared by all books."""
+
+    def __init__(self):
+        self.names: list[str] = []
+        self.ids: dict[str, int] = {}
+
+    def intern(self, name: str) -> int:
+        cid = self.ids.get(name)
+        if cid is None:
+            cid = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return cid
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+CATEGORIES = CategoryIndex()
+
+
+class BookSeries:
+    """One book's history as columns; row i of each entry column is entry i."""
+
+    def __init__(self, slug: str, entries):
+        self.slug = slug
+        self.times = array("d")
+        self.counts = {field: array("d") for field in COUNT_FIELDS}
+        self.rank_row = array("q")
+        self.rank_cat = array("q")
+        self.rank_val = array("d")
+        for row, entry in enumerate(entries):
+            self.times.append(_epoch(entry["timestamp"]))
+            for field, column in self.counts.items():
+                v = amazon._js_int(entry.get(field))
+                column.append(NAN if v is None else v)
+            for r in entry.get("rankings") or []:
+                rank = amazon._js_int(r["rank"])
+                if rank is not None:
+                    self.rank_row.append(row)
+                    self.rank_cat.append(CATEGORIES.intern(r["category"]))
+                    self.rank_val.append(rank)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def categories(self) -> set[int]:
+        return set(self.rank_cat)
+
+    def column(self, field: str):
+        """(times, values) of one field's observations, missing ones dropped."""
+        if field.startswith(RANK_PREFIX):
+            cid = CATEGORIES.ids.get(field[len(RANK_PREFIX):], -1)
+            if HAVE_NUMPY:
+                mask = _view(self.rank_cat, np.int64) == cid
+                rows = _view(self.rank_row, np.int64)[mask]
+                return _view(self.times, np.float64)[rows], _view(self.rank_val, np.float64)[mask]
+            picked = [(self.times[row], v) for row, c, v in
+                      zip(self.rank_row, self.rank_cat, self.rank_val) if c == cid]
+        elif field in self.counts:
+            if HAVE_NUMPY:
+                values = _view(self.counts[field], np.float64)
+                keep = ~np.isnan(values)
+                return _view(self.times, np.float64)[keep], values[keep]
+            picked = [(t, v) for t, v in zip(self.times, self.counts[field]) if not math.isnan(v)]
+        else:
+            raise ValueError(f"unknown field {field!r} (use one of {COUNT_FIELDS} or 'rank:<category>')")
+        return [t for t, _ in picked], [v for _, v in picked]
+
+
+# ---------- Loading ----------
+
+_CACHE: dict[str, tuple[list, BookSeries]] = {}
+
+
+def history_stamp(slug: str) -> list:
+    """Changes whenever a book's entries or corrections do; stat() calls only."""
+    if (db := amazon.sqlite_history()) is not None:
+        return ["sqlite", db.last_snapshot_id(slug), amazon._patch_stamp(slug)]
+    return [amazon._log_stamp(slug), amazon._cold_stamp(slug), amazon._patch_stamp(slug)]
+
+
+def load_book(slug: str) -> BookSeries:
+    key = str(amazon.entries_path(slug))
+    stamp = history_stamp(slug)
+    cached = _CACHE.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    patches = amazon.load_patches(slug)
+    series = BookSeries(slug, (amazon.apply_patches(e, patches) for e in amazon.iter_entries(slug)))
+    _CACHE[key] = (stamp, series)
+    return series
+
+
+def load_all(books: list[dict] | None = None) -> list[BookSeries]:
+    """Every book in books.json (or `books`), from the cache where unchanged."""
+    return [load_book(b["slug"]) for b in (amazon.load_books() if books is None else books)]
+
+
+# ---------- Queries ----------
+
+class Frame(NamedTuple):
+    """One field of several books on a shared grid: values[book][bin]."""
+    field: str
+    step: float
+    slugs: list[str]
+    times: list[float]    # bin start, epoch seconds
+    values: object        # numpy 2-D array, or a list of lists without numpy
+
+    def rows(self) -> list[list[float]]:
+        return self.values.tolist() if HAVE_NUMPY else self.values
+
+
+def resample(books: list[BookSeries], field: str, step: float = DEFAULT_STEP,
+             start: float | None = None, end: float | None = None) -> Frame:
+    """Each book's `field` as of the end of every `step`-second bin.
+
+    A bin holds the last observation before its end (carried forward through
+    bins without one); NaN before a book's first observation. The grid is
+    aligned to multiples of `step` and spans all books unless bounded.
+    """
+    columns = [b.column(field) for b in books]
+    observed = [t for t, _ in columns if len(t)]
+    if start is None:
+        start = min((t[0] for t in observed), default=0.0)
+    if end is None:
+        end = max((t[-1] for t in observed), default=start)
+    first = math.floor(start / step) * step
+    nbins = max(1, math.floor((end - first) / step) + 1)
+    times = [first + i * step for i in range(nbins)]
+
+    if HAVE_NUMPY:
+        edges = first + step * np.arange(1, nbins + 1)
+        values = np.full((len(books), nbins), np.nan)
+        for i, (t, v) in enumerate(columns):
+            if len(t):
+                idx = np.searchsorted(t, edges, side="left") - 1
+                values[i] = np.where(idx >= 0, v[np.clip(idx, 0, None)], np.nan)
+        return Frame(field, step, [b.slug for b in books], times, values)
+
+    values = []
+    for t, v in columns:
+        row = []
+        for k in range(nbins):
+            idx = bisect.bisect_left(t, first + (k + 1) * step) - 1
+            row.append(v[idx] if idx >= 0 else NAN)
+        values.append(row)
+    return Frame(field, step, [b.slug for b in books], times, values)
+
+
+def velocity(frame: Frame, per: float = 86400):
+    """Change per `per` seconds between consecutive bins (NaN in the first)."""
+    scale = per / frame.step
+    if HAVE_NUMPY:
+        out = np.full(frame.values.shape, np.nan)
+        out[:, 1:] = np.diff(frame.values, axis=1) * scale
+        return out
+    return [[NAN] + [(b - a) * scale for a, b in zip(row, row[1:])] for row in frame.values]
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+    # numpy's default "linear" method.
+    if not ordered:
+        return NAN
+    pos = (len(ordered) - 1) * q / 100
+    lo = math.floor(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def percentiles(frame: Frame, qs: list[float]):
+    """Percentiles across books for every bin: result[q index][bin]."""
+    if HAVE_NUMPY:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # bins no book has reached
+            return np.nanpercentile(frame.values, qs, axis=0)
+    by_bin = [sorted(v for v in column if not math.isnan(v)) for column in zip(*frame.values)]
+    return [[_percentile(ordered, q) for ordered in by_bin] for q in qs]
+
+
+def correlation(frame: Frame, min_overlap: int = 3):
+    """Pearson correlation between books over the bins both have values for;
+    NaN for pairs with fewer than `min_overlap` shared bins."""
+    n = len(frame.slugs)
+    if HAVE_NUMPY:
+        out = np.full((n, n), np.nan)
+        present = ~np.isnan(frame.values)
+        for i in range(n):
+            for j in range(i, n):
+                both = present[i] & present[j]
+                if both.sum() >= min_overlap:
+                    x, y = frame.values[i][both], frame.values[j][both]
+                    if x.std() and y.std():
+                        out[i, j] = out[j, i] = np.corrcoef(x, y)[0, 1]
+        return out
+    out = [[NAN] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(i, n):
+            pairs = [(x, y) for x, y in zip(frame.values[i], frame.values[j])
+                     if not (math.isnan(x) or math.isnan(y))]
+            if len(pairs) < min_overlap:
+                continue
+            mx = sum(x for x, _ in pairs) / len(pairs)
+            my = sum(y for _, y in pairs) / len(pairs)
+            sxy = sum((x - mx) * (y - my) for x, y in pairs)
+            sxx = sum((x - mx) ** 2 for x, _ in pairs)
+            syy = sum((y - my) ** 2 for _, y in pairs)
+            if sxx and syy:
+                out[i][j] = out[j][i] = sxy / math.sqrt(sxx * syy)
+    return out
+
+
+def category_overlap(books: list[BookSeries]) -> list[list[int]]:
+    """Number of ranking categories each pair of books shares."""
+    cats = [b.categories() for b in books]
+    return [[len(a & b) for b in cats] for a in cats]
+
+
+# ---------- Main ----------
+
+def _fmt(v: float) -> str:
+    return "-" if v is None or math.isnan(v) else f"{v:,.2f}".rstrip("0").rstrip(".")
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--field", default="amazon_review_count",
+                   help=f"One of {', '.join(COUNT_FIELDS)} or rank:<category>.")
+    p.add_argument("--days", type=float, default=30, help="Window to summarize (default 30).")
+    p.add_argument("--step-hours", type=float, default=24, help="Resampling bin width (default 24).")
+    p.add_argument("--storage", choices=("files", "sqlite"), default=amazon.STORAGE_BACKEND)
+    args = p.parse_args()
+    amazon.STORAGE_BACKEND = args.storage
+
+    books = load_all()
+    ends = [b.times[-1] for b in books if len(b)]
+    if not ends:
+        print("No history yet.")
+        return 0
+    end = max(ends)
+    try:
+        frame = resample(books, args.field, args.step_hours * 3600, start=end - args.days * 86400, end=end)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    rates = velocity(frame)
+    rates = rates.tolist() if HAVE_NUMPY else rates
+
+    print(f"{args.field}, last {args.days:g} days, {args.step_hours:g}h bins")
+    print(f"{'book':<24} {'latest':>10} {'median':>10} {'per day':>10}")
+    for slug, row, rate in zip(frame.slugs, frame.rows(), rates):
+        seen = sorted(v for v in row if not math.isnan(v))
+        changes = [r for r in rate if not math.isnan(r)]
+        latest = row[-1]
+        print(f"{slug:<24} {_fmt(latest):>10} {_fmt(_percentile(seen, 50)):>10} "
+              f"{_fmt(sum(changes) / len(changes) if changes else NAN):>10}")
+
+    overlap = category_overlap(books)
+    pairs = sorted(((overlap[i][j], books[i].slug, books[j].slug)
+                    for i in range(len(books)) for j in range(i + 1, len(books))
+                    if overlap[i][j]), reverse=True)
+    if pairs:
+        print("\nShared ranking categories:")
+        for shared, a, b in pairs[:10]:
+            print(f"  {a} / {b}: {shared}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+"""
+bench.py — end-to-end benchmarks for amazon.py against a local mock server.
+
+Starts a stand-in HTTP server that serves product-sized Amazon and Goodreads
+pages (with configurable latency, error and CAPTCHA rates), generates
+synthetic histories of 1k–1M entries, and times every phase of a run:
+fetch, parse, signature, persist and render, plus a full scrape + render of
+N books. Everything runs in a throwaway data directory; nothing under data/
+is touched.
+
+Results are written as JSON (one summary per phase) so two commits can be
+compared with --compare.
+
+Usage:
+  python bench.py                                  # full run, 1k..1M histories
+  python bench.py --sizes 1000,10000 --books 8 --workers 4
+  python bench.py --latency 0.2 --error-rate 0.05 --captcha-rate 0.01
+  python bench.py --compare bench_results/old.json bench_results/new.json
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import islice
+from pathlib import Path
+from unittest import mock
+
+import amazon
+
+RESULTS_DIR = amazon.ROOT / "bench_results"
+RESULTS_VERSION = 1
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+CATEGORIES = ("Books", "General Japan Travel Guides", "Traveler & Explorer Biographies",
+              "Memoirs", "Travel Writing")
+APPEND_SAMPLES = 200         # fsync'd single-entry appends timed per history size
+SIGNATURE_BATCH = 10_000     # entries decoded, then signed, per timed batch
+PARSE_SAMPLES = 50
+
+
+# ---------- Synthetic pages ----------
+
+def _filler(kb: int, seed: int) -> str:
+    # Markup shaped like the bulk of a product page: nested divs, inline
+    # scripts and attribute-heavy spans the extractors have to skip over.
+    rng = random.Random(seed)
+    blocks = []
+    size = 0
+    while size < kb * 1024:
+        n = rng.randrange(10**6)
+        block = (f'<div class="a-section a-spacing-small" data-csa-c-id="{n:x}">'
+                 f'<span class="a-size-base a-color-secondary">Item {n}</span>'
+                 f'<script type="text/javascript">P.when("A").execute(function(A){{'
+                 f'A.state("w{n}",{{"id":{n},"v":"{"x" * rng.randrange(40, 200)}"}});}});'
+                 f'</script></div>\n')
+        blocks.append(block)
+        size += len(block)
+    return "".join(blocks)
+
+
+def product_page(rankings: list[dict], reviews: int, kb: int = 300) -> bytes:
+    """An Amazon product page in the detail-bullets layout, padded to ~`kb` KiB."""
+    first, *subs = rankings
+    items = "".join(f'<li><span class="a-list-item">#{int(r["rank"]):,} in '
+                    f'<a href="/gp/bestsellers/{i}">{r["category"]}</a></span></li>'
+                    for i, r in enumerate(subs))
+    pad = _filler(kb // 2, 1)
+    return f"""<!doctype html><html><head><title>Book</title></head><body>
+{pad}
+<div data-hook="reviews-medley-widget">4.5 out of 5 stars
+  <span data-hook="total-review-count">{reviews:,} global ratings</span></div>
+<div id="detailBulletsWrapper_feature_div"><ul class="detail-bullet-list">
+  <li><span class="a-list-item"><span class="a-text-bold">Best Sellers Rank: </span>
+    #{int(first["rank"]):,} in {first["category"]} (<a href="/best">See Top 100 in Books</a>)
+    <ul class="zg_hrsr">{items}</ul></span></li>
+</ul></div>
+{_filler(kb - kb // 2, 2)}
+</body></html>""".encode()
+
+
+def goodreads_page(ratings: int, reviews: int, kb: int = 150) -> bytes:
+    return f"""<!doctype html><html><body>{_filler(kb, 3)}
+<div class="RatingStatistics__meta">
+  <span data-testid="ratingsCount">{ratings:,}&nbsp;ratings</span>
+  <span data-testid="reviewsCount">{reviews:,}&nbsp;reviews</span>
+</div></body></html>""".encode()
+
+
+CAPTCHA_PAGE = (b'<html><head><title>Robot Check</title></head><body>'
+                b'<form action="/errors/validateCaptcha">Type the characters you see in '
+                b'this image</form></body></html>')
+
+
+def random_rankings(rng: random.Random) -> list[dict]:
+    return [{"rank": str(rng.randrange(1_000, 200_000)), "category": CATEGORIES[0]}] + [
+        {"rank": str(rng.randrange(1, 500)), "category": c} for c in CATEGORIES[1:]]
+
+
+# ---------- Mock server ----------
+
+class MockServer:
+    """Threaded local stand-in for Amazon (/dp/<id>) and Goodreads (/book/show/<id>).
+
+    Every request waits `latency` seconds plus up to `jitter` more, then is
+    answered with a 500 (`error_rate`), a robot-check page (`captcha_rate`),
+    or a freshly generated page whose ranks and counts vary per request.
+    Amazon is served as 127.0.0.1 and Goodreads as localhost, so the two keep
+    separate rate-limit buckets and circuit breakers, as the real hosts do.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 captcha_rate: float = 0.0, page_kb: int = 300, seed: int = 0) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.captcha_rate = captcha_rate
+        self.page_kb = page_kb
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.requests = 0
+        self._httpd: ThreadingHTTPServer | None = None
+
+    def _roll(self) -> tuple[float, float, random.Random]:
+        with self._rng_lock:
+            self.requests += 1
+            return (self._rng.random(), self.latency + self.jitter * self._rng.random(),
+                    random.Random(self._rng.random()))
+
+    def respond(self, path: str) -> tuple[int, bytes]:
+        roll, delay, rng = self._roll()
+        time.sleep(delay)
+        if roll < self.error_rate:
+            return 500, b"<html>Internal Server Error</html>"
+        if roll < self.error_rate + self.captcha_rate:
+            return 200, CAPTCHA_PAGE
+        if path.startswith("/dp/"):
+            return 200, product_page(random_rankings(rng), rng.randrange(1, 5_000), self.page_kb)
+        if path.startswith("/book/show/"):
+            return 200, goodreads_page(rng.randrange(1, 50_000), rng.randrange(1, 5_000),
+                                       self.page_kb // 2)
+        return 404, b"<html>Not Found</html>"
+
+    def __enter__(self) -> MockServer:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"   # keep-alive, like the real hosts
+
+            def do_GET(self):
+                status, body = server.respond(self.path)
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    @property
+    def port(self) -> int:
+        return self._httpd.server_address[1]
+
+    def amazon_url(self, i: int) -> str:
+        return f"http://127.0.0.1:{self.port}/dp/{i}"
+
+    def goodreads_url(self, i: int) -> str:
+        return f"http://localhost:{self.port}/book/show/{i}"
+
+
+# ---------- Synthetic histories ----------
+
+def synthetic_history(n: int, seed: int = 0, start: datetime = datetime(2020, 1, 1),
+                      step_minutes: int = 30):
+    """Yield `n` entries in the shape amazon.py logs: random-walk ranks over
+    CATEGORIES, slowly growing review counts, every entry a change from the last."""
+    rng = random.Random(seed)
+    ranks = {c: rng.randrange(1_000, 100_000) if c == CATEGORIES[0] else rng.randrange(1, 300)
+             for c in CATEGORIES}
+    reviews, ratings, gr_reviews = 10, 100, 20
+    ts = start
+    for _ in range(n):
+        for c in ranks:
+            if c == CATEGORIES[0] or rng.random() < 0.3:
+                ranks[c] = max(1, ranks[c] + rng.randint(-ranks[c] // 10 - 1, ranks[c] // 10 + 1))
+        if rng.random() < 0.05:
+            reviews += 1
+        if rng.random() < 0.1:
+            ratings += rng.randint(1, 3)
+            gr_reviews += rng.random() < 0.3
+        yield {
+            "timestamp": ts.strftime("%Y-%m-%d %H:%M:%S"),
+            "amazon_review_count": str(reviews),
+            "rankings": [{"rank": str(r), "category": c} for c, r in ranks.items()],
+            "goodreads_ratings_count": str(ratings),
+            "goodreads_reviews_count": str(gr_reviews),
+        }
+        ts += timedelta(minutes=step_minutes)
+
+
+# ---------- Timing ----------
+
+class Phase:
+    """Wall-clock samples for one benchmark phase."""
+
+    def __init__(self) -> None:
+        self.samples: list[float] = []
+        self.items = 0
+
+    @contextlib.contextmanager
+    def time(self, items: int = 1):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples.append(time.perf_counter() - started)
+            self.items += items
+
+    def summary(self) -> dict:
+        total = sum(self.samples)
+        out = {"count": self.items, "total_s": round(total, 6),
+               "per_item_us": round(total / self.items * 1e6, 3) if self.items else None}
+        if self.samples:
+            ordered = sorted(self.samples)
+            out.update(p50_ms=round(statistics.median(ordered) * 1e3, 3),
+                       p95_ms=round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1e3, 3),
+                       max_ms=round(ordered[-1] * 1e3, 3))
+        return out
+
+
+# ---------- Benchmarks ----------
+
+@contextlib.contextmanager
+def bench_environment(data_dir: Path, workers: int, backoff: float,
+                      log_encoding: str = amazon.LOG_ENCODING):
+    """Point amazon.py at `data_dir` with run-scoped state reset and pacing
+    that would only measure the sleeps (inter-book delay, rate limits) removed."""
+    patches = {
+        "DATA_DIR": data_dir, "HTTP_CACHE": None, "ARCHIVE": None,
+        "INTER_BOOK_DELAY": 0.0, "FETCH_BACKOFF": backoff, "HOST_RATE": 1e9,
+        "HOST_BURST": 1_000_000, "HTTP_POOL_SIZE": workers,
+        "HTTP_STATS": amazon.Counters(), "EXTRACT_STATS": amazon.Counters(),
+        "RUN_METRICS": amazon.RunMetrics(), "LOG_ENCODING": log_encoding,
+        "_sessions": {}, "_host_buckets": {}, "_host_breakers": {}, "_sqlite_histories": {},
+    }
+    with contextlib.ExitStack() as stack:
+        for name, value in patches.items():
+            stack.enter_context(mock.patch.object(amazon, name, value))
+        stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+        yield
+
+
+def quiet_logger() -> logging.Logger:
+    log = logging.getLogger("bench.scrape")
+    log.propagate = False
+    if not log.handlers:
+        log.addHandler(logging.NullHandler())
+    return log
+
+
+def bench_fetch(server: MockServer, n: int) -> dict:
+    amazon_phase, goodreads_phase, failed = Phase(), Phase(), 0
+    for i in range(n):
+        for phase, url in ((amazon_phase, server.amazon_url(i)),
+                           (goodreads_phase, server.goodreads_url(i))):
+            with phase.time():
+                failed += amazon.fetch_with_retry(url) is None
+    return {"fetch.amazon": amazon_phase.summary(), "fetch.goodreads": goodreads_phase.summary(),
+            "fetch.failed": {"count": failed}}
+
+
+def bench_parse(page_kb: int, n: int) -> dict:
+    rng = random.Random(1)
+    amazon_pages = [product_page(random_rankings(rng), rng.randrange(5_000), page_kb)
+                    for _ in range(min(n, 5))]
+    gr_page = goodreads_page(1_204, 187, page_kb // 2)
+    runs = [("parse.amazon_fast", amazon.PARSER_BACKEND,
+             lambda i: amazon.extract_amazon(amazon_pages[i % len(amazon_pages)], mode="fast"))]
+    for backend in amazon.available_parsers():
+        runs.append((f"parse.amazon_dom.{backend}", backend,
+                     lambda i: amazon.extract_amazon(amazon_pages[i % len(amazon_pages)], mode="dom")))
+        runs.append((f"parse.goodreads.{backend}", backend,
+                     lambda i: amazon.extract_goodreads(gr_page)))
+    results = {}
+    for name, backend, parse in runs:
+        phase = Phase()
+        with mock.patch.object(amazon, "PARSER_BACKEND", backend):
+            for i in range(n):
+                with phase.time():
+                    parse(i)
+        results[name] = phase.summary()
+    return results
+
+
+def bench_history(size: int, output_dir: Path) -> dict:
+    slug = f"hist-{size}"
+    book = {"slug": slug, "display_name": f"Synthetic {size}"}
+    phases = {name: Phase() for name in (
+        "persist_rewrite", "persist_append", "read", "signature", "last_signature",
+        "render_cold", "render_incremental", "render_unchanged")}
+
+    with phases["persist_rewrite"].time(size):
+        amazon.rewrite_entries(slug, synthetic_history(size))
+    amazon.save_state(slug, amazon.load_state(slug, book["display_name"]))
+    log_bytes = amazon.entries_path(slug).stat().st_size
+
+    entries = amazon.iter_entries(slug)
+    while True:
+        with phases["read"].time(0):
+            batch = list(islice(entries, SIGNATURE_BATCH))
+        phases["read"].items += len(batch)
+        if not batch:
+            break
+        with phases["signature"].time(len(batch)):
+            for entry in batch:
+                amazon.entry_signature(entry, True)
+
+    tail = list(synthetic_history(APPEND_SAMPLES, seed=1,
+                                  start=datetime(2020, 1, 1) + timedelta(minutes=30 * size)))
+    with phases["render_cold"].time():
+        amazon.generate_book_dashboard(book, output_dir, force=True)
+    for entry in tail:
+        with phases["last_signature"].time():
+            amazon.last_signature(slug, True)
+        with phases["persist_append"].time():
+            amazon.append_entry(slug, entry)
+            amazon.save_last_signature(slug, amazon.entry_signature(entry, True), True)
+    with phases["render_incremental"].time():
+        amazon.generate_book_dashboard(book, output_dir)
+    with phases["render_unchanged"].time():
+        amazon.generate_book_dashboard(book, output_dir)
+    results = {f"history.{size}.{name}": phase.summary() for name, phase in phases.items()}
+    results[f"history.{size}.log_bytes"] = {"count": log_bytes}
+    return results
+
+
+def bench_end_to_end(server: MockServer, n_books: int, workers: int,
+                     parse_workers: int, output_dir: Path) -> dict:
+    books = [{"slug": f"e2e-{i}", "display_name": f"Book {i}",
+              "amazon_url": server.amazon_url(i), "goodreads_url": server.goodreads_url(i)}
+             for i in range(n_books)]
+    scrape, render, total = Phase(), Phase(), Phase()
+    with total.time(n_books):
+        with scrape.time(n_books), amazon.parse_pool(parse_workers):
+            amazon.scrape_all(books, quiet_logger(), workers)
+        with render.time(n_books):
+            for book in books:
+                amazon.generate_book_dashboard(book, output_dir)
+            amazon.generate_top_index(books, output_dir)
+    return {"e2e.scrape": scrape.summary(), "e2e.render": render.summary(),
+            "e2e.total": total.summary(),
+            "e2e.http": amazon.HTTP_STATS.snapshot(), "e2e.extract": amazon.EXTRACT_STATS.snapshot()}
+
+
+def run(args) -> dict:
+    results = {
+        "version": RESULTS_VERSION,
+        "commit": git_commit(),
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("compare", "output")},
+        "phases": {},
+    }
+    phases = results["phases"]
+    with tempfile.TemporaryDirectory(prefix="amazon-bench-") as tmp, \
+            MockServer(args.latency, args.jitter, args.error_rate, args.captcha_rate,
+                       args.page_kb, args.seed) as server:
+        tmp = Path(tmp)
+        with bench_environment(tmp / "data", args.workers, args.backoff):
+            log_progress("fetch")
+            phases.update(bench_fetch(server, args.fetches))
+        log_progress("parse")
+        phases.update(bench_parse(args.page_kb, args.parses))
+        for size in args.sizes:
+            log_progress(f"history {size:,}")
+            with bench_environment(tmp / f"data-{size}", 1, args.backoff, args.log_encoding):
+                phases.update(bench_history(size, tmp / f"site-{size}"))
+        log_progress(f"end-to-end ({args.books} books, {args.workers} workers)")
+        with bench_environment(tmp / "data-e2e", args.workers, args.backoff):
+            phases.update(bench_end_to_end(server, args.books, args.workers,
+                                           args.parse_workers, tmp / "site-e2e"))
+        results["mock_requests"] = server.requests
+    results["finished"] = datetime.now().isoformat(timespec="seconds")
+    return results
+
+
+def log_progress(label: str) -> None:
+    print(f"  {label}...", file=sys.stderr)
+
+
+def git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=amazon.ROOT,
+                             capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip() or None
+
+
+# ---------- Reporting ----------
+
+def print_summary(results: dict) -> None:
+    print(f"commit {results.get('commit')}  python {results.get('python')}")
+    for name, s in results["phases"].items():
+        if "total_s" not in s:
+            print(f"  {name:42s} {json.dumps(s)}")
+            continue
+        per = f"{s['per_item_us']:>12,.1f} us/item" if s["per_item_us"] is not None else ""
+        p95 = f"p95 {s['p95_ms']:,.2f} ms" if "p95_ms" in s else ""
+        print(f"  {name:42s} {s['count']:>9,} x {per}  total {s['total_s']:8.3f}s  {p95}")
+
+
+def compare(old: dict, new: dict) -> None:
+    print(f"{old.get('commit')} -> {new.get('commit')}  (per-item time; <1.00x is faster)")
+    for name, b in new["phases"].items():
+        a = old["phases"].get(name)
+        if not a or not a.get("per_item_us") or not b.get("per_item_us"):
+            continue
+        ratio = b["per_item_us"] / a["per_item_us"]
+        flag = "  <-- slower" if ratio > 1.1 else "  faster" if ratio < 0.9 else ""
+        print(f"  {name:42s} {a['per_item_us']:>12,.1f} -> {b['per_item_us']:>12,.1f} us"
+              f"  {ratio:5.2f}x{flag}")
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                   help="Comma-separated synthetic history sizes (entries)")
+    p.add_argument("--books", type=int, default=20, help="Books in the end-to-end run")
+    p.add_argument("--workers", type=int, default=4, help="--workers for the end-to-end run")
+    p.add_argument("--parse-workers", type=int, default=0, help="--parse-workers for the end-to-end run")
+    p.add_argument("--fetches", type=int, default=50, help="Sequential fetches per host")
+    p.add_argument("--parses", type=int, default=PARSE_SAMPLES, help="Pages parsed per extractor")
+    p.add_argument("--page-kb", type=int, default=300, help="Approximate product page size")
+    p.add_argument("--latency", type=float, default=0.0, help="Mock server latency (seconds)")
+    p.add_argument("--jitter", type=float, default=0.0, help="Extra random latency, up to (seconds)")
+    p.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 500 responses")
+    p.add_argument("--captcha-rate", type=float, default=0.0, help="Fraction of robot-check pages")
+    p.add_argument("--backoff", type=float, default=0.0,
+                   help="FETCH_BACKOFF during the run (default 0: retries do not sleep)")
+    p.add_argument("--log-encoding", choices=("plain", "delta"), default=amazon.LOG_ENCODING,
+                   help="Entries log encoding for the synthetic histories")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--output", type=Path, default=None,
+                   help=f"Results file (default: {RESULTS_DIR.name}/<commit>-<time>.json)")
+    p.add_argument("--compare", nargs=2, type=Path, metavar=("OLD", "NEW"),
+                   help="Compare two results files and exit")
+    args = p.parse_args()
+    try:
+        args.sizes = [int(s) for s in args.sizes.split(",") if s]
+    except ValueError:
+        p.error("--sizes must be comma-separated integers")
+    if args.books < 1 or args.workers < 1 or args.parses < 1 or args.fetches < 0:
+        p.error("--books, --workers and --parses must be >= 1")
+    return args
+
+
+def main() -> int:
+    args = parse_args()
+    if args.compare:
+        old, new = (json.loads(p.read_text()) for p in args.compare)
+        compare(old, new)
+        return 0
+
+    results = run(args)
+    output = args.output or RESULTS_DIR / (
+        f"{results['commit'] or 'nocommit'}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    amazon.write_atomic(output, results)
+    print_summary(results)
+    print(f"Wrote {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,89 +1,319 @@
 #!/usr/bin/env python3
 """
-Clean up bad Goodreads data in amazon_history.json.
-This script removes Goodreads ratings/reviews that are suspiciously high
-(likely Amazon rankings that were incorrectly captured).
+Data-quality pass over every book's history.
+
+Started as a one-off that removed Goodreads ratings/reviews that were
+suspiciously high (likely Amazon rankings that were incorrectly captured).
+Now it runs over all books in books.json and flags:
+
+  goodreads_max  Goodreads ratings/reviews above MAX_REASONABLE_*; both
+                 Goodreads counts are dropped from the entry.
+  review_spike   an Amazon review count REVIEW_SPIKE_RATIO off the rolling
+                 median of the preceding MEDIAN_WINDOW counts.
+  rank_spike     a category rank RANK_SPIKE_RATIO off its rolling median;
+                 that category is dropped from the entry.
+
+A spike is only flagged when the series reverts: the value must be just as
+far off the median of the FORWARD_WINDOW values after it. A sustained move
+(a promotion surge, a burst of reviews) is a new level, not bad data. The
+newest entries therefore wait for the values that follow them, up to
+MAX_HOLD entries, before they are judged.
+
+The history is never rewritten. Corrections are appended to
+data/<slug>.patches.jsonl (with the original values, so nothing is lost) and
+amazon.py applies them when it renders dashboards. data/<slug>.quality.json
+checkpoints the log position checked so far plus the trailing values the
+rolling medians need, so each run only examines entries appended since the
+last one. The detectors work on whole columns at once, with numpy when it is
+installed.
+
+Usage:
+  python clean_goodreads_data.py              # check new entries of every book
+  python clean_goodreads_data.py --dry-run    # report, write nothing
+  python clean_goodreads_data.py --book japan-book --full
 """
+from __future__ import annotations
 
+import argparse
+import bisect
 import json
-import shutil
+import statistics
+import sys
+import warnings
+from collections import deque
 from datetime import datetime
 
-JSON_FILE = "data/amazon_history.json"
-BACKUP_FILE = f"data/amazon_history_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+import amazon
+
+try:
+    import numpy as np  # optional: vectorized detectors
+    from numpy.lib.stride_tricks import sliding_window_view
+    HAVE_NUMPY = True
+except ImportError:
+    HAVE_NUMPY = False
 
 # Thresholds for what we consider "bad" data
 MAX_REASONABLE_RATINGS = 10000  # If ratings > 10k, probably a ranking number
 MAX_REASONABLE_REVIEWS = 5000   # If reviews > 5k, probably a ranking number
+MEDIAN_WINDOW = 9               # preceding values a spike is measured against
+MIN_HISTORY = 3                 # fewer preceding values than this: no spike check
+REVIEW_SPIKE_RATIO = 3.0        # review count vs rolling median, either direction
+REVIEW_SPIKE_MIN = 20           # ... and at least this many reviews apart
+RANK_SPIKE_RATIO = 100.0        # rank vs rolling median, either direction
+FORWARD_WINDOW = 3              # following values a spike must be off from too
+MAX_HOLD = 24                   # newest entries held back until those arrive
+CHECKPOINT_VERSION = 2
 
-def clean_data():
-    """Clean the Goodreads data in the JSON file."""
-
-    # Read the current data
-    with open(JSON_FILE, 'r') as f:
-        data = json.load(f)
-
-    # Create backup
-    print(f"Creating backup: {BACKUP_FILE}")
-    shutil.copy2(JSON_FILE, BACKUP_FILE)
-
-    entries = data.get('entries', [])
-    cleaned_count = 0
-
-    print(f"\nAnalyzing {len(entries)} entries...")
-
-    for i, entry in enumerate(entries):
-        ratings = entry.get('goodreads_ratings_count')
-        reviews = entry.get('goodreads_reviews_count')
-
-        # Check if we have suspicious data
-        needs_cleaning = False
-
-        if ratings:
-            ratings_int = int(ratings)
-            if ratings_int > MAX_REASONABLE_RATINGS:
-                print(f"Entry {i+1} ({entry['timestamp']}): Bad ratings count {ratings} - removing")
-                needs_cleaning = True
-
-        if reviews:
-            reviews_int = int(reviews)
-            if reviews_int > MAX_REASONABLE_REVIEWS:
-                print(f"Entry {i+1} ({entry['timestamp']}): Bad reviews count {reviews} - removing")
-                needs_cleaning = True
-
-        # Clean the entry if needed
-        if needs_cleaning:
-            if 'goodreads_ratings_count' in entry:
-                del entry['goodreads_ratings_count']
-            if 'goodreads_reviews_count' in entry:
-                del entry['goodreads_reviews_count']
-            cleaned_count += 1
-
-    if cleaned_count > 0:
-        # Save cleaned data
-        with open(JSON_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
-        print(f"\n✓ Cleaned {cleaned_count} entries")
-        print(f"✓ Backup saved to: {BACKUP_FILE}")
-        print(f"✓ Updated file: {JSON_FILE}")
-    else:
-        print("\n✓ No bad data found - all entries look good!")
 
-    # Show summary statistics
-    print("\n=== Summary Statistics ===")
-    ratings_counts = []
-    reviews_counts = []
+def checkpoint_path(slug: str):
+    return amazon.DATA_DIR / f"{slug}.quality.json"
+
+
+# ---------- Vectorized detectors ----------
+
+def above(values: list, limit: float) -> list[bool]:
+    """Mask of values greater than `limit` (None never is)."""
+    if HAVE_NUMPY:
+        arr = np.array([np.nan if v is None else v for v in values], dtype=float)
+        with np.errstate(invalid="ignore"):
+            return (arr > limit).tolist()
+    return [v is not None and v > limit for v in values]
+
+
+def rolling_median(context: list, values: list, window: int = MEDIAN_WINDOW) -> list:
+    """Median of the `window` values preceding each of `values`, where
+    `context` holds the ones before the first. None with fewer than
+    MIN_HISTORY values to go on."""
+    context = list(context)[-window:]
+    if not values:
+        return []
+    if HAVE_NUMPY:
+        padded = np.concatenate([np.full(window - len(context), np.nan),
+                                 np.array(context + list(values), dtype=float)])
+        windows = sliding_window_view(padded, window)[:len(values)]
+        counts = np.count_nonzero(~np.isnan(windows), axis=1)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN leading windows
+            medians = np.nanmedian(windows, axis=1)
+        return [float(m) if n >= MIN_HISTORY else None for m, n in zip(medians, counts)]
+    recent = deque(context, maxlen=window)
+    medians = []
+    for v in values:
+        medians.append(statistics.median(recent) if len(recent) >= MIN_HISTORY else None)
+        recent.append(v)
+    return medians
+
+
+def forward_median(values: list, window: int = FORWARD_WINDOW) -> list:
+    """Median of the (up to) `window` values following each of `values`;
+    None for the last, which has none."""
+    if not values:
+        return []
+    if HAVE_NUMPY:
+        padded = np.concatenate([np.array(values[1:], dtype=float), np.full(window, np.nan)])
+        windows = sliding_window_view(padded, window)[:len(values)]
+        counts = np.count_nonzero(~np.isnan(windows), axis=1)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # the all-NaN last window
+            medians = np.nanmedian(windows, axis=1)
+        return [float(m) if n else None for m, n in zip(medians, counts)]
+    return [statistics.median(values[i + 1:i + 1 + window]) if i + 1 < len(values) else None
+            for i in range(len(values))]
+
+
+def spikes(values: list, medians: list, ratio: float, min_delta: float = 0) -> list[bool]:
+    """Mask of values more than `ratio` times above or below their median."""
+    if HAVE_NUMPY:
+        v = np.array(values, dtype=float)
+        m = np.array([np.nan if x is None else x for x in medians], dtype=float)
+        with np.errstate(invalid="ignore"):
+            mask = ((v > m * ratio) | (v * ratio < m)) & (np.abs(v - m) >= min_delta)
+        return mask.tolist()
+    return [m is not None and (v > m * ratio or v * ratio < m) and abs(v - m) >= min_delta
+            for v, m in zip(values, medians)]
+
+
+def reverting_spikes(observed: list, context: list, ratio: float, min_delta: float = 0) -> list[bool]:
+    """Mask of values off both the rolling median before them and the median
+    of the values after them: outliers, not the first points of a new level."""
+    before = spikes(observed, rolling_median(context, observed), ratio, min_delta)
+    after = spikes(observed, forward_median(observed), ratio, min_delta)
+    return [a and b for a, b in zip(before, after)]
+
+
+def detect(entries: list[dict], windows: dict[str, list]) -> tuple[list[dict], int]:
+    """(patch records, decided) for `entries`: only entries[:decided] have
+    been judged, the rest wait for the values that follow them.
+
+    `entries` continue the series whose trailing values are in `windows`
+    ("amazon_review_count" and "rank:<category>"); it is extended in place
+    with the decided entries' values. Missing values are skipped, so medians
+    run over observations, not entries.
+    """
+    counts = {field: [amazon._js_int(e.get(field)) for e in entries]
+              for field in ("amazon_review_count", "goodreads_ratings_count",
+                            "goodreads_reviews_count")}
+    ranks: dict[str, list] = {}
+    for i, e in enumerate(entries):
+        for r in e.get("rankings") or []:
+            ranks.setdefault(r["category"], [None] * len(entries))[i] = amazon._js_int(r["rank"])
+
+    series = [("amazon_review_count", counts["amazon_review_count"], "review_spike",
+               REVIEW_SPIKE_RATIO, REVIEW_SPIKE_MIN)]
+    series += [(f"rank:{c}", ranks[c], "rank_spike", RANK_SPIKE_RATIO, 0) for c in sorted(ranks)]
+    decided = len(entries)
+    judged = []
+    for key, column, rule, ratio, min_delta in series:
+        idx = [i for i, v in enumerate(column) if v is not None]
+        observed = [column[i] for i in idx]
+        mask = reverting_spikes(observed, windows.get(key, []), ratio, min_delta)
+        # The last FORWARD_WINDOW observations lack a full look-ahead; hold
+        # them back unless they are old enough that more may never come.
+        for i in idx[-FORWARD_WINDOW:]:
+            if i >= len(entries) - MAX_HOLD:
+                decided = min(decided, i)
+                break
+        judged.append((key, rule, idx, observed, mask))
 
-    for entry in entries:
-        if entry.get('goodreads_ratings_count'):
-            ratings_counts.append(int(entry['goodreads_ratings_count']))
-        if entry.get('goodreads_reviews_count'):
-            reviews_counts.append(int(entry['goodreads_reviews_count']))
+    found: dict[tuple[int, str], dict] = {}
+
+    def flag(i: int, rule: str, **change) -> None:
+        patch = found.setdefault((i, rule), {"timestamp": entries[i]["timestamp"], "rule": rule})
+        for key, items in change.items():
+            patch.setdefault(key, []).extend(items)
+
+    too_many = zip(above(counts["goodreads_ratings_count"][:decided], MAX_REASONABLE_RATINGS),
+                   above(counts["goodreads_reviews_count"][:decided], MAX_REASONABLE_REVIEWS))
+    for i, (ratings, reviews) in enumerate(too_many):
+        if ratings or reviews:
+            flag(i, "goodreads_max", unset=["goodreads_ratings_count", "goodreads_reviews_count"])
+
+    for key, rule, idx, observed, mask in judged:
+        n = bisect.bisect_left(idx, decided)
+        windows[key] = (windows.get(key, []) + observed[:n])[-MEDIAN_WINDOW:]
+        for i, flagged in zip(idx[:n], mask):
+            if flagged and rule == "review_spike":
+                flag(i, rule, unset=["amazon_review_count"])
+            elif flagged:
+                flag(i, rule, drop_rankings=[key[len("rank:"):]])
+
+    patches = []
+    for (i, _), patch in sorted(found.items()):
+        entry = entries[i]
+        patch["values"] = {f: entry.get(f) for f in patch.get("unset", ()) if f in entry}
+        if "drop_rankings" in patch:
+            patch["values"]["rankings"] = [r for r in entry.get("rankings") or []
+                                           if r["category"] in patch["drop_rankings"]]
+        patches.append(patch)
+    return patches, decided
+
+
+# ---------- Per-book pass ----------
+
+def _patch_key(patch: dict) -> tuple:
+    return (patch["timestamp"], patch["rule"], tuple(patch.get("unset", ())),
+            tuple(patch.get("drop_rankings", ())))
+
+
+def load_checkpoint(slug: str) -> dict | None:
+    """The book's checkpoint, or None if it is missing or no longer matches
+    the log (compaction, sealing, re-extraction or a backend switch)."""
+    try:
+        checkpoint = json.loads(checkpoint_path(slug).read_text())
+    except (OSError, json.JSONDecodeError):
+        return None
+    if (checkpoint.get("version") != CHECKPOINT_VERSION
+            or checkpoint.get("backend") != amazon.STORAGE_BACKEND):
+        return None
+    if checkpoint.get("position"):
+        tail = amazon._entry_before(slug, checkpoint["position"])
+        if tail is None or amazon._entry_digest(tail) != checkpoint.get("digest"):
+            return None
+    return checkpoint
+
+
+def check_book(book: dict, dry_run: bool = False, full: bool = False) -> dict:
+    """Examine the entries appended since the last pass; returns a summary
+    with the new patch records. Entries still waiting for their look-ahead
+    stay past the checkpoint and are examined again next time."""
+    slug = book["slug"]
+    checkpoint = None if full else load_checkpoint(slug)
+    entries: list[dict] = []
+    positions: list[int | None] = []   # log position after each entry; None if cold
+    if checkpoint is None:
+        checkpoint = {"version": CHECKPOINT_VERSION, "backend": amazon.STORAGE_BACKEND,
+                      "position": 0, "digest": None, "windows": {}}
+        if amazon.sqlite_history() is None:
+            entries.extend(amazon.iter_cold_entries(slug))
+            positions.extend([None] * len(entries))
+
+    for position, entry in amazon._entries_since(slug, checkpoint["position"]):
+        entries.append(entry)
+        positions.append(position)
+
+    patches, decided = detect(entries, checkpoint["windows"])
+    # A full rescan finds corrections that are already logged again.
+    logged = {_patch_key(p) for found in amazon.load_patches(slug).values() for p in found}
+    now = datetime.now().isoformat(timespec="seconds")
+    patches = [dict(p, detected=now) for p in patches if _patch_key(p) not in logged]
+
+    # The checkpoint can only point into the hot log; if the decided entries
+    # end in a cold segment, the next pass starts over (patches dedupe).
+    advance = decided > 0 and positions[decided - 1] is not None
+    if advance:
+        checkpoint["position"] = positions[decided - 1]
+        checkpoint["digest"] = amazon._entry_digest(entries[decided - 1])
+    if not dry_run:
+        if patches:
+            amazon.append_patches(slug, patches)
+        if advance:
+            amazon.write_atomic(checkpoint_path(slug), checkpoint)
+    return {"slug": slug, "examined": len(entries), "decided": decided, "patches": patches}
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--book", action="append", metavar="SLUG",
+                   help="Only check this book (repeatable). Default: every book in books.json.")
+    p.add_argument("--full", action="store_true",
+                   help="Ignore checkpoints and re-examine each whole history.")
+    p.add_argument("--dry-run", action="store_true",
+                   help="Report what would be patched; write nothing.")
+    p.add_argument("--storage", choices=("files", "sqlite"), default=amazon.STORAGE_BACKEND,
+                   help="History backend, as for amazon.py.")
+    return p.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    amazon.STORAGE_BACKEND = args.storage
+    books = amazon.load_books()
+    if args.book:
+        unknown = set(args.book) - {b["slug"] for b in books}
+        if unknown:
+            print(f"error: unknown book(s): {', '.join(sorted(unknown))}", file=sys.stderr)
+            return 1
+        books = [b for b in books if b["slug"] in args.book]
+
+    total = 0
+    for book in books:
+        result = check_book(book, dry_run=args.dry_run, full=args.full)
+        for patch in result["patches"]:
+            print(f"{result['slug']} {patch['timestamp']}: {patch['rule']} {patch['values']} - patching")
+        total += len(result["patches"])
+        held = result["examined"] - result["decided"]
+        print(f"{result['slug']}: examined {result['examined']} entries, "
+              f"{len(result['patches'])} new corrections"
+              + (f", {held} held until later entries arrive" if held else ""))
+
+    if args.dry_run:
+        print(f"\n(dry-run) {total} corrections not written.")
+    elif total:
+        print(f"\n✓ Logged {total} corrections to data/<slug>.patches.jsonl")
+    else:
+        print("\n✓ No bad data found - all new entries look good!")
+    return 0
 
-    if ratings_counts:
-        print(f"Goodreads Ratings: min={min(ratings_counts)}, max={max(ratings_counts)}, count={len(ratings_counts)}")
-    if reviews_counts:
-        print(f"Goodreads Reviews: min={min(reviews_counts)}, max={max(reviews_counts)}, count={len(reviews_counts)}")
 
 if __name__ == "__main__":
-    clean_data()
+    sys.exit(main())
@@ -0,0 +1,232 @@
+"""
+history_sqlite.py — optional SQLite storage backend for amazon.py.
+
+Selected with `amazon.py --storage sqlite`. Holds every book in one database
+(data/history.sqlite3) with normalized tables:
+
+  books      one row per slug: the envelope's state fields
+  snapshots  one row per history entry (review / Goodreads counts)
+  rankings   one row per (snapshot, category), denormalized with slug and
+             timestamp so per-category queries never touch `snapshots`
+
+Indexes cover (slug, timestamp) and (slug, category, timestamp); a book's
+rankings are read back in snapshot order through (slug, snapshot_id). The
+database runs in WAL mode, so dashboard rendering can read while a scrape
+writes. Entries decode back to the shape amazon.py writes to the JSONL log.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+from pathlib import Path
+
+STATE_FIELDS = ("last_successful_scrape", "last_error",
+                "last_attempt_timestamp", "last_attempt_status")
+COUNT_FIELDS = ("amazon_review_count", "goodreads_ratings_count", "goodreads_reviews_count")
+
+# Count columns are declared without a type so SQLite keeps whatever was
+# written ("53" stays a string, legacy ints stay ints); NULL means "absent".
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    slug TEXT PRIMARY KEY,
+    display_name TEXT,
+    last_successful_scrape TEXT,
+    last_error TEXT,
+    last_attempt_timestamp TEXT,
+    last_attempt_status TEXT
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    slug TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    amazon_review_count,
+    goodreads_ratings_count,
+    goodreads_reviews_count,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS rankings (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(id) ON DELETE CASCADE,
+    slug TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    rank INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_slug_ts ON snapshots (slug, timestamp);
+CREATE INDEX IF NOT EXISTS rankings_slug_cat_ts ON rankings (slug, category, timestamp);
+CREATE INDEX IF NOT EXISTS rankings_slug_snapshot ON rankings (slug, snapshot_id, position);
+CREATE INDEX IF NOT EXISTS rankings_snapshot ON rankings (snapshot_id);
+"""
+
+
+class SqliteHistory:
+    """Per-book history in SQLite. One connection per thread."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(SCHEMA)
+                    self._initialized = True
+            self._local.conn = conn
+        return conn
+
+    # ----- state -----
+
+    def load_state(self, slug: str, display_name: str) -> dict:
+        state = {"slug": slug, "display_name": display_name, **dict.fromkeys(STATE_FIELDS)}
+        row = self.connect().execute(
+            f"SELECT {', '.join(STATE_FIELDS)} FROM books WHERE slug = ?", (slug,),
+        ).fetchone()
+        if row:
+            state.update(zip(STATE_FIELDS, row))
+        return state
+
+    def save_state(self, slug: str, state: dict) -> None:
+        conn = self.connect()
+        with conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO books (slug, display_name, {', '.join(STATE_FIELDS)}) "
+                f"VALUES (?, ?, {', '.join('?' * len(STATE_FIELDS))})",
+                (slug, state.get("display_name"), *(state.get(k) for k in STATE_FIELDS)),
+            )
+
+    def has_history(self, slug: str) -> bool:
+        return self.connect().execute(
+            "SELECT 1 FROM books WHERE slug = ?", (slug,)).fetchone() is not None
+
+    # ----- entries -----
+
+    def _insert(self, conn: sqlite3.Connection, slug: str, entry: dict) -> None:
+        extra = {k: v for k, v in entry.items()
+                 if k not in ("timestamp", "rankings", *COUNT_FIELDS)}
+        cur = conn.execute(
+            "INSERT INTO snapshots (slug, timestamp, amazon_review_count, "
+            "goodreads_ratings_count, goodreads_reviews_count, extra) VALUES (?, ?, ?, ?, ?, ?)",
+            (slug, entry["timestamp"], *(entry.get(k) for k in COUNT_FIELDS),
+             json.dumps(extra, ensure_ascii=False) if extra else None),
+        )
+        conn.executemany(
+            "INSERT INTO rankings (snapshot_id, slug, timestamp, position, category, rank) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(cur.lastrowid, slug, entry["timestamp"], i, r["category"], int(r["rank"]))
+             for i, r in enumerate(entry.get("rankings") or [])],
+        )
+
+    def append_entry(self, slug: str, entry: dict) -> None:
+        conn = self.connect()
+        with conn:
+            self._insert(conn, slug, entry)
+
+    def rewrite_entries(self, slug: str, entries) -> int:
+        # Materialized first: `entries` may be a generator over this same table.
+        entries = list(entries)
+        conn = self.connect()
+        with conn:
+            conn.execute("DELETE FROM snapshots WHERE slug = ?", (slug,))
+            for entry in entries:
+                self._insert(conn, slug, entry)
+        return len(entries)
+
+    def _decode(self, row, rankings) -> dict:
+        snapshot_id, timestamp, *counts, extra = row
+        entry = {"timestamp": timestamp}
+        entry.update((k, v) for k, v in zip(COUNT_FIELDS, counts) if v is not None)
+        entry["rankings"] = [{"rank": str(rank), "category": category}
+                             for category, rank in rankings]
+        if extra:
+            entry.update(json.loads(extra))
+        return entry
+
+    _SNAPSHOT_COLUMNS = ("id, timestamp, amazon_review_count, goodreads_ratings_count, "
+                         "goodreads_reviews_count, extra")
+
+    def iter_entries(self, slug: str, after_id: int = 0, since: str | None = None):
+        """Entries in insertion order; `after_id` resumes after a known snapshot
+        id, `since` skips entries timestamped before it."""
+        for _, entry in self.iter_rows(slug, after_id, since):
+            yield entry
+
+    def iter_rows(self, slug: str, after_id: int = 0, since: str | None = None):
+        """(snapshot id, entry) pairs in insertion order."""
+        conn = self.connect()
+        since_clause = ""
+        if since is not None:
+            # The first snapshot at or after `since` (a seek on snapshots_slug_ts)
+            # bounds the rankings scan as well.
+            first = conn.execute(
+                "SELECT MIN(id) FROM snapshots WHERE slug = ? AND timestamp >= ?",
+                (slug, since)).fetchone()[0]
+            if first is None:
+                return
+            after_id = max(after_id, first - 1)
+            since_clause = "AND timestamp >= ? "
+        rows = conn.execute(
+            f"SELECT {self._SNAPSHOT_COLUMNS} FROM snapshots "
+            f"WHERE slug = ? AND id > ? {since_clause}ORDER BY id",
+            (slug, after_id, *(() if since is None else (since,))))
+        ranks = conn.execute(
+            "SELECT snapshot_id, category, rank FROM rankings "
+            "WHERE slug = ? AND snapshot_id > ? ORDER BY snapshot_id, position", (slug, after_id))
+        pending = next(ranks, None)
+        for row in rows:
+            rankings = []
+            while pending is not None and pending[0] < row[0]:
+                pending = next(ranks, None)  # a snapshot filtered out by `since`
+            while pending is not None and pending[0] == row[0]:
+                rankings.append(pending[1:])
+                pending = next(ranks, None)
+            yield row[0], self._decode(row, rankings)
+
+    def read_last_entry(self, slug: str) -> dict | None:
+        return self._entry_where(slug, "ORDER BY id DESC LIMIT 1")
+
+    def read_tail_entries(self, slug: str, n: int) -> list[dict]:
+        row = self.connect().execute(
+            "SELECT MIN(id) FROM (SELECT id FROM snapshots WHERE slug = ? "
+            "ORDER BY id DESC LIMIT ?)", (slug, n)).fetchone()
+        return [] if row[0] is None else list(self.iter_entries(slug, after_id=row[0] - 1))
+
+    def entry_at(self, slug: str, snapshot_id: int) -> dict | None:
+        return self._entry_where(slug, "AND id = ?", (snapshot_id,))
+
+    def _entry_where(self, slug: str, clause: str, params: tuple = ()) -> dict | None:
+        conn = self.connect()
+        row = conn.execute(
+            f"SELECT {self._SNAPSHOT_COLUMNS} FROM snapshots "
+            f"WHERE slug = ? {clause}", (slug, *params)).fetchone()
+        if row is None:
+            return None
+        rankings = conn.execute(
+            "SELECT category, rank FROM rankings WHERE snapshot_id = ? ORDER BY position",
+            (row[0],)).fetchall()
+        return self._decode(row, rankings)
+
+    def last_snapshot_id(self, slug: str) -> int:
+        row = self.connect().execute(
+            "SELECT MAX(id) FROM snapshots WHERE slug = ?", (slug,)).fetchone()
+        return row[0] or 0
+
+    # ----- queries -----
+
+    def best_ranks(self, slug: str) -> dict[str, tuple[int, str]]:
+        """category -> (best rank ever, first timestamp it was reached)."""
+        rows = self.connect().execute(
+            "SELECT category, MIN(rank), MIN(timestamp) FROM rankings r "
+            "WHERE slug = ? AND rank = (SELECT MIN(rank) FROM rankings "
+            "  WHERE slug = r.slug AND category = r.category) "
+            "GROUP BY category", (slug,))
+        return {category: (rank, ts) for category, rank, ts in rows}
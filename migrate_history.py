@@ -7,29 +7,43 @@ Reads the legacy single-book history file, normalizes schema
 entries, drops empty-ranking entries, and wraps the output in the
 multi-book envelope expected by amazon.py after the Phase-4 refactor.
 
+The input is parsed incrementally and every step (normalize, drop, dedupe,
+invariant checks) runs in a single pass, so memory stays flat no matter how
+large the history is. Output goes to a temp file that only replaces the
+target once the whole input has been read and the count sanity check passes.
+
 Default behavior is dry-run. Use --commit to actually write the output and
 the migration_report.json audit file.
 
+Batch mode reads a JSON manifest — a list of {"input", "output", "slug",
+"display_name"} objects, optionally with "min_entries"/"max_entries" — and
+migrates the files in parallel worker processes. Each job writes its own
+report, <output stem>.migration_report.json, next to its output.
+
 Usage:
   python migrate_history.py                     # dry-run
   python migrate_history.py --commit            # write data/japan-book.json
   python migrate_history.py --input X --output Y --slug Z --display-name "..." --commit
+  python migrate_history.py --batch manifest.json --jobs 4 --commit
 """
 from __future__ import annotations
 
 import argparse
+import codecs
 import hashlib
 import json
 import os
 import re
 import sys
 import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
 SANITY_MIN = 3500
 SANITY_MAX = 6000
 SLUG_RE = re.compile(r"^[a-z0-9-]+$")
+READ_CHUNK = 1 << 16
 
 
 def _norm_count(v):
@@ -77,119 +91,277 @@ def write_atomic(path: Path, data) -> None:
     os.replace(tmp.name, path)
 
 
-def sha256_file(path: Path) -> str:
-    h = hashlib.sha256()
-    with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(1 << 16), b""):
-            h.update(chunk)
-    return h.hexdigest()
-
-
-def parse_args():
-    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
-    p.add_argument("--input", default="data/amazon_history.json")
-    p.add_argument("--output", default="data/japan-book.json")
-    p.add_argument("--slug", default="japan-book")
-    p.add_argument("--display-name", default="Things Become Other Things")
-    p.add_argument("--commit", action="store_true",
-                   help="Actually write output. Default is dry-run.")
-    return p.parse_args()
-
-
-def main() -> int:
-    args = parse_args()
-
-    if not SLUG_RE.match(args.slug):
-        print(f"error: slug {args.slug!r} must match {SLUG_RE.pattern}", file=sys.stderr)
+# ---------- Streaming input ----------
+
+class AlreadyMigrated(Exception):
+    pass
+
+
+class JsonStream:
+    """Incremental reader for one JSON document, built on raw_decode.
+
+    Only the current value is held in memory; the input is hashed as it is
+    read, so the audit sha256 costs no second pass.
+    """
+
+    _decoder = json.JSONDecoder()
+    _NUMBER_CHARS = "0123456789+-.eE"
+
+    def __init__(self, f):
+        self.f = f
+        self.sha = hashlib.sha256()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+
+    def _fill(self) -> bool:
+        data = self.f.read(READ_CHUNK)
+        self.sha.update(data)
+        text = self._utf8.decode(data, final=not data)
+        self.buf = self.buf[self.pos:] + text
+        self.pos = 0
+        return bool(data)
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError(f"expected one of {chars!r} at offset ~{self.pos}, got {c!r}")
+        self.pos += 1
+        return c
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A bare number cut off at the chunk boundary still decodes, as a
+            # shorter prefix when the cut falls after "3." or "1e"; read on
+            # until something other than number characters follows it.
+            if self.buf[end:].strip(self._NUMBER_CHARS) == "" and self._fill():
+                continue
+            self.pos = end
+            return obj
+
+    def drain(self) -> None:
+        while self._fill():
+            self.buf, self.pos = "", 0
+
+
+def iter_legacy_entries(stream: JsonStream, top: dict):
+    """Yield the items of the top-level "entries" array one at a time.
+
+    Other top-level keys are decoded whole into `top`. Raises AlreadyMigrated
+    on a "slug" key, which the legacy format never had.
+    """
+    stream.expect("{")
+    if stream.peek() == "}":
+        stream.pos += 1
+        return
+    while True:
+        key = stream.value()
+        stream.expect(":")
+        if key == "slug":
+            raise AlreadyMigrated(key)
+        if key == "entries":
+            stream.expect("[")
+            if stream.peek() == "]":
+                stream.pos += 1
+            else:
+                while True:
+                    yield stream.value()
+                    if stream.expect(",]") == "]":
+                        break
+        else:
+            top[key] = stream.value()
+        if stream.expect(",}") == "}":
+            return
+
+
+# ---------- Streaming output ----------
+
+class EnvelopeWriter:
+    """Writes the multi-book envelope entry by entry to a temp file.
+
+    The state fields that depend on the last entry are written after the
+    entries array; amazon.py does not care about key order.
+    """
+
+    def __init__(self, path: Path, slug: str, display_name: str):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.tmp = tempfile.NamedTemporaryFile(
+            mode="w", dir=path.parent, prefix=f".{path.name}.", suffix=".tmp",
+            delete=False, encoding="utf-8",
+        )
+        self.count = 0
+        self.tmp.write("{\n")
+        self.tmp.write(f'  "slug": {json.dumps(slug)},\n')
+        self.tmp.write(f'  "display_name": {json.dumps(display_name, ensure_ascii=False)},\n')
+        self.tmp.write('  "entries": [')
+
+    def write(self, entry: dict) -> None:
+        body = json.dumps(entry, indent=2, ensure_ascii=False).replace("\n", "\n    ")
+        self.tmp.write(("," if self.count else "") + "\n    " + body)
+        self.count += 1
+
+    def commit(self, last_ts) -> None:
+        self.tmp.write(("\n  " if self.count else "") + "],\n")
+        tail = {
+            "last_successful_scrape": last_ts,
+            "last_error": None,
+            "last_attempt_timestamp": last_ts,
+            "last_attempt_status": "appended" if self.count else None,
+        }
+        self.tmp.write(",\n".join(f"  {json.dumps(k)}: {json.dumps(v)}" for k, v in tail.items()))
+        self.tmp.write("\n}")
+        self.tmp.flush()
+        os.fsync(self.tmp.fileno())
+        self.tmp.close()
+        os.replace(self.tmp.name, self.path)
+
+    def abort(self) -> None:
+        self.tmp.close()
+        try:
+            os.unlink(self.tmp.name)
+        except FileNotFoundError:
+            pass
+
+
+# ---------- Migration ----------
+
+def _print(text: str, err: bool = False) -> None:
+    print(text, file=sys.stderr if err else sys.stdout)
+
+
+def migrate(input_path: Path, output_path: Path, slug: str, display_name: str,
+            commit: bool = False, min_entries: int = SANITY_MIN, max_entries: int = SANITY_MAX,
+            report_path: Path | None = None, out=_print) -> int:
+    """Migrate one legacy file in a single pass. Returns a process exit code.
+
+    Progress goes through `out(text, err=False)` so batch workers can hand
+    their output back to the parent instead of interleaving it.
+    """
+    if not SLUG_RE.match(slug):
+        out(f"error: slug {slug!r} must match {SLUG_RE.pattern}", err=True)
         return 1
-
-    input_path = Path(args.input)
-    output_path = Path(args.output)
-
     if not input_path.exists():
-        print(f"error: input not found: {input_path}", file=sys.stderr)
+        out(f"error: input not found: {input_path}", err=True)
         return 1
 
-    raw = json.loads(input_path.read_text())
+    input_mtime = input_path.stat().st_mtime
+    writer = EnvelopeWriter(output_path, slug, display_name) if commit else None
 
-    # Refuse if input is already wrapped (idempotency guard).
-    if isinstance(raw, dict) and "slug" in raw and "entries" in raw:
-        print(f"error: {input_path} looks already migrated (has 'slug' key). Refusing.", file=sys.stderr)
-        return 1
+    original_count = normalized_changed = dropped_empty = collapsed = n = 0
+    sample_dropped = sample_normalized = None
+    first_surviving_ts = first_kept_ts = last_kept_ts = None
+    last_surviving_sig = prev_sig = None
+    has_legacy_key = missing_new_key = has_empty = out_of_order = False
+    src_cats: set = set()
+    out_cats: set = set()
 
-    entries = raw.get("entries", [])
-    original_count = len(entries)
-    print(f"Loaded {original_count} entries from {input_path}")
-
-    # Step 1: schema normalize
-    normalized = [normalize_entry(e) for e in entries]
-    normalized_changed = sum(1 for a, b in zip(entries, normalized) if a is not b)
-
-    # Step 2: drop empty rankings
-    non_empty = [e for e in normalized if e.get("rankings")]
-    dropped_empty = len(normalized) - len(non_empty)
-
-    # Step 3: dedupe consecutive identicals
-    deduped = []
-    prev_sig = None
-    for e in non_empty:
-        sig = entry_signature(e)
-        if sig != prev_sig:
-            deduped.append(e)
-            prev_sig = sig
-    collapsed = len(non_empty) - len(deduped)
-
-    n = len(deduped)
-    print("\nTransform summary:")
-    print(f"  Original entries:                        {original_count}")
-    print(f"  Schema-normalized (review_count -> new): {normalized_changed}")
-    print(f"  Dropped (empty rankings):                {dropped_empty}")
-    print(f"  Collapsed (consecutive duplicates):      {collapsed}")
-    print(f"  Final entry count:                       {n}")
+    top: dict = {}
+    try:
+        with open(input_path, "rb") as f:
+            stream = JsonStream(f)
+            for raw in iter_legacy_entries(stream, top):
+                original_count += 1
+                src_cats.update(r["category"] for r in raw.get("rankings", []))
+
+                # Step 1: schema normalize
+                e = normalize_entry(raw)
+                if e is not raw:
+                    normalized_changed += 1
+                    if sample_normalized is None:
+                        sample_normalized = e
+
+                # Step 2: drop empty rankings
+                if not e.get("rankings"):
+                    dropped_empty += 1
+                    if sample_dropped is None:
+                        sample_dropped = e
+                    continue
+                sig = entry_signature(e)
+                if first_surviving_ts is None:
+                    first_surviving_ts = e["timestamp"]
+                last_surviving_sig = sig
+
+                # Step 3: dedupe consecutive identicals
+                if sig == prev_sig:
+                    collapsed += 1
+                    continue
+                prev_sig = sig
+
+                # Invariants on the kept stream
+                has_legacy_key |= "review_count" in e
+                missing_new_key |= "amazon_review_count" not in e
+                has_empty |= not e.get("rankings")
+                ts = e["timestamp"]
+                out_of_order |= last_kept_ts is not None and ts < last_kept_ts
+                if first_kept_ts is None:
+                    first_kept_ts = ts
+                last_kept_ts = ts
+                out_cats.update(r["category"] for r in e["rankings"])
+                n += 1
+                if writer:
+                    writer.write(e)
+            stream.drain()
+            input_sha = stream.sha.hexdigest()
+    except AlreadyMigrated:
+        if writer:
+            writer.abort()
+        out(f"error: {input_path} looks already migrated (has 'slug' key). Refusing.", err=True)
+        return 1
+    except BaseException:
+        if writer:
+            writer.abort()
+        raise
+
+    out(f"Loaded {original_count} entries from {input_path}")
+    out("\nTransform summary:")
+    out(f"  Original entries:                        {original_count}")
+    out(f"  Schema-normalized (review_count -> new): {normalized_changed}")
+    out(f"  Dropped (empty rankings):                {dropped_empty}")
+    out(f"  Collapsed (consecutive duplicates):      {collapsed}")
+    out(f"  Final entry count:                       {n}")
 
     # Samples for the eyeball test
-    if dropped_empty:
-        sample = next((e for e in normalized if not e.get("rankings")), None)
-        if sample:
-            print(f"\n  sample dropped: timestamp={sample.get('timestamp')}")
-    if normalized_changed:
-        sample = next((nb for a, nb in zip(entries, normalized) if a is not nb), None)
-        if sample:
-            print(f"  sample normalized: amazon_review_count={sample.get('amazon_review_count')!r}")
-
-    # Build envelope
-    last_ts = deduped[-1]["timestamp"] if deduped else None
-    envelope = {
-        "slug": args.slug,
-        "display_name": args.display_name,
-        "last_successful_scrape": last_ts,
-        "last_error": None,
-        "last_attempt_timestamp": last_ts,
-        "last_attempt_status": "appended" if deduped else None,
-        "entries": deduped,
-    }
+    if sample_dropped:
+        out(f"\n  sample dropped: timestamp={sample_dropped.get('timestamp')}")
+    if sample_normalized:
+        out(f"  sample normalized: amazon_review_count={sample_normalized.get('amazon_review_count')!r}")
 
-    print(f"\nEnvelope: slug={args.slug!r} display_name={args.display_name!r}")
-    print(f"          last_successful_scrape={last_ts!r}")
+    out(f"\nEnvelope: slug={slug!r} display_name={display_name!r}")
+    out(f"          last_successful_scrape={last_kept_ts!r}")
 
     # Sanity check
-    if not (SANITY_MIN <= n <= SANITY_MAX):
-        print(f"\nSanity check FAILED: final count {n} not in [{SANITY_MIN}, {SANITY_MAX}]. Refusing.",
-              file=sys.stderr)
+    if not (min_entries <= n <= max_entries):
+        if writer:
+            writer.abort()
+        out(f"\nSanity check FAILED: final count {n} not in [{min_entries}, {max_entries}]. Refusing.",
+            err=True)
         return 1
 
-    if not args.commit:
-        print("\n(dry-run) Not writing. Re-run with --commit to write.")
+    if not commit:
+        out("\n(dry-run) Not writing. Re-run with --commit to write.")
         return 0
 
-    # Audit trail: hash the input BEFORE any side effects
-    input_sha = sha256_file(input_path)
-    input_mtime = input_path.stat().st_mtime
-
-    write_atomic(output_path, envelope)
+    writer.commit(last_kept_ts)
 
     if input_path.stat().st_mtime != input_mtime:
-        print("warning: input file changed during migration — output may be stale", file=sys.stderr)
+        out("warning: input file changed during migration — output may be stale", err=True)
 
     report = {
         "timestamp": datetime.now().isoformat(timespec="seconds"),
@@ -201,55 +373,131 @@ def main() -> int:
         "normalized_schema": normalized_changed,
         "dropped_empty": dropped_empty,
         "collapsed_duplicates": collapsed,
-        "slug": args.slug,
+        "slug": slug,
     }
-    report_path = output_path.parent / "migration_report.json"
+    report_path = report_path or output_path.parent / "migration_report.json"
     write_atomic(report_path, report)
 
     # Invariant checks
-    print("\nPost-migration invariants:")
+    out("\nPost-migration invariants:")
     results = []
 
     def _check(label, ok):
         results.append(ok)
-        print(f"  [{'OK' if ok else 'FAIL'}] {label}")
-
-    _check(f"count in [{SANITY_MIN}, {SANITY_MAX}]", SANITY_MIN <= n <= SANITY_MAX)
-    _check("no entry has legacy 'review_count' key",
-           all("review_count" not in e for e in deduped))
-    _check("every entry has 'amazon_review_count'",
-           all("amazon_review_count" in e for e in deduped))
-    _check("no entry has empty rankings",
-           all(e.get("rankings") for e in deduped))
-
-    timestamps = [e["timestamp"] for e in deduped]
-    _check("timestamps non-decreasing",
-           all(timestamps[i] <= timestamps[i + 1] for i in range(len(timestamps) - 1)))
-
-    src_cats = {r["category"] for e in entries for r in e.get("rankings", [])}
-    out_cats = {r["category"] for e in deduped for r in e.get("rankings", [])}
+        out(f"  [{'OK' if ok else 'FAIL'}] {label}")
+
+    _check(f"count in [{min_entries}, {max_entries}]", min_entries <= n <= max_entries)
+    _check("no entry has legacy 'review_count' key", not has_legacy_key)
+    _check("every entry has 'amazon_review_count'", not missing_new_key)
+    _check("no entry has empty rankings", not has_empty)
+    _check("timestamps non-decreasing", not out_of_order)
+
     missing = src_cats - out_cats
     _check(f"no category vanished (missing: {missing or 'none'})", not missing)
 
-    first_surviving = next((e for e in normalized if e.get("rankings")), None)
-    last_surviving = next((e for e in reversed(normalized) if e.get("rankings")), None)
-    if first_surviving and last_surviving and deduped:
-        _check("first timestamp preserved",
-               deduped[0]["timestamp"] == first_surviving["timestamp"])
+    if first_surviving_ts is not None and n:
+        _check("first timestamp preserved", first_kept_ts == first_surviving_ts)
         # Dedupe keeps the FIRST occurrence of each run, so the tail entry's
         # timestamp may be earlier than the source's last timestamp. What must
-        # survive is the latest observed STATE — check signatures, not timestamps.
-        _check("latest state preserved (signature)",
-               entry_signature(deduped[-1]) == entry_signature(last_surviving))
+        # survive is the latest observed STATE — the kept tail's signature is
+        # prev_sig, compare it with the last surviving source entry.
+        _check("latest state preserved (signature)", prev_sig == last_surviving_sig)
 
-    print(f"\nWrote {output_path} ({n} entries)")
-    print(f"Wrote {report_path}")
+    out(f"\nWrote {output_path} ({n} entries)")
+    out(f"Wrote {report_path}")
     passed = sum(results)
     failed = len(results) - passed
-    print(f"Invariants: {passed} passed, {failed} failed")
+    out(f"Invariants: {passed} passed, {failed} failed")
 
     return 0 if failed == 0 else 1
 
 
+# ---------- Batch ----------
+
+def load_manifest(path: Path) -> list[dict]:
+    jobs = json.loads(path.read_text())
+    if not isinstance(jobs, list):
+        raise ValueError(f"{path}: manifest must be a JSON list of jobs")
+    for i, job in enumerate(jobs):
+        missing = {"input", "output", "slug"} - set(job)
+        if missing:
+            raise ValueError(f"{path}: job {i} is missing {sorted(missing)}")
+    outputs = [str(Path(job["output"]).resolve()) for job in jobs]
+    if len(set(outputs)) != len(outputs):
+        raise ValueError(f"{path}: two jobs write the same output")
+    return jobs
+
+
+def _run_job(job: dict, commit: bool, min_entries: int, max_entries: int) -> tuple[int, list]:
+    lines: list = []
+    output_path = Path(job["output"])
+    try:
+        code = migrate(
+            Path(job["input"]), output_path, job["slug"], job.get("display_name", job["slug"]),
+            commit=commit,
+            min_entries=job.get("min_entries", min_entries),
+            max_entries=job.get("max_entries", max_entries),
+            report_path=output_path.with_name(f"{output_path.stem}.migration_report.json"),
+            out=lambda text, err=False: lines.append((text, err)),
+        )
+    except (OSError, ValueError) as e:
+        lines.append((f"error: {type(e).__name__}: {e}", True))
+        code = 1
+    return code, lines
+
+
+def run_batch(jobs: list[dict], commit: bool, workers: int | None,
+              min_entries: int, max_entries: int) -> int:
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_run_job, job, commit, min_entries, max_entries) for job in jobs]
+        # Print in manifest order so the log reads the same on every run.
+        for job, fut in zip(jobs, futures):
+            code, lines = fut.result()
+            print(f"\n=== {job['slug']}: {job['input']} -> {job['output']} ===")
+            for text, err in lines:
+                _print(text, err)
+            if code:
+                failed.append(job["slug"])
+    print(f"\nBatch: {len(jobs) - len(failed)} of {len(jobs)} migrated cleanly"
+          + (f"; failed: {', '.join(failed)}" if failed else ""))
+    return 1 if failed else 0
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--input", default="data/amazon_history.json")
+    p.add_argument("--output", default="data/japan-book.json")
+    p.add_argument("--slug", default="japan-book")
+    p.add_argument("--display-name", default="Things Become Other Things")
+    p.add_argument("--min-entries", type=int, default=SANITY_MIN,
+                   help=f"Refuse if fewer entries survive (default {SANITY_MIN}).")
+    p.add_argument("--max-entries", type=int, default=SANITY_MAX,
+                   help=f"Refuse if more entries survive (default {SANITY_MAX}).")
+    p.add_argument("--batch", metavar="MANIFEST",
+                   help="Migrate every job in a JSON manifest in parallel.")
+    p.add_argument("--jobs", type=int, default=None,
+                   help="Worker processes for --batch (default: one per CPU).")
+    p.add_argument("--commit", action="store_true",
+                   help="Actually write output. Default is dry-run.")
+    return p.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+
+    if args.batch:
+        try:
+            jobs = load_manifest(Path(args.batch))
+        except (OSError, ValueError) as e:
+            print(f"error: {e}", file=sys.stderr)
+            return 1
+        return run_batch(jobs, args.commit, args.jobs, args.min_entries, args.max_entries)
+
+    return migrate(Path(args.input), Path(args.output), args.slug, args.display_name,
+                   commit=args.commit, min_entries=args.min_entries,
+                   max_entries=args.max_entries, out=_print)
+
+
 if __name__ == "__main__":
     sys.exit(main())
@@ -8,18 +8,32 @@ Run:
 """
 from __future__ import annotations
 
+import hashlib
+import json
+import math
+import os
+import tempfile
+import threading
+import time
 import unittest
+from pathlib import Path
+from unittest import mock
 
 from bs4 import BeautifulSoup
 
 import amazon
 
 
-def _soup(html: str) -> BeautifulSoup:
-    return BeautifulSoup(html, "html.parser")
+class BackendTestCase(unittest.TestCase):
+    """Extraction fixtures; re-run below against every parser backend."""
 
+    backend = "html.parser"
 
-class TestAmazonReviewCount(unittest.TestCase):
+    def _soup(self, html: str) -> BeautifulSoup:
+        return amazon.make_soup(html, self.backend)
+
+
+class TestAmazonReviewCount(BackendTestCase):
     def test_regression_star_rating_does_not_fuse_with_count(self):
         # Regression for the 2026-04-24 bug: Amazon's reviews-medley-widget
         # concatenates "4 out of 5" (star rating) with "53 global ratings"
@@ -33,28 +47,122 @@ class TestAmazonReviewCount(unittest.TestCase):
             <span data-hook="total-review-count">53 global ratings</span>
         </div>
         """
-        self.assertEqual(amazon.get_amazon_review_count(_soup(html)), "53")
+        self.assertEqual(amazon.get_amazon_review_count(self._soup(html)), "53")
 
     def test_two_digit_count(self):
         html = '<span data-hook="total-review-count">34 global ratings</span>'
-        self.assertEqual(amazon.get_amazon_review_count(_soup(html)), "34")
+        self.assertEqual(amazon.get_amazon_review_count(self._soup(html)), "34")
 
     def test_three_digit_count(self):
         html = '<span data-hook="total-review-count">299 global ratings</span>'
-        self.assertEqual(amazon.get_amazon_review_count(_soup(html)), "299")
+        self.assertEqual(amazon.get_amazon_review_count(self._soup(html)), "299")
 
     def test_comma_separated_count(self):
         html = '<span data-hook="total-review-count">1,234 global ratings</span>'
-        self.assertEqual(amazon.get_amazon_review_count(_soup(html)), "1234")
+        self.assertEqual(amazon.get_amazon_review_count(self._soup(html)), "1234")
 
     def test_fallback_to_acr_element(self):
         # If data-hook="total-review-count" is absent, fall back to
         # #acrCustomerReviewText which renders like "(53)" next to the stars.
         html = '<span id="acrCustomerReviewText">(53)</span>'
-        self.assertEqual(amazon.get_amazon_review_count(_soup(html)), "53")
+        self.assertEqual(amazon.get_amazon_review_count(self._soup(html)), "53")
 
     def test_returns_none_when_missing(self):
-        self.assertIsNone(amazon.get_amazon_review_count(_soup("<p>nothing</p>")))
+        self.assertIsNone(amazon.get_amazon_review_count(self._soup("<p>nothing</p>")))
+
+
+DETAIL_BULLETS = """
+<div id="dp"><span>#99 in Decoys</span></div>
+<div id="detailBulletsWrapper_feature_div">
+  <ul class="detail-bullet-list">
+    <li><span class="a-list-item">
+      <span class="a-text-bold">Best Sellers Rank: </span>
+      #17,031 in Books (<a href="/best-sellers">See Top 100 in Books</a>)
+      <ul class="zg_hrsr">
+        <li><span class="a-list-item">#4 in <a href="/a">General Japan Travel Guides</a></span></li>
+        <li><span class="a-list-item">#63 in <a href="/b">Traveler &amp; Explorer Biographies</a></span></li>
+      </ul>
+    </span></li>
+  </ul>
+</div>
+"""
+
+
+class TestRankingsAndGoodreads(BackendTestCase):
+    def test_all_rankings_from_detail_bullets(self):
+        self.assertEqual(amazon.get_all_rankings(self._soup(DETAIL_BULLETS)), [
+            {"rank": "17031", "category": "Books"},
+            {"rank": "4", "category": "General Japan Travel Guides"},
+            {"rank": "63", "category": "Traveler & Explorer Biographies"},
+        ])
+
+    def test_no_rankings_section(self):
+        self.assertEqual(amazon.get_all_rankings(self._soup("<p>nothing</p>")), [])
+
+    def test_goodreads_counts(self):
+        html = """
+        <div class="RatingStatistics__meta">
+          <span data-testid="ratingsCount">1,204&nbsp;ratings</span>
+          <span data-testid="reviewsCount">187&nbsp;reviews</span>
+        </div>
+        """
+        soup = self._soup(html)
+        self.assertEqual(amazon.get_goodreads_ratings_count(soup), "1204")
+        self.assertEqual(amazon.get_goodreads_reviews_count(soup), "187")
+
+
+class TestFastPath(unittest.TestCase):
+    PAGE = (DETAIL_BULLETS + '<span data-hook="total-review-count">'
+            '<span class="a-size-base">1,234 global ratings</span></span>').encode()
+
+    def test_fast_path_matches_dom(self):
+        self.assertEqual(amazon.fast_extract_amazon(self.PAGE),
+                         amazon.extract_amazon(self.PAGE, mode="dom"))
+
+    def test_product_details_table_layout(self):
+        page = b"""<table id="productDetails_detailBullets_sections1"><tr>
+            <th class="a-color-secondary">Best Sellers Rank</th>
+            <td><span><span>#17,031 in Books (<a>See Top 100 in Books</a>)</span><br>
+            <span>#4 in <a>Memoirs</a></span></span></td></tr></table>
+            <span id="acrCustomerReviewText" class="a-size-base">(53)</span>"""
+        self.assertEqual(amazon.fast_extract_amazon(page), amazon.extract_amazon(page, mode="dom"))
+        self.assertEqual(amazon.fast_extract_amazon(page)["amazon_review_count"], "53")
+
+    def test_unparsable_review_element_falls_back_to_dom(self):
+        page = DETAIL_BULLETS.encode() + b'<span data-hook="total-review-count"\n>'
+        self.assertIsNone(amazon.fast_extract_amazon(page))
+
+    def test_counters_record_wins_and_fallbacks(self):
+        stats = amazon.Counters()
+        with mock.patch.object(amazon, "EXTRACT_STATS", stats):
+            amazon.extract_amazon(self.PAGE, mode="fast")
+            amazon.extract_amazon(b"<p>robot check</p>", mode="fast")
+        counts = stats.snapshot()
+        self.assertEqual((counts["fast_wins"], counts["fast_fallbacks"], counts["dom_pages"]),
+                         (1, 1, 1))
+
+
+class TestParsePool(unittest.TestCase):
+    def test_pool_results_and_counters_match_in_process(self):
+        page = TestFastPath.PAGE
+        stats = amazon.Counters()
+        with mock.patch.object(amazon, "EXTRACT_STATS", stats):
+            with amazon.parse_pool(1):
+                self.assertIsNotNone(amazon.PARSE_POOL)
+                pooled = amazon.run_extractor(amazon.extract_amazon, page)
+            self.assertIsNone(amazon.PARSE_POOL)
+            self.assertEqual(pooled, amazon.run_extractor(amazon.extract_amazon, page))
+        self.assertEqual(stats.snapshot()["fast_wins"], 2)
+
+
+for _backend in amazon.PARSER_BACKENDS:
+    if _backend == BackendTestCase.backend:
+        continue
+    for _case in (TestAmazonReviewCount, TestRankingsAndGoodreads):
+        _name = f"{_case.__name__}_{_backend.replace('.', '_')}"
+        globals()[_name] = unittest.skipUnless(
+            _backend in amazon.available_parsers(), f"{_backend} not installed",
+        )(type(_name, (_case,), {"backend": _backend}))
 
 
 class TestEntrySignature(unittest.TestCase):
@@ -139,6 +247,1041 @@ class TestLoadBooksValidation(unittest.TestCase):
                 {"slug": "a", "amazon_url": "y"},  # no display_name
             ])
 
+    def test_non_positive_interval_rejected(self):
+        with self.assertRaises(SystemExit):
+            self._write_and_load([
+                {"slug": "a", "display_name": "x", "amazon_url": "y", "interval_minutes": 0},
+            ])
+
+
+class TestBookScheduler(unittest.TestCase):
+    A = {"slug": "a", "interval_minutes": 1}
+    B = {"slug": "b", "interval_minutes": 10}
+
+    def test_books_run_on_their_own_intervals(self):
+        sched = amazon.BookScheduler()
+        sched.sync([self.A, self.B], now=0)
+        self.assertEqual([b["slug"] for b in sched.pop_due(0)], ["a", "b"])
+        sched.done(self.A, 0)
+        sched.done(self.B, 0)
+        self.assertEqual(sched.pop_due(59), [])
+        self.assertEqual(sched.seconds_until_next(59), 1)
+        self.assertEqual([b["slug"] for b in sched.pop_due(60)], ["a"])
+
+    def test_reload_adds_removes_and_retimes(self):
+        sched = amazon.BookScheduler()
+        sched.sync([self.A, self.B], now=0)
+        for book in sched.pop_due(0):
+            sched.done(book, 0)
+        c = {"slug": "c"}
+        sched.sync([{"slug": "a", "interval_minutes": 20}, c], now=30)
+        self.assertEqual([b["slug"] for b in sched.pop_due(30)], ["c"])
+        sched.done(c, 30)
+        # a's old 60s slot is stale; its new due time is 20 minutes after its last run.
+        self.assertEqual(sched.pop_due(1199), [])
+        self.assertEqual([b["slug"] for b in sched.pop_due(1200)], ["a"])
+        self.assertNotIn("b", sched.books)
+
+    def test_daemon_survives_truncated_books_json(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        books_file = Path(tmp.name) / "books.json"
+
+        def write(text, mtime_ns):
+            books_file.write_text(text)
+            os.utime(books_file, ns=(mtime_ns, mtime_ns))
+
+        book = {"slug": "a", "display_name": "A", "amazon_url": "https://x"}
+        write(json.dumps({"books": [book]}), 10**18)
+        scraped = []
+        stop = threading.Event()
+        with mock.patch.multiple(amazon, BOOKS_FILE=books_file, DATA_DIR=Path(tmp.name),
+                                 DAEMON_POLL_SECONDS=0.01,
+                                 scrape_all=lambda due, *_: scraped.extend(b["slug"] for b in due),
+                                 load_state=lambda *_: {"last_attempt_status": "unchanged"},
+                                 render_book=mock.Mock(return_value=None),
+                                 generate_top_index=mock.Mock(), log_run_stats=mock.Mock(),
+                                 write_run_metrics=mock.Mock()), \
+                mock.patch("builtins.print"):
+            daemon = threading.Thread(target=amazon.run_daemon,
+                                      args=(Path(tmp.name), mock.Mock(), 1, stop))
+            daemon.start()
+            try:
+                deadline = time.monotonic() + 5
+                while not scraped and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                write('{"books": [', 2 * 10**18)   # half-saved edit
+                time.sleep(0.1)
+                self.assertTrue(daemon.is_alive())
+                c = dict(book, slug="c")
+                write(json.dumps({"books": [book, c]}), 3 * 10**18)
+                while "c" not in scraped and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                self.assertTrue(daemon.is_alive())
+            finally:
+                stop.set()
+                daemon.join(5)
+        self.assertEqual(scraped, ["a", "c"])
+
+
+class TestConcurrentScrape(unittest.TestCase):
+    def test_token_bucket_paces_after_burst(self):
+        bucket = amazon.TokenBucket(rate=20.0, burst=2)
+        start = time.monotonic()
+        for _ in range(4):
+            bucket.acquire()
+        # Two tokens are free; the next two cost 1/20s each.
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_buckets_are_per_host(self):
+        a = amazon.host_bucket("https://www.amazon.com/dp/1")
+        self.assertIs(a, amazon.host_bucket("https://www.amazon.com/dp/2"))
+        self.assertIsNot(a, amazon.host_bucket("https://www.goodreads.com/book/show/1"))
+
+    def test_in_flight_tracker(self):
+        tracker = amazon.InFlightTracker()
+        token = tracker.start("https://x/1")
+        tracker.start("https://x/2")
+        self.assertEqual([url for url, _ in tracker.snapshot()], ["https://x/1", "https://x/2"])
+        tracker.finish(token)
+        self.assertEqual([url for url, _ in tracker.snapshot()], ["https://x/2"])
+
+    def test_concurrent_mode_scrapes_every_book_and_isolates_crashes(self):
+        books = [{"slug": s} for s in ("a", "b", "c")]
+        seen = []
+        lock = threading.Lock()
+
+        def fake_scrape(book, log, side_pool=None):
+            with lock:
+                seen.append(book["slug"])
+            if book["slug"] == "b":
+                raise RuntimeError("boom")
+
+        with mock.patch.object(amazon, "scrape_book", side_effect=fake_scrape), \
+                mock.patch("sys.stderr"):
+            amazon.scrape_all(books, mock.Mock(), workers=3)
+        self.assertEqual(sorted(seen), ["a", "b", "c"])
+
+
+def _response(status: int, body: bytes = b"", headers: dict | None = None):
+    r = amazon.requests.Response()
+    r.status_code = status
+    r._content = body
+    r.headers.update(headers or {})
+    return r
+
+
+class TestHttpCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cache = amazon.HttpCache(Path(self.tmp.name), ttl=60, max_entries=2)
+
+    def test_only_responses_with_validators_are_stored(self):
+        self.cache.store("https://x/a", _response(200, b"a"))
+        self.assertIsNone(self.cache.lookup("https://x/a"))
+        self.cache.store("https://x/b", _response(200, b"b", {"ETag": '"v1"'}))
+        meta = self.cache.lookup("https://x/b")
+        self.assertEqual(self.cache.conditional_headers(meta), {"If-None-Match": '"v1"'})
+
+    def test_eviction_keeps_newest_entries(self):
+        for i in range(3):
+            self.cache.store(f"https://x/{i}", _response(200, b"x", {"ETag": str(i)}))
+            time.sleep(0.01)
+        self.assertIsNone(self.cache.lookup("https://x/0"))
+        self.assertIsNotNone(self.cache.lookup("https://x/2"))
+
+    def test_304_is_served_from_cache(self):
+        url = "https://www.goodreads.com/book/show/1"
+        self.cache.store(url, _response(200, b"<html>cached</html>", {"ETag": '"v1"'}))
+        session = mock.Mock()
+        session.get.return_value = _response(304)
+        stats = amazon.Counters()
+        with mock.patch.object(amazon, "HTTP_CACHE", self.cache), \
+                mock.patch.object(amazon, "HTTP_STATS", stats), \
+                mock.patch.object(amazon, "host_session", return_value=session):
+            r = amazon.fetch_with_retry(url)
+        self.assertEqual(r.content, b"<html>cached</html>")
+        self.assertTrue(r.from_cache)
+        self.assertEqual(session.get.call_args.kwargs["headers"], {"If-None-Match": '"v1"'})
+        self.assertEqual(stats.snapshot(), {"not_modified": 1, "bytes_saved": 19})
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    URL = "https://www.amazon.com/dp/1"
+    CAPTCHA = b'<title>Robot Check</title><form action="/errors/validateCaptcha">'
+
+    def setUp(self):
+        for name, value in (("_host_breakers", {}), ("HTTP_CACHE", None),
+                            ("HTTP_STATS", amazon.Counters()),
+                            ("host_bucket", mock.Mock())):
+            patcher = mock.patch.object(amazon, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.session = mock.Mock()
+        patcher = mock.patch.object(amazon, "host_session", return_value=self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_block_detection(self):
+        self.assertTrue(amazon.is_blocked(_response(200, self.CAPTCHA)))
+        self.assertTrue(amazon.is_blocked(_response(503, self.CAPTCHA)))
+        self.assertTrue(amazon.is_blocked(_response(429)))
+        self.assertFalse(amazon.is_blocked(_response(503)))
+        self.assertFalse(amazon.is_blocked(_response(200, b"<html>product</html>")))
+
+    def test_plain_503_is_retried(self):
+        ok = _response(200, b"<html>product</html>")
+        self.session.get.side_effect = [_response(503, b"Service Unavailable"), ok]
+        with mock.patch.object(amazon.time, "sleep") as sleep:
+            self.assertIs(amazon.fetch_with_retry(self.URL), ok)
+        sleep.assert_called_once()
+        self.assertEqual(amazon.HTTP_STATS.snapshot().get("blocked"), None)
+        self.assertEqual(amazon.host_breaker(self.URL)._blocks, 0)
+
+    def test_blocks_trip_breaker_and_skip_host_until_cooldown(self):
+        self.session.get.return_value = _response(200, self.CAPTCHA)
+        with mock.patch.object(amazon, "BREAKER_THRESHOLD", 2), \
+                mock.patch.object(amazon.time, "sleep") as sleep, \
+                self.assertLogs("scrape", "WARNING") as logs:
+            for _ in range(4):
+                self.assertIsNone(amazon.fetch_with_retry(self.URL))
+        sleep.assert_not_called()  # blocked responses are not retried
+        self.assertEqual(self.session.get.call_count, 2)
+        self.assertEqual(amazon.HTTP_STATS.snapshot(),
+                         {"blocked": 2, "breaker_trips": 1, "breaker_skipped": 2})
+        self.assertIn("breaker", logs.output[0])
+
+        breaker = amazon.host_breaker(self.URL)
+        breaker._open_until = 0  # cool-down over: one good response closes it
+        self.session.get.return_value = _response(200, b"<html>product</html>")
+        self.assertIsNotNone(amazon.fetch_with_retry(self.URL))
+        self.assertTrue(breaker.allow())
+
+
+class DataDirTestCase(unittest.TestCase):
+    """Points amazon.DATA_DIR at a throwaway directory for the test."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.data_dir = Path(tmp.name)
+        patcher = mock.patch.object(amazon, "DATA_DIR", self.data_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+def _entry(ts: str, reviews: str = "10", rank: str = "5") -> dict:
+    return {"timestamp": ts, "amazon_review_count": reviews,
+            "rankings": [{"rank": rank, "category": "Books"}]}
+
+
+class TestAppendOnlyStorage(DataDirTestCase):
+    BOOK = {"slug": "b", "display_name": "B", "amazon_url": "https://www.amazon.com/dp/1"}
+
+    def test_append_and_read_back(self):
+        for i in range(3):
+            amazon.append_entry("b", _entry(f"2026-01-0{i + 1} 00:00:00", reviews=str(i)))
+        self.assertEqual([e["amazon_review_count"] for e in amazon.iter_entries("b")],
+                         ["0", "1", "2"])
+        self.assertEqual(amazon.read_last_entry("b")["amazon_review_count"], "2")
+
+    def test_torn_tail_is_ignored_then_dropped_on_append(self):
+        amazon.append_entry("b", _entry("2026-01-01 00:00:00"))
+        with open(amazon.entries_path("b"), "a") as f:
+            f.write('{"timestamp": "2026-01-02')
+        self.assertEqual(len(list(amazon.iter_entries("b"))), 1)
+        self.assertEqual(amazon.read_last_entry("b")["timestamp"], "2026-01-01 00:00:00")
+        amazon.append_entry("b", _entry("2026-01-03 00:00:00"))
+        self.assertEqual([e["timestamp"] for e in amazon.iter_entries("b")],
+                         ["2026-01-01 00:00:00", "2026-01-03 00:00:00"])
+
+    def test_legacy_envelope_is_split_on_first_read(self):
+        amazon.write_atomic(amazon.state_path("b"), {
+            "slug": "b", "display_name": "Old", "last_successful_scrape": "2026-01-02 00:00:00",
+            "entries": [_entry("2026-01-01 00:00:00"), _entry("2026-01-02 00:00:00", rank="4")],
+        })
+        state = amazon.load_state("b", "B")
+        self.assertEqual(state["display_name"], "B")
+        self.assertEqual(state["last_successful_scrape"], "2026-01-02 00:00:00")
+        self.assertNotIn("entries", json.loads(amazon.state_path("b").read_text()))
+        self.assertEqual(len(amazon.load_envelope("b", "B")["entries"]), 2)
+
+    def test_compact_drops_consecutive_duplicates(self):
+        amazon.rewrite_entries("b", [_entry("1"), _entry("2"), _entry("3", rank="4"), _entry("4")])
+        amazon.save_state("b", amazon.load_state("b", "B"))
+        self.assertEqual(amazon.compact_history(self.BOOK), (4, 3))
+
+    def test_no_change_scrape_appends_nothing(self):
+        scraped = {"amazon_review_count": "10", "rankings": [{"rank": "5", "category": "Books"}]}
+        with mock.patch.object(amazon, "get_amazon_data", return_value=scraped), \
+                mock.patch("builtins.print"):
+            amazon.scrape_book(self.BOOK, mock.Mock())
+            amazon.scrape_book(self.BOOK, mock.Mock())
+        self.assertEqual(len(list(amazon.iter_entries("b"))), 1)
+        state = amazon.load_state("b", "B")
+        self.assertEqual(state["last_attempt_status"], "no-change")
+
+
+class TestMetrics(DataDirTestCase):
+    BOOK = TestAppendOnlyStorage.BOOK
+
+    def test_scrape_record_carries_phase_timings_and_sizes(self):
+        page = TestFastPath.PAGE
+        session = mock.Mock()
+        session.get.return_value = _response(200, page)
+        metrics = amazon.RunMetrics()
+        with mock.patch.object(amazon, "host_session", return_value=session), \
+                mock.patch.object(amazon, "HTTP_CACHE", None), \
+                mock.patch.object(amazon, "_host_breakers", {}), \
+                mock.patch.object(amazon, "host_bucket", mock.Mock()), \
+                mock.patch.object(amazon, "RUN_METRICS", metrics), \
+                mock.patch("builtins.print"), \
+                self.assertLogs("scrape.test", "INFO") as logs:
+            amazon.scrape_book(self.BOOK, amazon.logging.getLogger("scrape.test"))
+        fields = logs.records[0].extra_fields
+        self.assertEqual(fields["reason"], "appended")
+        self.assertEqual(set(fields["timings_ms"]), {"load", "amazon_wait", "amazon_fetch",
+                                                     "amazon_parse", "signature", "persist"})
+        self.assertEqual(fields["bytes"], {"amazon": len(page)})
+        text = metrics.render()
+        self.assertIn('amazon_scrape_phase_seconds_count{phase="amazon_fetch"} 1', text)
+        self.assertIn('amazon_scrape_books_total{status="appended"} 1', text)
+
+    def test_prometheus_histogram_buckets_are_cumulative(self):
+        metrics = amazon.RunMetrics()
+        for seconds in (0.002, 0.2, 99):
+            metrics.observe("amazon_scrape_phase_seconds", seconds, phase="render")
+        metrics.write_prometheus(self.data_dir / "metrics.prom")
+        lines = (self.data_dir / "metrics.prom").read_text().splitlines()
+        self.assertIn("# TYPE amazon_scrape_phase_seconds histogram", lines)
+        self.assertIn('amazon_scrape_phase_seconds_bucket{phase="render",le="0.005"} 1', lines)
+        self.assertIn('amazon_scrape_phase_seconds_bucket{phase="render",le="0.25"} 2', lines)
+        self.assertIn('amazon_scrape_phase_seconds_bucket{phase="render",le="60"} 2', lines)
+        self.assertIn('amazon_scrape_phase_seconds_bucket{phase="render",le="+Inf"} 3', lines)
+        self.assertIn('amazon_scrape_phase_seconds_count{phase="render"} 3', lines)
+
+    def test_prometheus_counters_and_gauges_are_exact(self):
+        metrics = amazon.RunMetrics()
+        metrics.set("amazon_scrape_last_run_timestamp_seconds", 1792261234.5)
+        metrics.set("amazon_scrape_run_seconds", 12.0)
+        stats = amazon.Counters()
+        stats.add(downloaded=3, bytes_downloaded=2359912, bytes_saved=7)
+        with mock.patch.object(amazon, "HTTP_STATS", stats), \
+                mock.patch.object(amazon, "RUN_METRICS", metrics):
+            amazon.log_run_stats(mock.Mock())
+        lines = metrics.render().splitlines()
+        self.assertIn("amazon_scrape_last_run_timestamp_seconds 1792261234.5", lines)
+        self.assertIn("amazon_scrape_run_seconds 12", lines)
+        self.assertIn('amazon_scrape_http_bytes_total{kind="downloaded"} 2359912', lines)
+        self.assertIn('amazon_scrape_http_bytes_total{kind="saved"} 7', lines)
+        self.assertIn('amazon_scrape_http_events_total{event="downloaded"} 3', lines)
+        self.assertFalse(any("bytes" in line for line in lines if "http_events" in line))
+
+
+class TestDeltaLog(DataDirTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(amazon, "LOG_ENCODING", "delta")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def _history() -> list[dict]:
+        def entry(ts, reviews, ranks, **extra):
+            return {"timestamp": ts, "amazon_review_count": reviews,
+                    "rankings": [{"rank": r, "category": c} for c, r in ranks], **extra}
+        return [
+            entry("1", "10", [("Books", "17031"), ("Memoirs", "4")]),
+            entry("2", "10", [("Books", "16000"), ("Memoirs", "4")]),
+            entry("3", "11", [("Books", "16000"), ("Memoirs", "4")], goodreads_ratings_count="5"),
+            entry("4", "11", [("Memoirs", "3"), ("Books", "16000")]),       # reordered
+            entry("5", "11", [("Books", "15000"), ("Travel", "9")]),        # new category
+            entry("6", "11", [("Books", "01")]),                            # not packable
+            entry("7", "12", [("Books", "14000")]),
+        ]
+
+    def test_round_trip_and_tail_reads(self):
+        history = self._history()
+        amazon.rewrite_entries("b", history)
+        self.assertEqual(list(amazon.iter_entries("b")), history)
+        self.assertEqual([list(e) for e in amazon.iter_entries("b")], [list(e) for e in history])
+        self.assertEqual(amazon.read_last_entry("b"), history[-1])
+        lines = amazon.entries_path("b").read_text().splitlines()
+        self.assertEqual(json.loads(lines[1]), {"~": "d", "timestamp": "2", "p": [[0, 16000]]})
+        self.assertNotIn("~", json.loads(lines[5]))  # "01" kept as a plain line
+
+    def test_repeated_category_round_trips(self):
+        ranks = lambda travel: [{"rank": "1", "category": "Books"}, {"rank": "5", "category": "Travel"},
+                                {"rank": travel, "category": "Travel"}]
+        history = [{"timestamp": "1", "rankings": ranks("7")},
+                   {"timestamp": "2", "rankings": ranks("9")}]
+        amazon.rewrite_entries("b", history)
+        self.assertEqual(list(amazon.iter_entries("b")), history)
+        self.assertEqual(amazon.read_last_entry("b"), history[-1])
+
+    def test_legacy_category_id_deltas_still_decode(self):
+        amazon.entries_path("b").write_text(
+            '{"~":"k","c":["Books","Memoirs"],"timestamp":"1","rankings":[[0,9],[1,4]]}\n'
+            '{"~":"d","timestamp":"2","r":[[1,3]]}\n')
+        self.assertEqual([[r["rank"] for r in e["rankings"]] for e in amazon.iter_entries("b")],
+                         [["9", "4"], ["9", "3"]])
+
+    def test_appends_match_rewrite_and_resume_mid_segment(self):
+        history = self._history()
+        for entry in history:
+            amazon.append_entry("b", entry)
+        appended = amazon.entries_path("b").read_bytes()
+        amazon.rewrite_entries("b", history)
+        self.assertEqual(amazon.entries_path("b").read_bytes(), appended)
+        positions = [p for p, _ in amazon._entries_since("b", 0)]
+        self.assertEqual([e for _, e in amazon._entries_since("b", positions[2])], history[3:])
+        self.assertEqual(amazon._entry_before("b", positions[1]), history[1])
+
+    def test_keyframes_bound_segments(self):
+        with mock.patch.object(amazon, "KEYFRAME_INTERVAL", 3):
+            history = [_entry(str(i), rank=str(i + 1)) for i in range(7)]
+            amazon.rewrite_entries("b", history)
+        kinds = [json.loads(line)["~"] for line in amazon.entries_path("b").read_text().splitlines()]
+        self.assertEqual(kinds, ["k", "d", "d", "k", "d", "d", "k"])
+        self.assertEqual(amazon.read_last_entry("b"), history[-1])
+
+    def test_mixed_plain_and_delta_log(self):
+        with mock.patch.object(amazon, "LOG_ENCODING", "plain"):
+            amazon.append_entry("b", _entry("1"))
+        amazon.append_entry("b", _entry("2", rank="4"))
+        amazon.append_entry("b", _entry("3", rank="3"))
+        self.assertEqual([e["rankings"][0]["rank"] for e in amazon.iter_entries("b")],
+                         ["5", "4", "3"])
+        self.assertEqual(amazon.compact_history({"slug": "b", "display_name": "B"}), (3, 3))
+        self.assertEqual(json.loads(amazon.entries_path("b").read_text().splitlines()[0])["~"], "k")
+
+
+class TestTieredRetention(DataDirTestCase):
+    BOOK = TestAppendOnlyStorage.BOOK
+    NOW = amazon.datetime(2026, 6, 1)
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(amazon, "DOWNSAMPLE_RULES", ())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Every 20 minutes from Jan 1 into late May: Jan-Apr are sealed.
+        self.history = [_entry(f"2026-{m:02d}-{d:02d} {h:02d}:{mi:02d}:00", rank=str(i))
+                        for i, (m, d, h, mi) in enumerate(
+                            (m, d, h, mi) for m in (1, 2, 3, 4, 5) for d in (10, 25)
+                            for h in (8, 9) for mi in (0, 20, 40))]
+        amazon.rewrite_entries("b", self.history)
+        amazon.save_state("b", amazon.load_state("b", "B"))
+
+    def test_seal_moves_old_months_to_cold_segments(self):
+        stats = amazon.seal_history(self.BOOK, now=self.NOW)
+        self.assertEqual(stats, {"sealed": 48, "dropped": 0, "segments": 4})
+        self.assertEqual(len(list(amazon.iter_entries("b", cold=False))), 12)
+        self.assertEqual(list(amazon.iter_entries("b")), self.history)
+        self.assertEqual(amazon.read_last_entry("b"), self.history[-1])
+        with mock.patch.object(amazon, "_read_segment", wraps=amazon._read_segment) as read:
+            recent = list(amazon.iter_entries("b", since="2026-04-20 00:00:00"))
+        self.assertEqual(read.call_count, 1)  # only April's segment
+        self.assertEqual(recent, self.history[42:])
+
+    def test_downsampling_thins_aging_segments(self):
+        amazon.seal_history(self.BOOK, now=self.NOW)
+        with mock.patch.object(amazon, "DOWNSAMPLE_RULES", ((90, 3600),)):
+            stats = amazon.seal_history(self.BOOK, now=self.NOW)
+        # January and February (newest entry 90+ days old) keep the last entry per hour.
+        self.assertEqual(stats, {"sealed": 0, "dropped": 16, "segments": 2})
+        kept = [e["timestamp"] for e in amazon.iter_entries("b", cold=True)][:8]
+        self.assertEqual(kept[:2], ["2026-01-10 08:40:00", "2026-01-10 09:40:00"])
+        self.assertEqual(len(list((self.data_dir / "b.cold").glob("*.jsonl.gz"))), 4)
+
+    def test_interrupted_seal_shows_no_duplicates(self):
+        with mock.patch.object(amazon, "rewrite_entries"):
+            amazon.seal_history(self.BOOK, now=self.NOW)
+        self.assertEqual(len(list(amazon.iter_entries("b", cold=False))), 12)
+        self.assertEqual(list(amazon.iter_entries("b")), self.history)
+
+    def test_rollup_rebuild_includes_cold_entries(self):
+        amazon.update_rollup("b")
+        amazon.seal_history(self.BOOK, now=self.NOW)
+        self.assertEqual(len(amazon.update_rollup("b")["days"]), 10)
+
+
+class TestPageArchive(DataDirTestCase):
+    BOOK = TestAppendOnlyStorage.BOOK
+
+    @staticmethod
+    def _page(reviews: str, rank: str) -> bytes:
+        return (f'<span data-hook="total-review-count">{reviews} global ratings</span>'
+                f'<div id="detailBulletsWrapper_feature_div"><span>Best Sellers Rank: '
+                f'#{rank} in Books</span></div>').encode()
+
+    def test_pages_are_deduplicated(self):
+        archive = amazon.PageArchive(self.data_dir / "archive")
+        for ts in ("2026-01-01 00:00:00", "2026-01-02 00:00:00"):
+            archive.put("b", ts, "amazon", "https://x", self._page("7", "5"))
+        self.assertEqual(len(list((self.data_dir / "archive" / "objects").rglob("*.gz"))), 1)
+        self.assertEqual(len(list(archive.iter_index())), 2)
+        sha = next(archive.iter_index())["sha256"]
+        self.assertEqual(archive.read(sha), self._page("7", "5"))
+
+    def test_reextract_rebuilds_log_from_archive(self):
+        archive = amazon.PageArchive(self.data_dir / "archive")
+        amazon.append_entry("b", _entry("2025-12-31 00:00:00", reviews="1"))  # pre-archive
+        # What the buggy extractor logged at the time:
+        amazon.append_entry("b", _entry("2026-01-01 00:00:00", reviews="553"))
+        for ts, reviews, rank in (("2026-01-01 00:00:00", "53", "5"),
+                                  ("2026-01-02 00:00:00", "53", "5"),   # duplicate
+                                  ("2026-01-03 00:00:00", "54", "4")):
+            archive.put("b", ts, "amazon", self.BOOK["amazon_url"], self._page(reviews, rank))
+        archive.put("other", "2026-01-02 00:00:00", "amazon", "https://y", self._page("1", "1"))
+
+        self.assertEqual(amazon.reextract_book(self.BOOK, archive), (3, 3))
+        self.assertEqual([(e["timestamp"][:10], e["amazon_review_count"])
+                          for e in amazon.iter_entries("b")],
+                         [("2025-12-31", "1"), ("2026-01-01", "53"), ("2026-01-03", "54")])
+        self.assertEqual(amazon.last_signature("b", False), amazon._signature_key(
+            amazon.entry_signature(amazon.read_last_entry("b"), False)))
+
+    def test_reextract_keeps_entries_scraped_without_archive(self):
+        archive = amazon.PageArchive(self.data_dir / "archive")
+        amazon.append_entry("b", _entry("2026-01-01 00:00:00", reviews="553"))
+        archive.put("b", "2026-01-01 00:00:00", "amazon", "https://x", self._page("53", "5"))
+        amazon.append_entry("b", _entry("2026-01-02 00:00:00", reviews="60"))
+        amazon.append_entry("b", _entry("2026-01-03 00:00:00", reviews="61"))
+        # Archiving was switched back on later; this page no longer parses.
+        amazon.append_entry("b", _entry("2026-01-04 00:00:00", reviews="62"))
+        archive.put("b", "2026-01-04 00:00:00", "amazon", "https://x", b"<p>robot check</p>")
+
+        self.assertEqual(amazon.reextract_book(self.BOOK, archive), (2, 4))
+        self.assertEqual([e["amazon_review_count"] for e in amazon.iter_entries("b")],
+                         ["53", "60", "61", "62"])
+
+    def test_reextract_keeps_sealed_history(self):
+        history = [_entry(f"2026-0{m}-01 00:00:00", reviews=str(m)) for m in range(1, 6)]
+        amazon.rewrite_entries("b", history)
+        amazon.save_state("b", amazon.load_state("b", "B"))
+        with mock.patch.object(amazon, "DOWNSAMPLE_RULES", ()):
+            amazon.seal_history(self.BOOK, now=amazon.datetime(2026, 6, 15))
+        archive = amazon.PageArchive(self.data_dir / "archive")
+        archive.put("b", "2026-02-01 00:00:00", "amazon", "https://x", self._page("20", "5"))
+        self.assertTrue((self.data_dir / "b.cold").exists())
+
+        self.assertEqual(amazon.reextract_book(self.BOOK, archive), (1, 5))
+        self.assertFalse((self.data_dir / "b.cold").exists())
+        self.assertEqual([e["amazon_review_count"] for e in amazon.iter_entries("b")],
+                         ["1", "20", "3", "4", "5"])
+
+
+class TestSignatureSidecar(DataDirTestCase):
+    def test_fresh_sidecar_avoids_reading_the_log(self):
+        amazon.append_entry("b", _entry("1"))
+        sig = amazon.entry_signature(_entry("1"), False)
+        amazon.save_last_signature("b", sig, False)
+        with mock.patch.object(amazon, "read_last_entry") as read:
+            self.assertEqual(amazon.last_signature("b", False), amazon._signature_key(sig))
+        read.assert_not_called()
+
+    def test_stale_or_missing_sidecar_is_rebuilt(self):
+        amazon.append_entry("b", _entry("1"))
+        amazon.save_last_signature("b", amazon.entry_signature(_entry("1"), False), False)
+        amazon.append_entry("b", _entry("2", rank="9"))  # log changed behind the sidecar
+        expected = amazon._signature_key(amazon.entry_signature(_entry("2", rank="9"), False))
+        self.assertEqual(amazon.last_signature("b", False), expected)
+        amazon.signature_path("b").unlink()
+        self.assertEqual(amazon.last_signature("b", False), expected)
+        self.assertTrue(amazon.signature_path("b").exists())
+
+    def test_goodreads_mode_change_invalidates_sidecar(self):
+        amazon.append_entry("b", _entry("1"))
+        amazon.save_last_signature("b", amazon.entry_signature(_entry("1"), False), False)
+        self.assertEqual(amazon.last_signature("b", True),
+                         amazon._signature_key(amazon.entry_signature(_entry("1"), True)))
+
+
+class TestSqliteStorage(DataDirTestCase):
+    BOOK = TestAppendOnlyStorage.BOOK
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(amazon, "STORAGE_BACKEND", "sqlite")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_round_trip_preserves_entry_shape(self):
+        entry = {"timestamp": "2026-01-01 00:00:00", "amazon_review_count": "53",
+                 "rankings": [{"rank": "17031", "category": "Books"},
+                              {"rank": "4", "category": "Memoirs"}],
+                 "goodreads_ratings_count": "120"}
+        amazon.append_entry("b", entry)
+        self.assertEqual(list(amazon.iter_entries("b")), [entry])
+        self.assertEqual(amazon.read_last_entry("b"), entry)
+
+    def test_import_from_json_files(self):
+        with mock.patch.object(amazon, "STORAGE_BACKEND", "files"):
+            amazon.rewrite_entries("b", [_entry("1"), _entry("2", rank="3")])
+            amazon.save_state("b", dict(amazon.load_state("b", "B"), last_error="x"))
+        self.assertEqual(amazon.import_into_sqlite(self.BOOK), 2)
+        self.assertEqual(amazon.load_state("b", "B")["last_error"], "x")
+        self.assertEqual([e["timestamp"] for e in amazon.iter_entries("b")], ["1", "2"])
+        self.assertEqual(amazon.sqlite_history().best_ranks("b"), {"Books": (3, "2")})
+        self.assertEqual(amazon.STORAGE_BACKEND, "sqlite")
+
+    def test_rank_queries_use_slug_indexes(self):
+        conn = amazon.sqlite_history().connect()
+        plans = {
+            "SELECT snapshot_id FROM rankings WHERE slug = 'b' AND snapshot_id > 0 "
+            "ORDER BY snapshot_id, position": "rankings_slug_snapshot",
+            "SELECT MIN(rank) FROM rankings WHERE slug = 'b' AND category = 'Books'":
+                "rankings_slug_cat_ts",
+        }
+        for query, index in plans.items():
+            plan = " ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + query))
+            self.assertRegex(plan, f"USING (COVERING )?INDEX {index} ")
+
+    def test_since_reads_only_later_entries(self):
+        for ts, rank in (("1", "9"), ("2", "8"), ("3", "7")):
+            amazon.append_entry("b", _entry(ts, rank=rank))
+        later = list(amazon.iter_entries("b", since="2"))
+        self.assertEqual([(e["timestamp"], e["rankings"][0]["rank"]) for e in later],
+                         [("2", "8"), ("3", "7")])
+        self.assertEqual(list(amazon.iter_entries("b", since="4")), [])
+
+    def test_no_change_scrape_appends_nothing(self):
+        scraped = {"amazon_review_count": "10", "rankings": [{"rank": "5", "category": "Books"}]}
+        with mock.patch.object(amazon, "get_amazon_data", return_value=scraped), \
+                mock.patch("builtins.print"):
+            amazon.scrape_book(self.BOOK, mock.Mock())
+            amazon.scrape_book(self.BOOK, mock.Mock())
+        self.assertEqual(len(list(amazon.iter_entries("b"))), 1)
+        self.assertFalse(amazon.entries_path("b").exists())
+
+    def test_wal_mode(self):
+        mode = amazon.sqlite_history().connect().execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, "wal")
+
+
+class TestAdaptiveInterval(DataDirTestCase):
+    BOOK = {"slug": "b", "display_name": "B"}
+
+    def test_seed_from_entry_spacing_within_bounds(self):
+        policy = amazon.AdaptiveInterval(min_minutes=30, max_minutes=600)
+        self.assertEqual(policy.seed(self.BOOK), amazon.DEFAULT_INTERVAL_MINUTES * 60)  # no history
+        for ts in ("2026-01-01 00:00:00", "2026-01-01 01:00:00", "2026-01-01 03:00:00"):
+            amazon.append_entry("b", _entry(ts))
+        self.assertEqual(policy.seed(self.BOOK), 90 * 60)
+        self.assertEqual(policy.seed({**self.BOOK, "max_interval_minutes": 45}), 45 * 60)
+
+    def test_tail_read_matches_full_scan(self):
+        for encoding, backend in (("plain", "files"), ("delta", "files"), ("plain", "sqlite")):
+            with self.subTest(encoding=encoding, backend=backend), \
+                    mock.patch.multiple(amazon, LOG_ENCODING=encoding, STORAGE_BACKEND=backend,
+                                        KEYFRAME_INTERVAL=3):
+                slug = f"{encoding}-{backend}"
+                for i in range(7):
+                    amazon.append_entry(slug, _entry(f"2026-01-0{i + 1} 00:00:00", str(i), str(90 - i)))
+                entries = list(amazon.iter_entries(slug))
+                for n in (0, 1, 3, 7, 20):
+                    self.assertEqual(amazon.read_tail_entries(slug, n), entries[len(entries) - n:] if n else [])
+
+    def test_changes_speed_up_and_quiet_backs_off(self):
+        policy = amazon.AdaptiveInterval(min_minutes=30, max_minutes=120)
+        sched = amazon.BookScheduler(policy)
+        sched.sync([self.BOOK], now=0)
+        sched.pop_due(0)
+        self.assertEqual(sched.done(self.BOOK, 0, "no-change"), 120 * 60)
+        self.assertEqual(sched.done(self.BOOK, 0, "appended"), 60 * 60)
+        self.assertEqual(sched.done(self.BOOK, 0, "appended"), 30 * 60)
+        self.assertEqual(sched.done(self.BOOK, 0, "failed"), 30 * 60)
+        self.assertEqual(sched.done(self.BOOK, 0, "no-change"), 45 * 60)
+
+
+class TestIncrementalRender(DataDirTestCase):
+    BOOK = TestAppendOnlyStorage.BOOK
+
+    def setUp(self):
+        super().setUp()
+        self.out = self.data_dir / "site"
+        self.template = self.data_dir / "template.html"
+        self.template.write_text("<script>const historyData = {{DATA_PLACEHOLDER}};</script>")
+        patcher = mock.patch.object(amazon, "TEMPLATE_FILE", self.template)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        amazon.append_entry("b", _entry("2026-01-01 00:00:00"))
+        amazon.save_state("b", amazon.load_state("b", "B"))
+
+    def render(self):
+        return amazon.generate_book_dashboard(self.BOOK, self.out)
+
+    def test_unchanged_inputs_skip_render(self):
+        self.assertEqual(self.render(), "rendered")
+        self.assertEqual(self.render(), "unchanged")
+        html = (self.out / "b" / "index.html").read_text()
+        self.assertIn('"display_name":"B"', html)
+
+    def test_new_entry_or_template_change_re_renders(self):
+        self.render()
+        amazon.append_entry("b", _entry("2026-01-02 00:00:00", rank="4"))
+        self.assertEqual(self.render(), "rendered")
+        self.template.write_text("<!-- v2 -->{{DATA_PLACEHOLDER}}")
+        os.utime(self.template, ns=(0, time.time_ns() + 10**9))
+        self.assertEqual(self.render(), "rendered")
+        self.assertTrue((self.out / "b" / "index.html").read_text().startswith("<!-- v2 -->"))
+
+    def test_page_embeds_rollup_payload(self):
+        self.render()
+        page = (self.out / "b" / "index.html").read_text()
+        payload = json.loads(page[len("<script>const historyData = "):-len(";</script>")])
+        self.assertEqual(payload["timestamps"], ["2026-01-01 00:00:00"])
+        self.assertNotIn("entries", payload)
+
+    def test_chunked_mode_writes_monthly_files(self):
+        import gzip
+        amazon.append_entry("b", _entry("2026-02-03 00:00:00", rank="4"))
+        with mock.patch.object(amazon, "RENDER_MODE", "chunked"):
+            self.render()
+        chunk_dir = self.out / "b" / "data"
+        jan = json.loads((chunk_dir / "2026-01.json").read_text())
+        self.assertEqual(jan["timestamps"], ["2026-01-01 00:00:00"])
+        self.assertEqual(jan["ranks"], [[5]])
+        self.assertEqual(gzip.decompress((chunk_dir / "2026-02.json.gz").read_bytes()),
+                         (chunk_dir / "2026-02.json").read_bytes())
+        page = (self.out / "b" / "index.html").read_text()
+        manifest = json.loads(page[len("<script>const historyData = "):-len(";</script>")])
+        self.assertEqual([c["file"] for c in manifest["chunks"]],
+                         ["data/2026-01.json", "data/2026-02.json"])
+        self.assertNotIn("timestamps", manifest)
+
+    def test_bundle_mode_moves_code_to_shared_assets(self):
+        self.template.write_text(
+            "<style data-bundle>body{}</style>"
+            "<script>const historyData = {{DATA_PLACEHOLDER}};</script>"
+            "<script data-bundle>run(historyData);</script>")
+        with mock.patch.object(amazon, "BUNDLE_ASSETS", True):
+            self.assertEqual(self.render(), "rendered")
+        page = (self.out / "b" / "index.html").read_text()
+        self.assertNotIn("run(historyData)", page)
+        assets = sorted(p.name for p in (self.out / "assets").glob("dashboard.*"))
+        css = next(n for n in assets if n.endswith(".css"))
+        js = next(n for n in assets if n.endswith(".js"))
+        self.assertIn(f'href="../assets/{css}"', page)
+        self.assertIn(f'src="../assets/{js}"', page)
+        self.assertEqual((self.out / "assets" / js).read_text(), "run(historyData);")
+        # Toggling the mode re-renders even though the history is unchanged.
+        self.assertEqual(self.render(), "rendered")
+        self.assertIn("run(historyData)", (self.out / "b" / "index.html").read_text())
+
+    def test_book_without_history(self):
+        self.assertIsNone(amazon.generate_book_dashboard(
+            {"slug": "none", "display_name": "N"}, self.out))
+
+
+class TestRollups(DataDirTestCase):
+    def test_daily_representative_is_highest_review_count(self):
+        for e in (_entry("2026-01-01 08:00:00", reviews="5"),
+                  _entry("2026-01-01 12:00:00", reviews="7", rank="3"),
+                  _entry("2026-01-01 18:00:00", reviews="7", rank="4"),
+                  _entry("2026-01-02 09:00:00", reviews="", rank="1")):
+            amazon.append_entry("b", e)
+        payload = amazon.build_dashboard_payload(amazon.load_state("b", "B"),
+                                                 amazon.update_rollup("b"))
+        # Ties break to the later entry; entries without a review count are skipped.
+        self.assertEqual(payload["timestamps"], ["2026-01-01 18:00:00"])
+        self.assertEqual(payload["series"], [{"category": "Books", "ranks": [4], "ma": None}])
+        self.assertEqual(payload["best_ranks"],
+                         [{"category": "Books", "rank": 3, "timestamp": "2026-01-01 12:00:00"}])
+
+    def test_rollup_folds_only_new_entries(self):
+        amazon.append_entry("b", _entry("2026-01-01 00:00:00"))
+        amazon.update_rollup("b")
+        amazon.append_entry("b", _entry("2026-01-02 00:00:00", rank="4"))
+        with mock.patch.object(amazon, "_fold_entry", wraps=amazon._fold_entry) as fold:
+            rollup = amazon.update_rollup("b")
+        self.assertEqual(fold.call_count, 1)
+        self.assertEqual(sorted(rollup["days"]), ["2026-01-01", "2026-01-02"])
+
+    def test_rewritten_log_rebuilds_rollup(self):
+        amazon.append_entry("b", _entry("2026-01-01 00:00:00"))
+        amazon.append_entry("b", _entry("2026-01-02 00:00:00", rank="4"))
+        amazon.update_rollup("b")
+        amazon.rewrite_entries("b", [_entry("2026-01-05 00:00:00", rank="9"),
+                                     _entry("2026-01-06 00:00:00", rank="8")])
+        self.assertEqual(sorted(amazon.update_rollup("b")["days"]), ["2026-01-05", "2026-01-06"])
+
+    def test_moving_average_is_time_windowed(self):
+        from datetime import datetime, timedelta
+        t0 = datetime(2026, 1, 1)
+        times = [t0, t0 + timedelta(days=1), t0 + timedelta(days=9)]
+        self.assertEqual(amazon.moving_average([10, None, 30], times), [10.0, 10.0, 30.0])
+
+
+class TestDataQuality(DataDirTestCase):
+    BOOK = {"slug": "b", "display_name": "B"}
+
+    def _history(self, n, start=0):
+        return [_entry(f"2026-01-{start + i + 1:02d} 00:00:00", reviews=str(10 + start + i),
+                       rank=str(1000 + 10 * (start + i))) for i in range(n)]
+
+    def test_patches_applied_to_dashboards_not_to_log(self):
+        import clean_goodreads_data as cgd
+        history = self._history(9)
+        history[4]["goodreads_ratings_count"] = "17031"
+        history[4]["goodreads_reviews_count"] = "12"
+        history[5]["rankings"][0]["rank"] = "3"   # and back to ~1000 after
+        for e in history:
+            amazon.append_entry("b", e)
+        amazon.update_rollup("b")
+
+        patches = cgd.check_book(self.BOOK)["patches"]
+        self.assertEqual([(p["timestamp"][:10], p["rule"]) for p in patches],
+                         [("2026-01-05", "goodreads_max"), ("2026-01-06", "rank_spike")])
+        self.assertEqual(patches[0]["values"]["goodreads_ratings_count"], "17031")
+        self.assertEqual(list(amazon.iter_entries("b")), history)
+        entries = amazon.load_envelope("b", "B")["entries"]
+        self.assertNotIn("goodreads_reviews_count", entries[4])
+        self.assertEqual(entries[5]["rankings"], [])
+        # New corrections invalidate the cached rollup.
+        self.assertEqual(amazon.update_rollup("b")["best"]["Books"][0], 1000)
+
+    def test_only_new_entries_are_examined(self):
+        import clean_goodreads_data as cgd
+        for e in self._history(5):
+            amazon.append_entry("b", e)
+        first = cgd.check_book(self.BOOK)
+        # The last three wait for the entries that show whether they revert.
+        self.assertEqual((first["examined"], first["decided"]), (5, 2))
+        later = self._history(4, start=5)
+        later[0]["amazon_review_count"] = "900"
+        for e in later:
+            amazon.append_entry("b", e)
+        result = cgd.check_book(self.BOOK)
+        # The rolling median carries over from the checkpoint.
+        self.assertEqual((result["examined"], result["decided"]), (7, 4))
+        self.assertEqual([(p["timestamp"][:10], p["rule"]) for p in result["patches"]],
+                         [("2026-01-06", "review_spike")])
+        self.assertEqual(cgd.check_book(self.BOOK)["examined"], 3)
+        full = cgd.check_book(self.BOOK, full=True)
+        self.assertEqual((full["examined"], full["patches"]), (9, []))
+        self.assertEqual(len(amazon.patches_path("b").read_text().splitlines()), 1)
+
+    def test_rewritten_log_resets_checkpoint(self):
+        import clean_goodreads_data as cgd
+        for e in self._history(4):
+            amazon.append_entry("b", e)
+        cgd.check_book(self.BOOK)
+        amazon.rewrite_entries("b", self._history(3, start=10))
+        self.assertEqual(cgd.check_book(self.BOOK)["examined"], 3)
+
+    def test_pure_python_detectors_match_numpy(self):
+        import clean_goodreads_data as cgd
+        values = [5, 6, 5, 500, 7, 6, 1, 8, 9, 10]
+        with mock.patch.object(cgd, "HAVE_NUMPY", False):
+            medians = cgd.rolling_median([4], values)
+            mask = cgd.spikes(values, medians, 10)
+        self.assertEqual(medians[:3], [None, None, 5])
+        self.assertEqual([v for v, m in zip(values, mask) if m], [500])
+        with mock.patch.object(cgd, "HAVE_NUMPY", False):
+            forward = cgd.forward_median(values)
+        self.assertEqual(forward[2:4], [7, 6])
+        self.assertIsNone(forward[-1])
+        if cgd.HAVE_NUMPY:
+            self.assertEqual(cgd.rolling_median([4], values), medians)
+            self.assertEqual(cgd.spikes(values, medians, 10), mask)
+            self.assertEqual(cgd.forward_median(values), forward)
+
+    def test_level_shift_is_not_a_spike(self):
+        import clean_goodreads_data as cgd
+        # A promotion surge and a burst of reviews: both persist.
+        history = [_entry(f"2026-01-{i + 1:02d} 00:00:00", reviews="8" if i < 9 else "40",
+                          rank="150000" if i < 9 else "900") for i in range(18)]
+        for e in history:
+            amazon.append_entry("b", e)
+        result = cgd.check_book(self.BOOK)
+        self.assertEqual((result["decided"], result["patches"]), (15, []))
+        self.assertFalse(amazon.patches_path("b").exists())
+
+
+def _rows(values) -> list:
+    return values.tolist() if hasattr(values, "tolist") else values
+
+
+class TestAnalytics(DataDirTestCase):
+    """Pure-Python queries; re-run below with numpy when it is installed."""
+
+    numpy = False
+
+    def setUp(self):
+        super().setUp()
+        import analytics
+        self.analytics = analytics
+        patcher = mock.patch.object(analytics, "HAVE_NUMPY", self.numpy)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for day, reviews, rank in ((1, "10", "500"), (2, "12", "400"), (4, "20", "300")):
+            amazon.append_entry("a", _entry(f"2026-01-0{day} 06:00:00", reviews, rank))
+        for day, reviews, rank in ((2, "5", "900"), (3, "6", "800"), (4, "9", "700")):
+            entry = _entry(f"2026-01-0{day} 12:00:00", reviews, rank)
+            entry["rankings"].append({"rank": "7", "category": "Memoirs"})
+            amazon.append_entry("b", entry)
+        self.books = analytics.load_all([{"slug": "a"}, {"slug": "b"}])
+
+    def test_columns_intern_categories_across_books(self):
+        a, b = self.books
+        ids = self.analytics.CATEGORIES.ids
+        self.assertEqual(a.categories(), {ids["Books"]})
+        self.assertEqual(b.categories(), {ids["Books"], ids["Memoirs"]})
+        self.assertEqual(self.analytics.category_overlap(self.books), [[1, 1], [1, 2]])
+        times, ranks = b.column("rank:Memoirs")
+        self.assertEqual((len(times), list(ranks)), (3, [7.0, 7.0, 7.0]))
+
+    def test_resample_velocity_percentiles(self):
+        frame = self.analytics.resample(self.books, "amazon_review_count")
+        rows = _rows(frame.values)
+        # As-of end of each day, carried forward; NaN before the first entry.
+        self.assertEqual(rows[0], [10, 12, 12, 20])
+        self.assertEqual(rows[1][1:], [5, 6, 9])
+        self.assertTrue(math.isnan(rows[1][0]))
+        self.assertEqual(_rows(self.analytics.velocity(frame))[0][1:], [2, 0, 8])
+        p50 = _rows(self.analytics.percentiles(frame, [50]))[0]
+        self.assertEqual(p50, [10, 8.5, 9, 14.5])
+        corr = _rows(self.analytics.correlation(
+            self.analytics.resample(self.books, "rank:Books"), min_overlap=3))
+        self.assertAlmostEqual(corr[0][1], 0.866, places=3)
+
+    def test_cache_reloads_only_changed_books(self):
+        a, b = self.books
+        self.assertIs(self.analytics.load_book("a"), a)
+        amazon.append_entry("b", _entry("2026-01-05 12:00:00", "11"))
+        self.assertIs(self.analytics.load_book("a"), a)
+        reloaded = self.analytics.load_book("b")
+        self.assertIsNot(reloaded, b)
+        self.assertEqual(len(reloaded), 4)
+
+
+try:
+    import numpy  # noqa: F401
+    HAVE_NUMPY = True
+except ImportError:
+    HAVE_NUMPY = False
+
+
+@unittest.skipUnless(HAVE_NUMPY, "numpy not installed")
+class TestAnalyticsNumpy(TestAnalytics):
+    numpy = True
+
+
+class TestBench(unittest.TestCase):
+    def test_mock_server_pages_extract_and_block(self):
+        import urllib.request
+        import bench
+        with bench.MockServer(page_kb=4) as server:
+            page = urllib.request.urlopen(server.amazon_url(1)).read()
+            gr = urllib.request.urlopen(server.goodreads_url(1)).read()
+            server.captcha_rate = 1.0
+            captcha = urllib.request.urlopen(server.amazon_url(2)).read()
+        self.assertEqual(amazon.fast_extract_amazon(page), amazon.extract_amazon(page, mode="dom"))
+        self.assertEqual([r["category"] for r in amazon.fast_extract_amazon(page)["rankings"]],
+                         list(bench.CATEGORIES))
+        self.assertIsNotNone(amazon.extract_goodreads(gr)["goodreads_ratings_count"])
+        self.assertTrue(amazon.is_blocked(_response(200, captcha)))
+
+    def test_synthetic_history_entries_all_differ(self):
+        import bench
+        entries = list(bench.synthetic_history(500))
+        sigs = [amazon.entry_signature(e, True) for e in entries]
+        self.assertTrue(all(a != b for a, b in zip(sigs, sigs[1:])))
+        self.assertEqual(entries, sorted(entries, key=lambda e: e["timestamp"]))
+
+
+class TestStreamingMigration(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+
+    def _legacy(self, name, entries, **extra):
+        path = self.dir / name
+        path.write_text(json.dumps({"note": {"v": 1}, "entries": entries, **extra}, indent=2))
+        return path
+
+    def _entries(self):
+        ranks = [{"category": "Books", "rank": 10}]
+        return [
+            {"timestamp": "2026-01-01T00:00:00", "review_count": "3", "rankings": ranks},
+            {"timestamp": "2026-01-01T01:00:00", "amazon_review_count": "3", "rankings": ranks},
+            {"timestamp": "2026-01-01T02:00:00", "amazon_review_count": 3, "rankings": []},
+            {"timestamp": "2026-01-01T03:00:00", "amazon_review_count": "4",
+             "rankings": [{"category": "Books", "rank": 9}, {"category": "Ünicode", "rank": 1}]},
+        ]
+
+    def test_stream_reads_entries_across_chunk_boundaries(self):
+        import migrate_history
+        entries = self._entries() * 50
+        path = self._legacy("in.json", entries, tail=12345)
+        top = {}
+        with mock.patch.object(migrate_history, "READ_CHUNK", 7), open(path, "rb") as f:
+            stream = migrate_history.JsonStream(f)
+            got = list(migrate_history.iter_legacy_entries(stream, top))
+            stream.drain()
+        self.assertEqual(got, entries)
+        self.assertEqual(top, {"note": {"v": 1}, "tail": 12345})
+        self.assertEqual(stream.sha.hexdigest(), hashlib.sha256(path.read_bytes()).hexdigest())
+
+    def test_stream_reads_numbers_split_one_byte_at_a_time(self):
+        import migrate_history
+        path = self._legacy("in.json", self._entries(), last=3.14159, scale=-1e-05)
+        top = {}
+        with mock.patch.object(migrate_history, "READ_CHUNK", 1), open(path, "rb") as f:
+            stream = migrate_history.JsonStream(f)
+            got = list(migrate_history.iter_legacy_entries(stream, top))
+        self.assertEqual(got, self._entries())
+        self.assertEqual(top, {"note": {"v": 1}, "last": 3.14159, "scale": -1e-05})
+
+    def test_migrate_single_pass_matches_legacy_envelope(self):
+        import migrate_history
+        src = self._legacy("in.json", self._entries())
+        out = self.dir / "out" / "book.json"
+        lines = []
+        code = migrate_history.migrate(src, out, "book", "Böok", commit=True, min_entries=1,
+                                       max_entries=10, out=lambda t, err=False: lines.append(t))
+        self.assertEqual(code, 0, "\n".join(lines))
+        env = json.loads(out.read_text())
+        self.assertEqual(env["slug"], "book")
+        self.assertEqual([e["timestamp"] for e in env["entries"]],
+                         ["2026-01-01T00:00:00", "2026-01-01T03:00:00"])
+        self.assertEqual(env["entries"][0]["amazon_review_count"], "3")
+        self.assertEqual(env["last_successful_scrape"], "2026-01-01T03:00:00")
+        report = json.loads((out.parent / "migration_report.json").read_text())
+        self.assertEqual((report["dropped_empty"], report["collapsed_duplicates"]), (1, 1))
+        self.assertIn("Invariants: 8 passed, 0 failed", lines)
+        # The output is an envelope now; a second run must refuse and leave it alone.
+        before = out.read_text()
+        self.assertEqual(migrate_history.migrate(out, out, "book", "x", commit=True, min_entries=1,
+                                                 out=lambda t, err=False: None), 1)
+        self.assertEqual(out.read_text(), before)
+
+    def test_sanity_failure_leaves_no_output(self):
+        import migrate_history
+        src = self._legacy("in.json", self._entries())
+        out = self.dir / "book.json"
+        code = migrate_history.migrate(src, out, "book", "Book", commit=True,
+                                       out=lambda t, err=False: None)
+        self.assertEqual(code, 1)
+        self.assertEqual(list(self.dir.iterdir()), [src])
+
+    def test_batch_writes_one_report_per_job(self):
+        import migrate_history
+        jobs = [{"input": str(self._legacy(f"in{i}.json", self._entries())),
+                 "output": str(self.dir / f"book-{i}.json"), "slug": f"book-{i}"}
+                for i in range(3)]
+        with mock.patch("builtins.print"):
+            code = migrate_history.run_batch(jobs, True, 2, 1, 10)
+        self.assertEqual(code, 0)
+        for i in range(3):
+            self.assertEqual(len(json.loads((self.dir / f"book-{i}.json").read_text())["entries"]), 2)
+            report = json.loads((self.dir / f"book-{i}.migration_report.json").read_text())
+            self.assertEqual(report["slug"], f"book-{i}")
+
 
 if __name__ == "__main__":
     unittest.main()